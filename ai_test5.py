@@ -3,13 +3,48 @@ import numpy as np
 import re
 import pickle
 import os
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import log_loss
 from sklearn.pipeline import Pipeline
+from compiled_scorer import CompiledScorer
+from candidate_index import CandidateIndex, DEFAULT_DEPTH
+import brain_artifact
+import brain_delta
+import lite_brain
+from autocomplete import AutocompleteIndex
+from typo_correction import TypoCorrector
 
 # --- CONFIGURATION ---
 DATASET_FILE = "dataset_train5.csv"
 MODEL_FILE = "djezzy_ai_brain5.pkl"
+MMAP_MODEL_DIR = "djezzy_ai_brain5.mmap"  # Output of --format mmap (shared across gunicorn workers)
+RETRIEVAL_DEPTH = DEFAULT_DEPTH  # Candidates kept by the char n-gram index before re-ranking
+
+# Streaming training (--streaming): memory is bounded by these, not by the dataset size
+HASH_FEATURES = 2 ** 20      # Fixed feature space for hashed 1-3 grams
+CHUNK_ROWS = 50_000          # CSV rows read at a time
+SHUFFLE_BUFFER = 100_000     # Rows mixed together before each partial_fit
+STREAM_EPOCHS = 5
+CHECKPOINT_EVERY = 20        # Chunks between checkpoints
+CHECKPOINT_FILE = "djezzy_ai_brain5.ckpt"
+
+# Adding products to a trained brain (--add-products)
+SCRAPE_FILE = "scraping5.json"
+DELTA_EPOCHS = 5             # partial_fit passes over the new rows
+DELTA_ETA0 = 0.003           # Small constant step: the 'optimal' schedule is still ~0.15 and reshuffles old rankings
+REHEARSAL_ROWS = 2000        # Old training rows mixed in so existing products are not forgotten
+DRIFT_TOP_K = 5
+DRIFT_TIE = 0.02             # Swaps between products scored closer than this do not count as drift
+
+# Queries the demo prints; also the drift check for incremental updates
+DEMO_QUERIES = [
+    "tablette",
+    "wifi d-link", 
+    "telephone zte",
+    "kitman hoco", # Should find earphones
+    "modem 4g"
+]
 
 # --- 1. THE BRAIN: SYNONYM MAPPING (STRICTLY HARDWARE) ---
 # Removed: legend, storm, flexy, puce, net (User requirement: No internet offers)
@@ -62,10 +97,41 @@ def preprocess_query(query):
             
     return " ".join(expanded)
 
+def build_features(df):
+    """Format: "QUERY | PRODUCT INFO" (same text at training and search time)."""
+    return df['user_query'].apply(preprocess_query) + " | " + \
+           df['product_name'].fillna('') + " " + \
+           df['category'].fillna('') + " " + \
+           df['description'].fillna('') + " " + \
+           df['price'].astype(str)
+
+def build_product_db(df):
+    """Unique products of a training set, with the text they are searched by."""
+    product_db = df[['product_id', 'product_name', 'category', 'description', 'price']].drop_duplicates(subset=['product_id']).copy()
+    product_db['search_text'] = product_db['product_name'].fillna('') + " " + \
+                                product_db['category'].fillna('') + " " + \
+                                product_db['description'].fillna('') + " " + \
+                                product_db['price'].astype(str)
+    return product_db
+
+def ranking_drift(before, after, k=DRIFT_TOP_K, tie=DRIFT_TIE):
+    """Pairs (a, b) among the top-k products (before or after) that swapped order by more than `tie`.
+    
+    Only products present in both snapshots are compared, so new and changed
+    products can be left out by dropping them from `after`.
+    """
+    common = before.index.intersection(after.index)
+    before, after = before[common], after[common]
+    top = set(before.nlargest(k).index) | set(after.nlargest(k).index)
+    return [(a, b) for a in top for b in top if before[a] > before[b] + tie and after[a] <= after[b]]
+
 # --- 2. THE AI ENGINE CLASS ---
 class DjezzySearchAI:
-    def __init__(self):
+    def __init__(self, retrieval_depth=RETRIEVAL_DEPTH):
         self.product_db = None
+        self.scorer = None
+        self.retriever = None
+        self.retrieval_depth = retrieval_depth
         # The 'Brain' (Pipeline)
         # Using SGDClassifier (Logistic Regression) for fast, efficient text classification
         self.pipeline = Pipeline([
@@ -82,12 +148,7 @@ class DjezzySearchAI:
             return
 
         # Create features: We combine Query + Product Info to learn the match pattern
-        # Format: "QUERY | PRODUCT INFO"
-        df['features'] = df['user_query'].apply(preprocess_query) + " | " + \
-                         df['product_name'].fillna('') + " " + \
-                         df['category'].fillna('') + " " + \
-                         df['description'].fillna('') + " " + \
-                         df['price'].astype(str)
+        df['features'] = build_features(df)
         
         X = df['features']
         y = df['relevance_label']
@@ -97,25 +158,206 @@ class DjezzySearchAI:
         
         # Prepare the searchable database 
         # We drop duplicates to have a clean list of unique products to search against later
-        self.product_db = df[['product_id', 'product_name', 'category', 'description', 'price']].drop_duplicates(subset=['product_id']).copy()
-        
-        # Pre-compute the search text for the inference phase
-        self.product_db['search_text'] = self.product_db['product_name'].fillna('') + " " + \
-                                         self.product_db['category'].fillna('') + " " + \
-                                         self.product_db['description'].fillna('') + " " + \
-                                         self.product_db['price'].astype(str)
+        self.product_db = build_product_db(df)
+        self.compile_scorer()
+        self.build_retriever()
         
         print("[AI] Training Complete.")
 
-    def save_model(self, filename):
-        """Saves the trained pipeline AND the product database to a file."""
+    def train_streaming(self, csv_path, epochs=STREAM_EPOCHS, chunk_rows=CHUNK_ROWS,
+                        buffer_size=SHUFFLE_BUFFER, n_features=HASH_FEATURES,
+                        checkpoint=CHECKPOINT_FILE, resume=False, seed=42):
+        """Out-of-core training: chunked CSV, hashed n-grams, SGD partial_fit with a shuffle buffer.
+        
+        Hashed features need no vocabulary (so no pass over the data before
+        training) and keep the model size fixed. There is no IDF weighting in this
+        mode: it would need its own full pass over the data.
+        """
+        if not os.path.exists(csv_path):
+            print(f"[ERROR] Dataset '{csv_path}' not found. Make sure it is in the same folder.")
+            return
+
+        hasher = HashingVectorizer(analyzer='word', ngram_range=(1, 3), n_features=n_features,
+                                   alternate_sign=False, norm='l2')
+        config = {"csv": os.path.abspath(csv_path), "n_features": n_features, "chunk_rows": chunk_rows,
+                  "buffer_size": buffer_size, "seed": seed}
+        state = {
+            "clf": SGDClassifier(loss='log_loss', penalty='l2', alpha=1e-4, random_state=seed),
+            "epoch": 0, "chunks_done": 0, "buffer": [], "products": {},
+            "rng": np.random.RandomState(seed), "rows_seen": 0, "config": config,
+        }
+        if resume and checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint, 'rb') as f:
+                saved = pickle.load(f)
+            if saved["config"] != config:
+                print(f"[ERROR] Checkpoint '{checkpoint}' was made with different settings, not resuming.")
+                return
+            state = saved
+            print(f"[AI] Resuming from '{checkpoint}': epoch {state['epoch'] + 1}, chunk {state['chunks_done']}")
+
+        def fit(batch, epoch_loss):
+            texts = [text for text, _ in batch]
+            labels = np.array([label for _, label in batch])
+            X = hasher.transform(texts)
+            clf = state["clf"]
+            if hasattr(clf, "coef_"):
+                # Progressive validation: score each batch before learning from it
+                epoch_loss.append((log_loss(labels, clf.predict_proba(X)[:, 1], labels=[0, 1]), len(batch)))
+            clf.partial_fit(X, labels, classes=np.array([0, 1]))
+            state["rows_seen"] += len(batch)
+
+        def save_checkpoint():
+            if not checkpoint:
+                return
+            tmp = checkpoint + ".tmp"
+            with open(tmp, 'wb') as f:
+                pickle.dump(state, f)
+            os.replace(tmp, checkpoint)  # Never leaves a half-written checkpoint behind
+
+        while state["epoch"] < epochs:
+            epoch_loss = []
+            skip = state["chunks_done"] * chunk_rows
+            reader = pd.read_csv(csv_path, chunksize=chunk_rows, skiprows=range(1, skip + 1) if skip else None)
+            for chunk in reader:
+                if state["epoch"] == 0:
+                    for row in build_product_db(chunk).to_dict('records'):
+                        state["products"].setdefault(row['product_id'], row)
+                state["buffer"].extend(zip(build_features(chunk).tolist(), chunk['relevance_label'].tolist()))
+                while len(state["buffer"]) >= buffer_size:
+                    # Train on a random half, keep the rest to mix with the next chunks
+                    order = state["rng"].permutation(len(state["buffer"]))
+                    shuffled = [state["buffer"][i] for i in order]
+                    half = max(1, buffer_size // 2)
+                    fit(shuffled[:half], epoch_loss)
+                    state["buffer"] = shuffled[half:]
+                state["chunks_done"] += 1
+                if state["chunks_done"] % CHECKPOINT_EVERY == 0:
+                    save_checkpoint()
+
+            if state["buffer"]:
+                order = state["rng"].permutation(len(state["buffer"]))
+                shuffled = [state["buffer"][i] for i in order]
+                step = max(1, buffer_size // 2)
+                for start in range(0, len(shuffled), step):
+                    fit(shuffled[start:start + step], epoch_loss)
+                state["buffer"] = []
+            state["epoch"] += 1
+            state["chunks_done"] = 0
+            save_checkpoint()
+            rows = sum(n for _, n in epoch_loss)
+            loss = sum(l * n for l, n in epoch_loss) / rows if rows else float('nan')
+            print(f"[AI] Epoch {state['epoch']}/{epochs}: progressive log loss {loss:.4f} "
+                  f"({state['rows_seen']} rows seen)")
+
+        self.pipeline = Pipeline([('hash', hasher), ('clf', state["clf"])])
+        self.product_db = pd.DataFrame(list(state["products"].values()))
+        self.compile_scorer()
+        self.build_retriever()
+        print(f"[AI] Streaming Training Complete ({len(self.product_db)} products).")
+
+    def load_model(self, filename):
+        """Loads a saved brain (and its delta file, if any)."""
+        try:
+            package = brain_delta.load_package(filename)
+        except FileNotFoundError:
+            print(f"[ERROR] Model '{filename}' not found. Train first.")
+            return False
+        self.pipeline = package['pipeline']
+        self.product_db = package['database']
+        self.compile_scorer()
+        self.build_retriever()
+        return True
+
+    def ranking_snapshot(self, queries=DEMO_QUERIES):
+        """{query: pd.Series of scores indexed by product_id}, for ranking_drift."""
+        ids = self.product_db['product_id'].to_numpy()
+        return {q: pd.Series(self.score(preprocess_query(q)), index=ids) for q in queries}
+
+    def add_products(self, scrape_file=SCRAPE_FILE, dataset_file=DATASET_FILE, epochs=DELTA_EPOCHS,
+                     eta0=DELTA_ETA0, rehearsal_rows=REHEARSAL_ROWS, seed=42):
+        """Brings a loaded brain up to date with a scrape: partial_fit on rows for new products only.
+        
+        Products are matched on their normalized name, so brains trained before
+        IDs became stable are handled too. Returns the removed ids, the new or
+        changed product_db rows and a report.
+        """
+        import json
+        import random
+        import time
+        import createdata5
+        from catalog_diff import refresh_product_db, search_text
+        start = time.perf_counter()
+
+        with open(scrape_file, 'r', encoding='utf-8') as f:
+            products = createdata5.load_products(json.load(f))
+        by_key = {p['key']: p for p in products}
+        db_keys = self.product_db['product_name'].fillna('').str.lower().str.replace(" ", "")
+        known = dict(zip(db_keys, self.product_db['product_id']))
+        prices = dict(zip(db_keys, self.product_db['price']))
+
+        added = [p for p in products if p['key'] not in known]
+        removed_ids = [pid for key, pid in known.items() if key not in by_key]
+        repriced = [(known[p['key']], p) for p in products if p['key'] in known and prices[p['key']] != p['price']]
+
+        # Training rows for the new products only (+ a sample of old rows as rehearsal)
+        base_rows = max(10, createdata5.TARGET_DATASET_SIZE // len(products))
+        rows = [row for p in added
+                for row in createdata5.product_rows(p, products, base_rows, random.Random(f"{seed}:{p['id']}"))]
+        fresh = pd.DataFrame(rows, columns=createdata5.HEADERS)
+        if rehearsal_rows and os.path.exists(dataset_file) and len(fresh):
+            old = pd.read_csv(dataset_file)
+            fresh = pd.concat([fresh, old.sample(min(rehearsal_rows, len(old)), random_state=seed)])
+
+        if len(fresh):
+            X = self.pipeline[:-1].transform(build_features(fresh))
+            y = fresh['relevance_label'].to_numpy()
+            clf = self.pipeline[-1]
+            schedule = clf.get_params()
+            clf.set_params(learning_rate='constant', eta0=eta0)
+            rng = np.random.RandomState(seed)
+            for _ in range(epochs):
+                order = rng.permutation(len(y))
+                clf.partial_fit(X[order], y[order])
+            clf.set_params(learning_rate=schedule['learning_rate'], eta0=schedule['eta0'])
+
+        # product_db: drop gone products, patch prices, append the new ones
+        new_ids = [p['id'] for p in added]
+        diff = {"added": new_ids, "removed": removed_ids, "renamed": [],
+                "price_changed": [pid for pid, _ in repriced]}
+        catalog = {p['id']: p for p in added}
+        catalog.update({pid: p for pid, p in repriced})
+        self.product_db = refresh_product_db(self.product_db, diff, catalog)
+        self.compile_scorer()
+        self.build_retriever()
+
+        upserts = self.product_db[self.product_db['product_id'].isin(new_ids + diff["price_changed"])]
+        report = {"added": len(added), "removed": len(removed_ids), "repriced": len(repriced),
+                  "training_rows": len(fresh), "seconds": time.perf_counter() - start}
+        return removed_ids, upserts, report
+
+    def save_model(self, filename, fmt="pickle"):
+        """Saves the trained pipeline AND the product database ('pickle' file or 'mmap' directory)."""
         if self.product_db is None:
             print("[ERROR] Cannot save: Model is not trained yet.")
             return
+
+        # Keyword completions for /complete and the query typo dictionary, precompiled from the catalog
+        autocomplete = AutocompleteIndex.build(self.product_db, SYNONYMS).state()
+        typos = TypoCorrector.build(self.product_db, SYNONYMS).state()
+        if fmt == "mmap":
+            try:
+                brain_artifact.save_brain(filename, self.pipeline, self.product_db, self.scorer,
+                                          {"autocomplete": autocomplete, "typos": typos})
+                print(f"[SUCCESS] Model saved to '{filename}' (mmap)")
+            except Exception as e:
+                print(f"[ERROR] Failed to save model: {e}")
+            return
             
         model_package = {
             'pipeline': self.pipeline,
-            'database': self.product_db
+            'database': self.product_db,
+            'autocomplete': autocomplete,
+            'typo_correction': typos
         }
         
         try:
@@ -125,6 +367,46 @@ class DjezzySearchAI:
         except Exception as e:
             print(f"[ERROR] Failed to save model: {e}")
 
+    def export_lite(self, base_file=MODEL_FILE):
+        """Writes the sklearn-free .lite.npz for the POS next to base_file (see lite_brain.py)."""
+        try:
+            path = lite_brain.export_lite(lite_brain.lite_path(base_file), self.pipeline, self.product_db,
+                                          SYNONYMS, brain_delta.brain_version(base_file), self.scorer)
+            print(f"[SUCCESS] Lite runtime exported to '{path}'")
+            return path
+        except ValueError as e:
+            print(f"[ERROR] Lite export not possible for this brain: {e}")
+
+    def compile_scorer(self):
+        """Precomputes product features so each query is vectorized only once."""
+        try:
+            self.scorer = CompiledScorer.from_pipeline(self.pipeline, self.product_db['search_text'])
+        except ValueError as e:
+            self.scorer = None
+            print(f"[AI] Compiled scorer unavailable, using full pipeline: {e}")
+
+    def build_retriever(self):
+        """Character n-gram index that shortlists candidates for the re-ranker."""
+        prior = self.scorer.predict_proba("") if self.scorer is not None else None
+        self.retriever = CandidateIndex.from_database(self.product_db, prior)
+
+    def score(self, clean_query):
+        """Match probability for every product in product_db order."""
+        rows = self.retriever.candidates(clean_query, self.retrieval_depth) if self.retriever else None
+        if self.scorer is not None:
+            probs = self.scorer.predict_proba(clean_query, rows)
+        else:
+            texts = self.product_db['search_text']
+            if rows is not None:
+                texts = texts.iloc[rows]
+            probs = self.pipeline.predict_proba(clean_query + " | " + texts)[:, 1]
+        if rows is None:
+            return probs
+        # Products outside the shortlist are never relevant
+        full = np.zeros(len(self.product_db))
+        full[rows] = probs
+        return full
+
     def search(self, user_query, top_k=5):
         """Test function to verify the model works immediately after training."""
         if self.product_db is None:
@@ -134,39 +416,115 @@ class DjezzySearchAI:
         clean_query = preprocess_query(user_query)
         
         candidates = self.product_db.copy()
-        candidate_features = clean_query + " | " + candidates['search_text']
         
         # Predict probability (0 to 1)
-        probs = self.pipeline.predict_proba(candidate_features)[:, 1]
-        candidates['ai_score'] = probs
+        candidates['ai_score'] = self.score(clean_query)
         
         final_results = candidates.sort_values(by='ai_score', ascending=False).head(top_k)
         return final_results[['product_name', 'price', 'ai_score', 'description']]
 
+    def search_many(self, user_queries, top_k=5):
+        """Batch version of search(): every query is scored in one vectorized call."""
+        if self.product_db is None:
+            print("[ERROR] Model not ready.")
+            return [pd.DataFrame() for _ in user_queries]
+
+        clean_queries = [preprocess_query(q) for q in user_queries]
+        if self.scorer is not None:
+            matrix = self.scorer.predict_proba_many(clean_queries)
+        else:
+            features = [q + " | " + t for q in clean_queries for t in self.product_db['search_text']]
+            matrix = self.pipeline.predict_proba(features)[:, 1].reshape(len(clean_queries), -1)
+
+        results = []
+        for clean_query, probs in zip(clean_queries, matrix):
+            rows = self.retriever.candidates(clean_query, self.retrieval_depth) if self.retriever else None
+            if rows is not None:
+                shortlist = np.zeros_like(probs)
+                shortlist[rows] = probs[rows]
+                probs = shortlist
+            candidates = self.product_db.copy()
+            candidates['ai_score'] = probs
+            final_results = candidates.sort_values(by='ai_score', ascending=False).head(top_k)
+            results.append(final_results[['product_name', 'price', 'ai_score', 'description']])
+        return results
+
 # --- 3. MAIN EXECUTION ---
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the Djibly v5 search brain")
+    parser.add_argument("--format", choices=["pickle", "mmap"], default="pickle",
+                        help="pickle: djezzy_ai_brain5.pkl, mmap: memory-mapped djezzy_ai_brain5.mmap/")
+    parser.add_argument("--dataset", default=DATASET_FILE)
+    parser.add_argument("--streaming", action="store_true",
+                        help="Out-of-core training with hashed features (for datasets that do not fit in memory)")
+    parser.add_argument("--epochs", type=int, default=STREAM_EPOCHS)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--hash-features", type=int, default=HASH_FEATURES)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--resume", action="store_true", help="Continue from --checkpoint")
+    parser.add_argument("--add-products", action="store_true",
+                        help="Update the saved brain with new products from the scrape (writes a delta file)")
+    parser.add_argument("--scrape", default=SCRAPE_FILE)
+    parser.add_argument("--force", action="store_true", help="Save the delta even if the drift check fails")
+    parser.add_argument("--export-lite", action="store_true",
+                        help="Only write the sklearn-free djezzy_ai_brain5.lite.npz for the saved brain")
+    args = parser.parse_args()
+
     engine = DjezzySearchAI()
+
+    if args.export_lite:
+        if not engine.load_model(MODEL_FILE) or not engine.export_lite(MODEL_FILE):
+            raise SystemExit(1)
+        raise SystemExit(0)
+    
+    if args.add_products:
+        import time
+        start = time.perf_counter()
+        if not engine.load_model(MODEL_FILE):
+            raise SystemExit(1)
+        before = engine.ranking_snapshot()
+        _, upserts, report = engine.add_products(args.scrape, args.dataset)
+        print(f"[AI] {report['added']} added, {report['removed']} removed, {report['repriced']} re-priced; "
+              f"partial_fit on {report['training_rows']} rows in {report['seconds']:.2f}s")
+
+        # Drift check: the demo queries must rank the untouched products the same way
+        touched = set(upserts['product_id'])
+        after = {q: s[~s.index.isin(touched)] for q, s in engine.ranking_snapshot().items()}
+        drifted = []
+        for q in DEMO_QUERIES:
+            swaps = ranking_drift(before[q], after[q])
+            if swaps:
+                drifted.append(q)
+            print(f"   [DRIFT] '{q}': top-{DRIFT_TOP_K} " + (f"CHANGED ({len(swaps)} swapped pairs)" if swaps else "same"))
+        if drifted and not args.force:
+            print(f"[ERROR] {len(drifted)} demo queries rank differently; delta not saved (use --force).")
+            raise SystemExit(1)
+        report["drifted_queries"] = drifted
+        path = brain_delta.save_delta(MODEL_FILE, engine.pipeline[-1], engine.product_db, report)
+        print(f"[SUCCESS] Delta saved to '{path}' ({time.perf_counter() - start:.2f}s end to end)")
+        engine.export_lite(MODEL_FILE)
+        raise SystemExit(0)
     
     # Train with your specific file
-    engine.train(DATASET_FILE)
-    engine.save_model(MODEL_FILE)
+    if args.streaming:
+        engine.train_streaming(args.dataset, epochs=args.epochs, chunk_rows=args.chunk_rows,
+                               n_features=args.hash_features, checkpoint=args.checkpoint, resume=args.resume)
+    else:
+        engine.train(args.dataset)
+    engine.save_model(MODEL_FILE if args.format == "pickle" else MMAP_MODEL_DIR, fmt=args.format)
+    if args.format == "pickle":
+        engine.export_lite(MODEL_FILE)  # Keep the POS runtime in step with the new brain
     
     # --- DEMO ---
-    test_queries = [
-        "tablette",
-        "wifi d-link", 
-        "telephone zte",
-        "kitman hoco", # Should find earphones
-        "modem 4g"
-    ]
+    test_queries = DEMO_QUERIES
     
     print("\n" + "="*50)
     print("   DJIBLY INTELLIGENT SEARCH DEMO   ")
     print("="*50)
 
-    for q in test_queries:
+    for q, results in zip(test_queries, engine.search_many(test_queries)):
         print(f"\n>> User Search: '{q}'")
-        results = engine.search(q)
         
         if not results.empty:
             for i, row in results.iterrows():
@@ -1,20 +1,64 @@
 import os
 import re
+import hmac
 import json
+import time
 import pickle
-import pandas as pd
-from flask import Flask, render_template, request, jsonify
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import SGDClassifier
-from sklearn.pipeline import Pipeline
+import signal
+import threading
+import numpy as np
+from flask import Flask, Response, render_template, request, jsonify, g
+from compiled_scorer import CompiledScorer
+from candidate_index import CandidateIndex, DEFAULT_DEPTH
+from product_store import ProductStore, PLACEHOLDER_IMAGE
+from result_cache import ResultCache, cache_from_env, model_version
+from brain_artifact import is_mmap_brain, load_brain, load_index_state
+from brain_delta import load_package, brain_version, delta_path
+from lite_brain import LiteBrain, is_lite_brain
+from category_router import CategoryRouter, router_path
+from sharded_scorer import ShardedScorer, ShardFailure, CHUNK_SIZE
+from suggest import Suggester, SUGGEST_TOP_K
+from autocomplete import load_autocomplete, DEFAULT_COMPLETIONS
+from typo_correction import load_typo_corrector
+from image_cache import ImageCache, manifest_path
+from singleflight import SingleFlight
+from search_metrics import metrics, NULL_TIMER
 
 app = Flask(__name__)
 
 # ==========================================
 # 1. CONFIGURATION & LOGIC
 # ==========================================
-MODEL_FILE = "djezzy_ai_brain5.pkl"
-JSON_FILE = "scraping5.json"
+# The pickle brain, an mmap brain directory written by `ai_test5.py --format mmap`, or the
+# sklearn-free djezzy_ai_brain5.lite.npz (neither sklearn nor pandas is imported; no category routing)
+MODEL_FILE = os.environ.get("DJIBLY_MODEL", "djezzy_ai_brain5.pkl")
+JSON_FILE = os.environ.get("DJIBLY_IMAGES", "scraping5.json")
+# Thumbnails written by `python image_cache.py`, served from /img/<hash> in place of the scraped URLs
+IMAGE_CACHE_DIR = os.environ.get("DJIBLY_IMAGE_CACHE", "image_cache5")
+# How many char-n-gram candidates go to the re-ranker (full scan for smaller catalogs)
+RETRIEVAL_DEPTH = int(os.environ.get("DJIBLY_RETRIEVAL_DEPTH", DEFAULT_DEPTH))
+# Minimum match probability for a result (`tune_brain.py` suggests one from a precision/recall curve)
+SCORE_THRESHOLD = float(os.environ.get("DJIBLY_SCORE_THRESHOLD", 0.35))
+DEFAULT_TOP_K = 20
+# Batch search: hard cap on queries per request, and on query x product scores held at once
+MAX_BATCH_QUERIES = 256
+BATCH_CELL_BUDGET = 2_000_000
+# Hot reload: queries run on a freshly loaded brain before it is swapped in,
+# admin token for /admin/* (unset = /admin/* answers 403), and optional file watching interval (seconds, 0 = off)
+WARMUP_QUERIES = [q.strip() for q in os.environ.get(
+    "DJIBLY_WARMUP_QUERIES", "Modem Wifi,Routeur D-Link,Tablette,Kitman Hoco,ZTE Blade").split(",") if q.strip()]
+# Category pre-filter saved next to the brain by `category_router.py`. Opt-in (1 = on): it changes which
+# products /search shows, see category_router.py
+ROUTING = os.environ.get("DJIBLY_ROUTING", "0") == "1"
+# Sharded scoring: worker processes each scoring a slice of the catalog (0 = score in-process)
+SHARDS = int(os.environ.get("DJIBLY_SHARDS", 0))
+SHARD_CHUNK = int(os.environ.get("DJIBLY_SHARD_CHUNK", CHUNK_SIZE))
+SHARD_RETIRE_DELAY = 30  # Seconds a replaced engine keeps its shards for in-flight requests
+# Misspelled query words are replaced by the closest catalog word before preprocess_query.
+# Opt-in (1 = on): it changes which products a query returns
+TYPO_CORRECTION = os.environ.get("DJIBLY_TYPO_CORRECTION", "0") == "1"
+ADMIN_TOKEN = os.environ.get("DJIBLY_ADMIN_TOKEN")
+WATCH_INTERVAL = float(os.environ.get("DJIBLY_WATCH_INTERVAL", 0))
 
 # Synonyms Dictionary (Same as your training)
 SYNONYMS = {
@@ -42,14 +86,12 @@ def preprocess_query(query):
 # ==========================================
 # 2. IMAGE LOADER (Restores Images from JSON)
 # ==========================================
-image_map = {}
-
-def load_images():
-    """Loads scraping4.json to map product names to images."""
-    global image_map
-    if os.path.exists(JSON_FILE):
+def load_images(json_file=JSON_FILE):
+    """Loads scraping5.json to map product names to images."""
+    images = {}
+    if os.path.exists(json_file):
         try:
-            with open(JSON_FILE, 'r', encoding='utf-8') as f:
+            with open(json_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 for item in data:
                     # Create a normalized key to match CSV products
@@ -59,87 +101,515 @@ def load_images():
                     
                     # Try matching by Description (Model) which is usually unique
                     key_desc = desc.lower().replace(" ", "")
-                    image_map[key_desc] = item.get('image')
+                    images[key_desc] = item.get('image')
                     
                     # Also map Full Name just in case
                     full_name = f"{title} {desc}".lower().replace(" ", "")
-                    image_map[full_name] = item.get('image')
-            print(f"Loaded {len(image_map)} images from JSON.")
+                    images[full_name] = item.get('image')
+            print(f"Loaded {len(images)} images from JSON.")
         except Exception as e:
             print(f"Error loading JSON images: {e}")
+    return images
 
 # ==========================================
 # 3. AI ENGINE CLASS
 # ==========================================
 class DjezzySearchAI:
-    def __init__(self):
+    def __init__(self, model_file=MODEL_FILE, images=None, images_version=None,
+                 retrieval_depth=RETRIEVAL_DEPTH, cache=None, image_cache=None):
         self.product_db = None
+        self.store = None
         self.pipeline = None
-        self.load_model(MODEL_FILE)
+        self.scorer = None
+        self.retriever = None
+        self.router = None
+        self.sharded = None
+        self._shards_lock = threading.Lock()
+        self.suggester = None
+        self.autocomplete = None
+        self.typos = None
+        self.retrieval_depth = retrieval_depth
+        self.cache = cache
+        self.flight = SingleFlight()
+        self.images = images if images is not None else {}
+        self.images_version = images_version
+        self.image_cache = image_cache if image_cache is not None else ImageCache(None)
+        self.model_version = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self.load_model(model_file)
 
     def load_model(self, filename):
+        start = time.perf_counter()
         try:
-            if os.path.exists(filename):
-                with open(filename, 'rb') as f:
-                    model_package = pickle.load(f)
+            if is_mmap_brain(filename):
+                # Shared, read-only pages: no pipeline, the scorer comes precompiled
+                self.scorer, self.product_db = load_brain(filename)
+                self.pipeline = None
+                autocomplete, typos = load_index_state(filename, "autocomplete"), load_index_state(filename, "typos")
+            elif is_lite_brain(filename):
+                lite = LiteBrain(filename, self.retrieval_depth, TYPO_CORRECTION)
+                self.scorer, self.product_db = lite.scorer, lite.catalog
+                self.pipeline = None
+                autocomplete, typos = lite.autocomplete.state(), lite.typos.state() if lite.typos is not None else None
+            elif os.path.exists(filename):
+                model_package = load_package(filename)  # Includes `ai_test5.py --add-products` deltas
                 self.pipeline = model_package['pipeline']
                 self.product_db = model_package['database']
-                print("AI Model Loaded Successfully.")
+                self.compile_scorer()
+                # Both None after a delta: the catalog changed
+                autocomplete, typos = model_package.get('autocomplete'), model_package.get('typo_correction')
             else:
                 print("Model file not found. Please train first.")
+                return
+            self.store = ProductStore(self.product_db, self.images, PLACEHOLDER_IMAGE)
+            self.build_retriever()
+            if self.scorer is not None:
+                self.suggester = Suggester(self.scorer, self.product_db['search_text'], self.clean_query,
+                                           SYNONYMS, self.retriever, self.retrieval_depth)
+            self.autocomplete = load_autocomplete(autocomplete, self.product_db, SYNONYMS)
+            if TYPO_CORRECTION:
+                self.typos = load_typo_corrector(typos, self.product_db, SYNONYMS, self.vocabulary())
+            self.model_version = brain_version(filename)
+            self.router = None
+            if ROUTING and os.path.exists(router_path(filename)):
+                self.router = CategoryRouter.load(router_path(filename))
+                self.router.bind(self.store.category)
+                self.model_version += "+" + model_version(router_path(filename))
+            elif ROUTING:
+                print(f"No category router next to '{filename}' (run `python category_router.py`); scoring every category.")
+            if SHARDS > 0:
+                if self.pipeline is None:
+                    print("Sharded scoring needs a pickle brain; scoring in-process.")
+                else:
+                    self.sharded = ShardedScorer(self.pipeline, self.product_db.reset_index(drop=True),
+                                                 SHARDS, SHARD_CHUNK, self.retrieval_depth)
+            if self.cache is not None:
+                # Image URLs are baked into cached results, so the image source is part of the version
+                self.cache.set_version(f"{self.model_version}-{self.images_version or 'none'}")
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - start
+            print("AI Model Loaded Successfully.")
         except Exception as e:
             print(f"Error loading model: {e}")
 
-    def search(self, user_query, top_k=20):
-        if self.product_db is None: return []
+    def compile_scorer(self):
+        """Precomputes product features so a query is vectorized only once."""
+        try:
+            self.scorer = CompiledScorer.from_pipeline(self.pipeline, self.product_db['search_text'])
+        except ValueError as e:
+            self.scorer = None
+            print(f"Compiled scorer unavailable, using full pipeline: {e}")
+
+    def vocabulary(self):
+        """The brain's term -> column mapping, or None when it has none (hashed brains)."""
+        if self.scorer is not None:
+            return self.scorer.vocabulary
+        return getattr(self.pipeline.steps[0][1], "vocabulary_", None) if self.pipeline is not None else None
+
+    def build_retriever(self):
+        """Character n-gram index that shortlists candidates for the re-ranker."""
+        prior = self.scorer.predict_proba("") if self.scorer is not None else None
+        self.retriever = CandidateIndex.from_database(self.product_db, prior)
+
+    def clean_query(self, user_query):
+        """preprocess_query, after typo correction when it is on (see typo_correction.py)."""
+        if self.typos is not None:
+            user_query = self.typos.correct(user_query)
+        return preprocess_query(user_query)
+
+    def score(self, clean_query, timer=NULL_TIMER):
+        """Returns (catalog rows, probabilities); rows is None when every product was scored."""
+        rows = self.retriever.candidates(clean_query, self.retrieval_depth) if self.retriever else None
+        timer.lap("retrieve")
+        if self.router is not None:
+            rows = self.router.restrict(clean_query, rows)
+            timer.lap("route")
+        if self.scorer is not None:
+            query = self.scorer.vectorize(clean_query)
+            timer.lap("vectorize")
+            probs = self.scorer.predict_proba(clean_query, rows, query)
+        else:
+            texts = self.product_db['search_text']
+            if rows is not None:
+                texts = texts.iloc[rows]
+            features = self.pipeline[:-1].transform(clean_query + " | " + texts)
+            timer.lap("vectorize")
+            probs = self.pipeline[-1].predict_proba(features)[:, 1]
+        timer.lap("classify")
+        return rows, probs
+
+    def score_many(self, clean_queries):
+        """(rows, probs) per query; each chunk of the batch is scored in one vectorized call."""
+        n_products = len(self.store)
+        chunk = max(1, BATCH_CELL_BUDGET // max(1, n_products))
+        scored = []
+        for start in range(0, len(clean_queries), chunk):
+            part = clean_queries[start:start + chunk]
+            if self.scorer is not None:
+                matrix = self.scorer.predict_proba_many(part)
+            else:
+                features = [q + " | " + t for q in part for t in self.product_db['search_text']]
+                matrix = self.pipeline.predict_proba(features)[:, 1].reshape(len(part), n_products)
+            for q, probs in zip(part, matrix):
+                rows = self.retriever.candidates(q, self.retrieval_depth) if self.retriever else None
+                if self.router is not None:
+                    rows = self.router.restrict(q, rows)
+                scored.append((rows, probs if rows is None else probs[rows]))
+        return scored
+
+    def search(self, user_query, top_k=DEFAULT_TOP_K, threshold=SCORE_THRESHOLD):
+        if self.store is None: return []
         
-        clean_query = preprocess_query(user_query)
-        candidates = self.product_db.copy()
-        candidate_features = clean_query + " | " + candidates['search_text']
+        timer = metrics.timer()
+        clean_query = self.clean_query(user_query)
+        timer.lap("preprocess")
+        key = ResultCache.make_key(clean_query, top_k, threshold)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            timer.lap("cache_lookup")
+            if cached is not None:
+                metrics.observe_results(len(cached))
+                return cached
         
+        # Identical concurrent searches wait for the first one instead of re-scoring
+        results = self.flight.do(key, self._search_uncached, clean_query, key, top_k, threshold, timer)
+        metrics.observe_results(len(results))
+        return results
+
+    def _shards_failed(self, sharded, error):
+        """A shard process died: log it once and score in-process from now on."""
+        with self._shards_lock:
+            if self.sharded is not sharded:
+                return  # Another request got there first
+            self.sharded = None
+        print(f"[ERROR] Sharded scoring failed, scoring in-process from now on: {error}")
+        sharded.close()
+
+    def _search_uncached(self, clean_query, key, top_k, threshold, timer=NULL_TIMER):
         try:
-            probs = self.pipeline.predict_proba(candidate_features)[:, 1]
-            candidates['ai_score'] = probs
-            
-            # Filter low confidence results
-            results = candidates[candidates['ai_score'] > 0.35].sort_values(by='ai_score', ascending=False).head(top_k)
-            
-            output = []
-            for _, row in results.iterrows():
-                # Try to find the image
-                clean_name_key = row['product_name'].lower().replace(" ", "")
-                img_url = image_map.get(clean_name_key, "https://via.placeholder.com/150?text=No+Image")
-                
-                output.append({
-                    "name": row['product_name'],
-                    "price": row['price'],
-                    "category": row['category'],
-                    "description": row['description'],
-                    "score": round(row['ai_score'] * 100),
-                    "image": img_url
-                })
-            return output
+            results = None
+            sharded = self.sharded
+            if sharded is not None:
+                # Shards shortlist, score and keep their own top_k; only the merge happens here
+                categories = self.router.routed_categories(clean_query) if self.router is not None else None
+                timer.lap("route")
+                try:
+                    rows, probs = sharded.top_k(clean_query, top_k, threshold, categories)
+                    timer.lap("classify")
+                    results = self.store.records(rows, probs)
+                    timer.lap("records")
+                except ShardFailure as e:
+                    self._shards_failed(sharded, e)
+            if results is None:
+                rows, probs = self.score(clean_query, timer)
+
+                # Filter low confidence results, then partial sort for the top_k
+                best = self.store.top_k(probs, top_k, threshold)
+                timer.lap("threshold_sort")
+                # Image URLs were resolved into the store at load time
+                results = self.store.records(best if rows is None else rows[best], probs[best])
+                timer.lap("records")
         except Exception as e:
             print(f"Search error: {e}")
             return []
+        
+        if self.cache is not None:
+            self.cache.put(key, results)
+        return results
+
+    def suggest(self, user_query, top_k=SUGGEST_TOP_K, threshold=SCORE_THRESHOLD):
+        """Results for a query still being typed (see suggest.py); same shape as search()."""
+        if self.store is None: return []
+        if self.suggester is None:
+            return self.search(user_query, top_k, threshold)
+        key = ResultCache.make_key("suggest:" + Suggester.normalize(user_query), top_k, threshold)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        try:
+            rows, probs = self.suggester.score(user_query)
+            best = self.store.top_k(probs, top_k, threshold)
+            results = self.store.records(best if rows is None else rows[best], probs[best])
+        except Exception as e:
+            print(f"Suggest error: {e}")
+            return []
+        if self.cache is not None:
+            self.cache.put(key, results)
+        return results
+
+    def complete(self, text, n=DEFAULT_COMPLETIONS):
+        """Catalog keyword completions of text, most popular first (see autocomplete.py)."""
+        if self.autocomplete is None: return []
+        return self.autocomplete.complete(text, n)
+
+    def search_many(self, user_queries, top_k=DEFAULT_TOP_K, threshold=SCORE_THRESHOLD):
+        """Batch version of search(); top_k and threshold may also be per-query lists."""
+        n = len(user_queries)
+        if self.store is None: return [[] for _ in range(n)]
+        
+        top_ks = top_k if isinstance(top_k, (list, tuple)) else [top_k] * n
+        thresholds = threshold if isinstance(threshold, (list, tuple)) else [threshold] * n
+        clean_queries = [self.clean_query(q) for q in user_queries]
+        keys = [ResultCache.make_key(q, k, t) for q, k, t in zip(clean_queries, top_ks, thresholds)]
+        
+        results = [None] * n
+        if self.cache is not None:
+            results = [self.cache.get(key) for key in keys]
+        missing = [i for i in range(n) if results[i] is None]
+        
+        if missing:
+            try:
+                top = None
+                sharded = self.sharded
+                if sharded is not None:
+                    queries = [clean_queries[i] for i in missing]
+                    categories = [self.router.routed_categories(q) for q in queries] if self.router is not None else None
+                    try:
+                        top = sharded.top_k_many(queries, [top_ks[i] for i in missing],
+                                                 [thresholds[i] for i in missing], categories)
+                    except ShardFailure as e:
+                        self._shards_failed(sharded, e)
+                if top is not None:
+                    for i, (rows, probs) in zip(missing, top):
+                        results[i] = self.store.records(rows, probs)
+                else:
+                    scored = self.score_many([clean_queries[i] for i in missing])
+                    for i, (rows, probs) in zip(missing, scored):
+                        best = self.store.top_k(probs, top_ks[i], thresholds[i])
+                        results[i] = self.store.records(best if rows is None else rows[best], probs[best])
+                if self.cache is not None:
+                    for i in missing:
+                        self.cache.put(keys[i], results[i])
+            except Exception as e:
+                print(f"Batch search error: {e}")
+                return [[] for _ in range(n)]
+        
+        for r in results:
+            metrics.observe_results(len(r))
+        return results
+
+# ==========================================
+# 4. HOT RELOAD (background load, warm-up, atomic swap)
+# ==========================================
+# Handlers read the module-level `ai_engine` once per request, so swapping the
+# reference is atomic: in-flight requests finish on the engine they started with.
+_reload_lock = threading.Lock()
+reload_state = {"reloading": False, "reloads": 0, "last_error": None, "last_reload_at": None}
+
+def build_engine(model_file=MODEL_FILE, json_file=JSON_FILE):
+    """Loads a brain + images into a new engine and warms it up (fills its cache)."""
+    images_version = model_version(json_file) if os.path.exists(json_file) else None
+    image_cache = ImageCache(IMAGE_CACHE_DIR)
+    if image_cache.version is not None:
+        # Re-running the ingestion changes the served URLs, so cached results must not be reused
+        images_version = f"{images_version or 'none'}+{image_cache.version}"
+    engine = DjezzySearchAI(model_file, image_cache.localize(load_images(json_file)), images_version,
+                            cache=cache_from_env(), image_cache=image_cache)
+    if engine.store is None:
+        raise RuntimeError(f"Could not load brain '{model_file}'")
+    for q in WARMUP_QUERIES:
+        engine.search(q)
+    return engine
+
+def reload_brain(model_file=MODEL_FILE, json_file=JSON_FILE):
+    """Builds and warms a new engine, then swaps it in. Returns False if a reload failed or was already running."""
+    global ai_engine
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    reload_state["reloading"] = True
+    try:
+        engine = build_engine(model_file, json_file)
+        previous, ai_engine = ai_engine, engine
+        if previous.sharded is not None:
+            threading.Timer(SHARD_RETIRE_DELAY, previous.sharded.close).start()
+        reload_state["reloads"] += 1
+        reload_state["last_error"] = None
+        reload_state["last_reload_at"] = time.time()
+        print(f"Brain reloaded: version {engine.model_version} in {engine.load_seconds:.2f}s")
+        return True
+    except Exception as e:
+        reload_state["last_error"] = str(e)
+        print(f"Brain reload failed, keeping version {ai_engine.model_version}: {e}")
+        return False
+    finally:
+        reload_state["reloading"] = False
+        _reload_lock.release()
+
+def reload_in_background(model_file=MODEL_FILE, json_file=JSON_FILE):
+    threading.Thread(target=reload_brain, args=(model_file, json_file), daemon=True).start()
+
+def _source_mtimes(model_file=MODEL_FILE, json_file=JSON_FILE):
+    if os.path.isdir(model_file):
+        brains = (os.path.join(model_file, "meta.json"),)
+    else:
+        brains = (model_file, delta_path(model_file))
+    brains += (router_path(model_file),)
+    sources = brains + (json_file, manifest_path(IMAGE_CACHE_DIR))
+    return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in sources)
+
+def watch_sources(interval=WATCH_INTERVAL):
+    """Reloads when the brain, scraping JSON or image cache changes on disk (polling their mtimes)."""
+    def loop():
+        seen = _source_mtimes()
+        while True:
+            time.sleep(interval)
+            current = _source_mtimes()
+            if current != seen and reload_brain():
+                seen = current
+    threading.Thread(target=loop, daemon=True).start()
 
 # Initialize System
-load_images()
-ai_engine = DjezzySearchAI()
+ai_engine = build_engine()
+
+# `kill -USR2 <worker pid>` reloads that worker (SIGHUP/USR2 to the gunicorn master mean restart/upgrade)
+try:
+    signal.signal(signal.SIGUSR2, lambda signum, frame: reload_in_background())
+except (ValueError, AttributeError):
+    pass  # Not in the main thread, or no SIGUSR2 on this platform
+if WATCH_INTERVAL > 0:
+    watch_sources()
 
 # ==========================================
-# 4. FLASK ROUTES
+# 5. FLASK ROUTES
 # ==========================================
 @app.route('/')
 def home():
     return render_template('index.html')
 
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    if request.endpoint not in (None, 'static', 'image', 'metrics_endpoint'):
+        metrics.observe_request(request.endpoint, response.status_code, time.perf_counter() - g.request_start)
+    return response
+
+@app.route('/img/<digest>')
+def image(digest):
+    """A cached thumbnail; its name is its content hash, so it never changes (ETag + immutable)."""
+    status, body, content_type, headers = ai_engine.image_cache.response(digest, request.headers.get('If-None-Match', ''))
+    if status == 404:
+        return jsonify({"error": "Not found"}), 404
+    return Response(body, status=status, mimetype=content_type, headers=headers)
+
 @app.route('/search', methods=['POST'])
 def search():
     data = request.get_json()
     query = data.get('query', '')
     results = ai_engine.search(query)
-    return jsonify(results)
+    t = time.perf_counter()
+    response = jsonify(results)
+    metrics.observe_stage("serialize", time.perf_counter() - t)
+    return response
+
+@app.route('/suggest')
+def suggest():
+    """Search-as-you-type: GET /suggest?q=<text so far>[&top_k=8]."""
+    query = request.args.get('q', '')
+    try:
+        top_k = min(int(request.args.get('top_k', SUGGEST_TOP_K)), DEFAULT_TOP_K)
+    except ValueError:
+        return jsonify({"error": "'top_k' must be a number."}), 400
+    return jsonify({"query": query, "results": ai_engine.suggest(query, top_k)})
+
+@app.route('/complete')
+def complete():
+    """Keyword autocomplete: GET /complete?q=<prefix>[&n=8] (at most 10)."""
+    query = request.args.get('q', '')
+    try:
+        n = int(request.args.get('n', DEFAULT_COMPLETIONS))
+    except ValueError:
+        return jsonify({"error": "'n' must be a number."}), 400
+    return jsonify({"query": query, "completions": ai_engine.complete(query, n)})
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """{"queries": ["modem 4g", {"query": "samsung", "top_k": 5, "threshold": 0.5}, ...]}"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('queries')
+    if not isinstance(items, list):
+        return jsonify({"error": "'queries' must be a list."}), 400
+    if len(items) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"Too many queries (max {MAX_BATCH_QUERIES} per batch)."}), 413
+    
+    queries, top_ks, thresholds = [], [], []
+    for item in items:
+        if not isinstance(item, dict):
+            item = {'query': item}
+        try:
+            top_ks.append(int(item.get('top_k', data.get('top_k', DEFAULT_TOP_K))))
+            thresholds.append(float(item.get('threshold', data.get('threshold', SCORE_THRESHOLD))))
+        except (TypeError, ValueError):
+            return jsonify({"error": "'top_k' and 'threshold' must be numbers."}), 400
+        queries.append(str(item.get('query', '')))
+    
+    results = ai_engine.search_many(queries, top_ks, thresholds)
+    return jsonify({"results": results})
+
+def _is_admin():
+    # No token, no admin: behind a reverse proxy every request comes from localhost
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    if not _is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    if reload_state["reloading"]:
+        return jsonify({"status": "already reloading"}), 409
+    reload_in_background()  # Only the configured brain and JSON: never paths taken from the request
+    return jsonify({"status": "reloading"}), 202
+
+@app.route('/admin/status')
+def admin_status():
+    if not _is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    engine = ai_engine
+    return jsonify({
+        "model_version": engine.model_version,
+        "images_version": engine.images_version,
+        "loaded_at": engine.loaded_at,
+        "load_seconds": engine.load_seconds,
+        "products": len(engine.store) if engine.store is not None else 0,
+        "cache": engine.cache.stats() if engine.cache is not None else None,
+        "singleflight": engine.flight.stats(),
+        "category_routing": engine.router is not None,
+        "typo_correction": engine.typos is not None,
+        "shards": engine.sharded.n_shards if engine.sharded is not None else 0,
+        "autocomplete_keywords": len(engine.autocomplete) if engine.autocomplete is not None else 0,
+        "cached_images": len(engine.image_cache),
+        **reload_state,
+    })
+
+def engine_gauges(engine):
+    """(name, help, value, labels) gauges describing the serving engine, for /metrics."""
+    gauges = [
+        ("djibly_model_info", "Loaded brain and image source versions.", 1,
+         {"model_version": engine.model_version, "images_version": engine.images_version or "none"}),
+        ("djibly_model_load_seconds", "Time taken to load the current brain.", engine.load_seconds, {}),
+        ("djibly_model_loaded_timestamp_seconds", "When the current brain was loaded.", engine.loaded_at, {}),
+        ("djibly_products", "Products in the loaded catalog.", len(engine.store) if engine.store is not None else 0, {}),
+        ("djibly_reloads", "Successful brain reloads since start.", reload_state["reloads"], {}),
+    ]
+    for name, value in engine.flight.stats().items():
+        gauges.append((f"djibly_singleflight_{name}", f"Single-flight {name.replace('_', ' ')}.", value, {}))
+    if engine.cache is not None:
+        for name, value in engine.cache.stats().items():
+            if name != "version":
+                gauges.append((f"djibly_cache_{name}", f"Result cache {name.replace('_', ' ')}.", value, {}))
+    return gauges
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return metrics.render(engine_gauges(ai_engine)), 200, {"Content-Type": "text/plain; version=0.0.4"}
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
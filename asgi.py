@@ -0,0 +1,226 @@
+import os
+import json
+import asyncio
+import time
+import mimetypes
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from flask import render_template
+import app as flask_app
+from result_cache import ResultCache
+from singleflight import AsyncSingleFlight
+from search_metrics import metrics
+from suggest import SUGGEST_TOP_K
+from autocomplete import DEFAULT_COMPLETIONS
+
+# ==========================================
+# ASGI ENTRY POINT (run with: uvicorn asgi:app)
+# ==========================================
+# Same "/", "/search", "/suggest", "/complete" and "/img/<hash>" contract as `gunicorn app:app`,
+# but request handling is async and the CPU-bound scoring runs on a bounded
+# thread pool (NumPy and sklearn release the GIL for most of it). When every
+# worker thread is busy and the small wait queue is full, requests get 503 +
+# Retry-After instead of queueing without bound. Brain, cache and hot reload are shared with app.py.
+
+SCORING_THREADS = int(os.environ.get("DJIBLY_SCORING_THREADS", os.cpu_count() or 1))
+MAX_PENDING = int(os.environ.get("DJIBLY_MAX_PENDING", SCORING_THREADS * 4))
+RETRY_AFTER = os.environ.get("DJIBLY_RETRY_AFTER", "1")
+MAX_BODY = 64 * 1024
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class ScoringPool:
+    """Thread pool with a hard cap on running + waiting jobs."""
+
+    def __init__(self, threads=SCORING_THREADS, max_pending=MAX_PENDING):
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="djibly-score")
+        self.max_pending = max_pending
+        self.pending = 0  # Only touched from the event loop thread
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise PoolSaturated()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool = ScoringPool()
+flight = AsyncSingleFlight()
+_index_html = None
+
+
+def _render_index():
+    global _index_html
+    if _index_html is None:
+        with flask_app.app.test_request_context('/'):
+            _index_html = render_template('index.html').encode('utf-8')
+    return _index_html
+
+
+async def _send(send, status, body, content_type="application/json", headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()),
+                    (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status, payload, headers=()):
+    await _send(send, status, json.dumps(payload).encode('utf-8'), headers=headers)
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY:
+            raise ValueError("Request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def _static(send, path):
+    full = os.path.normpath(os.path.join(STATIC_DIR, path[len("/static/"):]))
+    if not full.startswith(STATIC_DIR + os.sep) or not os.path.isfile(full):
+        return await _send_json(send, 404, {"error": "Not found"})
+    with open(full, 'rb') as f:
+        body = f.read()
+    await _send(send, 200, body, mimetypes.guess_type(full)[0] or "application/octet-stream")
+
+
+async def _image(scope, send, digest):
+    if_none_match = dict(scope.get("headers", ())).get(b"if-none-match", b"").decode('latin-1')
+    status, body, content_type, headers = flask_app.ai_engine.image_cache.response(digest, if_none_match)
+    if status == 404:
+        return await _send_json(send, 404, {"error": "Not found"})
+    await _send(send, status, body, content_type,
+                headers=[(k.lower().encode(), v.encode()) for k, v in headers])
+
+
+async def search(receive, send):
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+        query = data.get('query', '')
+    except (ValueError, AttributeError):
+        await _send_json(send, 400, {"error": "Invalid JSON body"})
+        return 400
+
+    engine = flask_app.ai_engine  # Pinned for this request (hot reload swaps the module global)
+    cache_key = ResultCache.make_key(engine.clean_query(query), flask_app.DEFAULT_TOP_K, flask_app.SCORE_THRESHOLD)
+    # A cached result needs no scoring: answer it here, without taking a pool slot (or a 503)
+    results = engine.cache.get(cache_key) if engine.cache is not None else None
+    if results is not None:
+        metrics.observe_results(len(results))
+        return await _send_search(send, results)
+    # Coalesce identical in-flight searches before they take a pool slot
+    key = (engine.model_version, cache_key)
+    try:
+        results = await flight.do(key, pool.run, engine.search, query)
+    except PoolSaturated:
+        await _send_json(send, 503, {"error": "Search is busy, retry shortly."},
+                         headers=[(b"retry-after", RETRY_AFTER.encode())])
+        return 503
+    return await _send_search(send, results)
+
+
+async def _send_search(send, results):
+    t = time.perf_counter()
+    body = json.dumps(results).encode('utf-8')
+    metrics.observe_stage("serialize", time.perf_counter() - t)
+    await _send(send, 200, body)
+    return 200
+
+
+async def suggest(scope, send):
+    params = parse_qs(scope.get("query_string", b"").decode('utf-8', 'replace'))
+    query = params.get('q', [''])[0]
+    try:
+        top_k = min(int(params.get('top_k', [SUGGEST_TOP_K])[0]), flask_app.DEFAULT_TOP_K)
+    except ValueError:
+        await _send_json(send, 400, {"error": "'top_k' must be a number."})
+        return 400
+    try:
+        results = await pool.run(flask_app.ai_engine.suggest, query, top_k)
+    except PoolSaturated:
+        await _send_json(send, 503, {"error": "Search is busy, retry shortly."},
+                         headers=[(b"retry-after", RETRY_AFTER.encode())])
+        return 503
+    await _send_json(send, 200, {"query": query, "results": results})
+    return 200
+
+
+async def complete(scope, send):
+    params = parse_qs(scope.get("query_string", b"").decode('utf-8', 'replace'))
+    query = params.get('q', [''])[0]
+    try:
+        n = int(params.get('n', [DEFAULT_COMPLETIONS])[0])
+    except ValueError:
+        await _send_json(send, 400, {"error": "'n' must be a number."})
+        return 400
+    # A few dict lookups: answered on the event loop, no pool hop
+    await _send_json(send, 200, {"query": query, "completions": flask_app.ai_engine.complete(query, n)})
+    return 200
+
+
+async def _metrics(send):
+    if not metrics.enabled:
+        return await _send_json(send, 404, {"error": "Metrics are disabled"})
+    gauges = flask_app.engine_gauges(flask_app.ai_engine)
+    gauges.append(("djibly_scoring_pool_pending", "Searches running or waiting for a scoring thread.",
+                   pool.pending, {}))
+    await _send(send, 200, metrics.render(gauges).encode('utf-8'), "text/plain; version=0.0.4")
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            pool.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+    if path == "/" and method in ("GET", "HEAD"):
+        await _send(send, 200, _render_index(), "text/html; charset=utf-8")
+    elif path == "/search" and method == "POST":
+        start = time.perf_counter()
+        status = await search(receive, send)
+        metrics.observe_request("search", status, time.perf_counter() - start)
+    elif path == "/suggest" and method == "GET":
+        start = time.perf_counter()
+        status = await suggest(scope, send)
+        metrics.observe_request("suggest", status, time.perf_counter() - start)
+    elif path == "/complete" and method == "GET":
+        start = time.perf_counter()
+        status = await complete(scope, send)
+        metrics.observe_request("complete", status, time.perf_counter() - start)
+    elif path == "/metrics" and method == "GET":
+        await _metrics(send)
+    elif path.startswith("/img/") and method in ("GET", "HEAD"):
+        await _image(scope, send, path[len("/img/"):])
+    elif path.startswith("/static/") and method in ("GET", "HEAD"):
+        await _static(send, path)
+    else:
+        await _send_json(send, 404, {"error": "Not found"})
@@ -0,0 +1,170 @@
+import re
+import json
+
+# ==========================================
+# KEYWORD AUTOCOMPLETE (/complete)
+# ==========================================
+# Completions come from the catalog: product names, the brands, model words,
+# categories and "brand model" pairs createdata5.extract_core_keywords builds
+# training queries from, each word of those on its own ("modem" out of
+# "routeur modem"), and the SYNONYMS keys. Each keyword is weighted by the
+# number of products it covers (a synonym by the products of the word it
+# expands to), and completions are listed most popular first.
+#
+# Everything is precomputed at training time and shipped inside the brain
+# (the pickle's 'autocomplete' entry, autocomplete.json in an mmap brain, the
+# lite export's metadata): the top MAX_COMPLETIONS keyword ids of every prefix
+# of every keyword, so a lookup is one dict hit. Typos get an edit-distance
+# allowance of one (a missing, extra, wrong or swapped letter: "tecnno") from
+# the single-letter deletions of each prefix: two strings are one edit apart
+# when deleting at most one letter from each makes them equal, so a query only
+# needs its own deletions looked up. Typo matches are listed after the exact
+# ones, and are only looked for in prefixes of MIN_FUZZY_LEN to MAX_FUZZY_LEN
+# letters. Brains saved before this (or changed by `--add-products`) get the
+# index built at load time from their catalog.
+#
+#   python autocomplete.py tec tabl tecnno     (build from the brain and time lookups)
+
+AUTOCOMPLETE_FORMAT = 1
+MAX_COMPLETIONS = 10
+DEFAULT_COMPLETIONS = 8
+MIN_FUZZY_LEN = 4       # Shorter prefixes are one edit away from too many keywords
+MAX_FUZZY_LEN = 10      # Longer ones complete exactly only (product names would make the index ~9x bigger)
+
+
+def normalize(text):
+    """Lowercase words without punctuation, single-spaced (same cleaning as preprocess_query)."""
+    return " ".join(re.sub(r'[^\w\s]', '', str(text).lower()).split())
+
+
+def deletes(word):
+    """Every string made by deleting one letter of word."""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def catalog_keywords(product_db, synonyms):
+    """{keyword: products covered} for a catalog (product_db / FlatCatalog columns)."""
+    from createdata5 import extract_core_keywords  # Not at module level: it pulls in pandas
+    coverage = {}
+    rows = zip(product_db['product_name'].tolist(), product_db['description'].tolist(),
+               product_db['category'].tolist())
+    for name, model, category in rows:
+        name, model = str(name), str(model)
+        # product_name is "<brand> <model>", or the model alone when it already starts with the brand
+        if model and name.endswith(model) and name != model:
+            brand = name[:-len(model)].strip()
+        else:
+            brand, _, model = name.partition(" ")
+        product = {"brand": brand, "model": model, "category": str(category)}
+        keywords = {normalize(k) for k in extract_core_keywords(product)}
+        keywords.update(w for k in list(keywords) if " " in k for w in k.split() if len(w) > 1)
+        keywords.add(normalize(name))
+        for keyword in keywords - {""}:
+            coverage[keyword] = coverage.get(keyword, 0) + 1
+    for key, value in (synonyms or {}).items():
+        key = normalize(key)
+        if key:
+            coverage[key] = max(coverage.get(key, 0), coverage.get(normalize(value), 1))
+    return coverage
+
+
+class AutocompleteIndex:
+    def __init__(self, keywords, weights, prefixes, fuzzy):
+        self.keywords = keywords      # Sorted, so a keyword's id also breaks weight ties alphabetically
+        self.weights = weights
+        self.prefixes = prefixes      # prefix -> best keyword ids
+        self.fuzzy = fuzzy            # one-letter deletion of a prefix -> best keyword ids
+
+    @classmethod
+    def build(cls, product_db, synonyms=None, top=MAX_COMPLETIONS):
+        return cls.from_keywords(catalog_keywords(product_db, synonyms), top)
+
+    @classmethod
+    def from_keywords(cls, coverage, top=MAX_COMPLETIONS):
+        keywords = sorted(coverage)
+        weights = [coverage[k] for k in keywords]
+        prefixes, fuzzy = {}, {}
+        for i, keyword in enumerate(keywords):
+            for end in range(1, len(keyword) + 1):
+                prefix = keyword[:end]
+                prefixes.setdefault(prefix, set()).add(i)
+                if MIN_FUZZY_LEN <= end <= MAX_FUZZY_LEN + 1:
+                    for d in deletes(prefix):
+                        fuzzy.setdefault(d, set()).add(i)
+
+        def best(ids):
+            return sorted(ids, key=lambda i: (-weights[i], i))[:top]
+        return cls(keywords, weights, {p: best(ids) for p, ids in prefixes.items()},
+                   {d: best(ids) for d, ids in fuzzy.items()})
+
+    def state(self):
+        """Plain lists and dicts (JSON-safe) for the brain artifact."""
+        return {"format": AUTOCOMPLETE_FORMAT, "keywords": self.keywords, "weights": self.weights,
+                "prefixes": self.prefixes, "fuzzy": self.fuzzy}
+
+    @classmethod
+    def from_state(cls, state):
+        if state.get("format") != AUTOCOMPLETE_FORMAT:
+            raise ValueError("Autocomplete index saved by an incompatible version.")
+        return cls(state["keywords"], state["weights"], state["prefixes"], state["fuzzy"])
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def _lookup(self, prefix, n):
+        ids = self.prefixes.get(prefix, [])[:n]
+        if len(ids) < n and MIN_FUZZY_LEN <= len(prefix) <= MAX_FUZZY_LEN:
+            # Extra letter typed: one of its deletions is a real prefix. Missing letter: it is the
+            # deletion of a real prefix. Wrong or swapped letter: both sides share a deletion.
+            close = set(self.fuzzy.get(prefix, ()))
+            for d in deletes(prefix):
+                close.update(self.prefixes.get(d, ()))
+                close.update(self.fuzzy.get(d, ()))
+            close.difference_update(ids)
+            ids = ids + sorted(close, key=lambda i: (-self.weights[i], i))[:n - len(ids)]
+        return [self.keywords[i] for i in ids]
+
+    def complete(self, text, n=DEFAULT_COMPLETIONS):
+        """Up to n keyword completions of text, most popular first; typo matches after exact ones."""
+        query = normalize(text)
+        n = max(0, min(n, MAX_COMPLETIONS))
+        if not query or n == 0:
+            return []
+        return self._lookup(query, n)
+
+
+def load_autocomplete(state, product_db, synonyms):
+    """The brain's precompiled index, or one built from its catalog when it has none (older brains)."""
+    if state is not None:
+        try:
+            return AutocompleteIndex.from_state(state)
+        except ValueError as e:
+            print(f"{e} Rebuilding it from the catalog.")
+    return AutocompleteIndex.build(product_db, synonyms)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import pickle
+    from ai_test5 import MODEL_FILE, SYNONYMS
+    from brain_delta import load_package
+
+    package = load_package(MODEL_FILE)
+    start = time.perf_counter()
+    index = AutocompleteIndex.build(package['database'], SYNONYMS)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"[Autocomplete] {len(index)} keywords from {len(package['database'])} products, built in "
+          f"{build_ms:.1f} ms; {len(index.prefixes)} prefixes, {len(index.fuzzy)} typo keys, "
+          f"{len(pickle.dumps(index.state())) / 1024:.0f} KB pickled, "
+          f"{len(json.dumps(index.state())) / 1024:.0f} KB as JSON")
+
+    queries = sys.argv[1:] or ["s", "tec", "tecnno", "zte blade a", "tabl", "tabeltte", "mod", "d li",
+                                "kitm", "charguer", "ecoutuer"]
+    for q in queries:
+        runs = 2000
+        start = time.perf_counter()
+        for _ in range(runs):
+            found = index.complete(q)
+        us = (time.perf_counter() - start) / runs * 1e6
+        print(f"   {q!r:14} {us:6.1f} us  {found}")
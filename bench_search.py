@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import pandas as pd
+from createdata5 import INPUT_FILE, mess_up_text, clean_text, clean_price, get_category
+from bench_serving import percentile
+
+# ==========================================
+# SEARCH LATENCY BENCHMARK (catalog scaling)
+# ==========================================
+# Builds brains whose product database is a synthetic catalog grown from
+# scraping5.json records (150 / 1k / 10k / 100k products, same trained
+# pipeline), then measures DjezzySearchAI.search as each front-end uses it:
+#
+#   app        app.py (columnar store, result cache disabled)
+#   ai_test5   ai_test5.py (DataFrame results, search_many for batches)
+#   tkinter    tkinter_interface5.py (DataFrame results, no batch API)
+#
+# Every (variant, size) pair runs in a fresh Python process, so load times
+# are cold and peak RSS belongs to that variant alone.
+#
+#   python bench_search.py --json bench.json
+#   python bench_search.py --compare bench.json   (exit code 1 on regression)
+
+BASE_MODEL = "djezzy_ai_brain5.pkl"
+SIZES = [150, 1000, 10000, 100000]
+VARIANTS = ["app", "ai_test5", "tkinter"]
+SUGGESTIONS = ["tablette", "wifi d-link", "telephone zte", "kitman hoco", "modem 4g", "samsung"]
+VARIANT_SUFFIXES = ["Pro", "Max", "Lite", "Plus", "Neo", "Ultra", "S", "5G", "2025"]
+
+# Metric -> direction that counts as worse
+REGRESSION_DIRECTIONS = {
+    "load_s": "up", "startup_s": "up", "p50_ms": "up", "p95_ms": "up", "p99_ms": "up",
+    "batch_qps": "down", "peak_rss_mib": "up",
+}
+
+
+# ==========================================
+# 1. SYNTHETIC CATALOGS & WORKLOADS
+# ==========================================
+def synthetic_records(base_records, size, seed=0):
+    """scraping5.json-style records: real products with new model names and prices."""
+    rng = random.Random(seed)
+    random.seed(seed)  # mess_up_text uses the global RNG
+    records = []
+    for i in range(size):
+        item = dict(rng.choice(base_records))
+        words = [mess_up_text(w) if rng.random() < 0.15 else w for w in str(item.get("description", "")).split()]
+        words += [rng.choice(VARIANT_SUFFIXES), f"M{i}"]
+        item["description"] = " ".join(words)
+        item["price"] = f"{rng.randint(1, 150)}&nbsp{rng.randint(0, 9)}00 DA"
+        records.append(item)
+    return records
+
+
+def records_to_database(records):
+    """Product database in the shape ai_test5 trains (same cleaning as createdata5)."""
+    rows, seen = [], set()
+    for item in records:
+        brand = clean_text(item.get("title", ""))
+        model = clean_text(item.get("description", ""))
+        name = model if model.lower().startswith(brand.lower()) else f"{brand} {model}"
+        key = name.lower().replace(" ", "")
+        if key in seen or not key:
+            continue
+        seen.add(key)
+        rows.append({"product_id": f"p{len(rows)}", "product_name": name, "category": get_category(name),
+                     "description": model, "price": clean_price(item.get("price", "0 DA"))})
+    db = pd.DataFrame(rows)
+    db['search_text'] = db['product_name'] + " " + db['category'] + " " + db['description'] + " " + db['price'].astype(str)
+    return db
+
+
+def build_brain(directory, size, seed=0):
+    """Writes a brain pickle with the trained pipeline and a catalog of `size` products."""
+    path = os.path.join(directory, f"brain_{size}.pkl")
+    with open(BASE_MODEL, 'rb') as f:
+        pipeline = pickle.load(f)['pipeline']
+    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+        base_records = json.load(f)
+    records = base_records[:size] if size <= len(base_records) else synthetic_records(base_records, size, seed)
+    with open(path, 'wb') as f:
+        pickle.dump({'pipeline': pipeline, 'database': records_to_database(records)}, f)
+    return path
+
+
+def query_workload(product_names, n, seed=0):
+    """Short, typo'd queries like createdata5 generates, plus the suggestion chips."""
+    rng = random.Random(seed)
+    random.seed(seed)
+    words = sorted({w for name in product_names for w in str(name).lower().split() if len(w) > 1})
+    queries = list(SUGGESTIONS)
+    while len(queries) < n:
+        queries.append(" ".join(mess_up_text(rng.choice(words)) for _ in range(rng.randint(1, 2))))
+    return queries[:n]
+
+
+# ==========================================
+# 2. PER-VARIANT WORKER (runs in a child process)
+# ==========================================
+def _peak_rss_mib():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _load_variant(variant, brain):
+    """Returns (search(q), search_batch(queries), product names, load seconds)."""
+    if variant == "app":
+        os.environ.update(DJIBLY_MODEL=brain, DJIBLY_CACHE_SIZE="0", DJIBLY_WARMUP_QUERIES="")
+        import app
+        engine = app.ai_engine
+        return engine.search, engine.search_many, engine.store.product_name, engine.load_seconds
+
+    import ai_test5
+    import tkinter_interface5
+    start = time.perf_counter()  # Module imports count towards startup_s only, as for app
+    if variant == "ai_test5":
+        engine = ai_test5.DjezzySearchAI()
+        engine.load_model(brain)
+        search_batch = engine.search_many
+    else:
+        engine = tkinter_interface5.DjezzySearchAI()
+        engine.load_model(brain)
+
+        def search_batch(queries):  # No batch API: the UI searches one query at a time
+            return [engine.search(q) for q in queries]
+    return engine.search, search_batch, engine.product_db['product_name'].tolist(), time.perf_counter() - start
+
+
+def run_worker(variant, brain, n_queries, batch_size, seed):
+    start = time.perf_counter()
+    search, search_batch, names, load_s = _load_variant(variant, brain)
+    startup_s = time.perf_counter() - start
+
+    queries = query_workload(names, n_queries, seed)
+    search(queries[0])  # First-call overhead is part of startup, not latency
+
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        search(q)
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+    t = time.perf_counter()
+    for batch in batches:
+        search_batch(batch)
+    batch_s = time.perf_counter() - t
+
+    return {
+        "variant": variant,
+        "products": len(names),
+        "load_s": load_s,
+        "startup_s": startup_s,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "batch_size": batch_size,
+        "batch_qps": len(queries) / batch_s,
+        "peak_rss_mib": _peak_rss_mib(),
+    }
+
+
+def measure(variant, brain, n_queries, batch_size, seed):
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", variant, brain,
+           "--queries", str(n_queries), "--batch-size", str(batch_size), "--seed", str(seed)]
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"{variant} worker failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ==========================================
+# 3. BASELINE COMPARISON
+# ==========================================
+def compare(results, baseline, tolerance):
+    """Lists metrics that got worse than the baseline by more than `tolerance` (a fraction)."""
+    previous = {(r["variant"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = previous.get((r["variant"], r["size"]))
+        if old is None:
+            continue
+        for metric, direction in REGRESSION_DIRECTIONS.items():
+            before, after = old.get(metric), r.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (change > tolerance) if direction == "up" else (change < -tolerance):
+                regressions.append({"variant": r["variant"], "size": r["size"], "metric": metric,
+                                    "baseline": before, "current": after, "change": change})
+    return regressions
+
+
+def environment():
+    import numpy
+    import sklearn
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "numpy": numpy.__version__, "sklearn": sklearn.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(), "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Djibly search latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=VARIANTS)
+    parser.add_argument("--queries", type=int, default=200, help="Single queries timed per run")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--worker", nargs=2, metavar=("VARIANT", "BRAIN"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        import contextlib
+        with contextlib.redirect_stdout(sys.stderr):  # Keep stdout for the JSON line
+            stats = run_worker(*args.worker, args.queries, args.batch_size, args.seed)
+        print(json.dumps(stats))
+        sys.exit(0)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="djibly-bench-") as workdir:
+        for size in args.sizes:
+            brain = build_brain(workdir, size, args.seed)
+            for variant in args.variants:
+                stats = measure(variant, brain, args.queries, args.batch_size, args.seed)
+                stats["size"] = size
+                results.append(stats)
+                print(f"{variant:<9} {size:>7} products   load={stats['load_s'] * 1000:8.0f} ms   "
+                      f"p50={stats['p50_ms']:7.2f}  p95={stats['p95_ms']:7.2f}  p99={stats['p99_ms']:7.2f} ms   "
+                      f"batch={stats['batch_qps']:8.0f} q/s   peak RSS={stats['peak_rss_mib']:6.0f} MiB")
+
+    report = {"environment": environment(), "settings": {"queries": args.queries, "batch_size": args.batch_size,
+                                                        "seed": args.seed}, "results": results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"[SUCCESS] Results written to '{args.json}'")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"[REGRESSION] {r['variant']} @ {r['size']}: {r['metric']} "
+                  f"{r['baseline']:.4g} -> {r['current']:.4g} ({r['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"[SUCCESS] No regression beyond {args.tolerance:.0%} against '{args.compare}'")
@@ -0,0 +1,126 @@
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+
+# ==========================================
+# SERVING BENCHMARK: gunicorn app:app vs uvicorn asgi:app
+# ==========================================
+# Starts each server locally, then hammers POST /search from N concurrent
+# client threads (closed loop) and reports throughput and latency percentiles.
+
+SERVERS = {
+    "gunicorn": [sys.executable, "-m", "gunicorn", "app:app", "--bind", "127.0.0.1:{port}"],
+    "uvicorn": [sys.executable, "-m", "uvicorn", "asgi:app", "--port", "{port}", "--log-level", "warning"],
+}
+QUERIES = ["modem 4g", "samsung", "tablette", "kitman hoco", "zte blade", "wifi d-link",
+           "pova 6", "cable type-c", "telephone zte", "routeur"]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def run_clients(port, concurrency, duration, unique_queries=False):
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.perf_counter() < stop_at:
+            query = rng.choice(QUERIES)
+            if unique_queries:  # Defeat the result cache so scoring is measured
+                query += f" {rng.randint(0, 10 ** 6)}"
+            body = json.dumps({"query": query})
+            start = time.perf_counter()
+            try:
+                conn.request("POST", "/search", body, {"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except OSError:
+                status = "error"
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    ok = statuses.get(200, 0)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": ok / duration,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare gunicorn (WSGI) and uvicorn (ASGI) serving")
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--unique-queries", action="store_true", help="Bypass the result cache")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    report = []
+    for name in args.servers:
+        port = _free_port()
+        proc = subprocess.Popen([part.format(port=port) for part in SERVERS[name]],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_ready(port):
+                print(f"[ERROR] {name} did not start")
+                continue
+            for c in args.concurrency:
+                stats = run_clients(port, c, args.duration, args.unique_queries)
+                stats["server"] = name
+                report.append(stats)
+                print(f"{name:<9} clients={c:<4} {stats['throughput_rps']:8.1f} req/s   "
+                      f"p50={stats['p50_ms']:7.1f} ms   p99={stats['p99_ms']:8.1f} ms   {stats['statuses']}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
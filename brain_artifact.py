@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import numpy as np
+from compiled_scorer import CompiledScorer, HashedVocabulary, DEFAULT_TOKEN_PATTERN
+
+# ==========================================
+# MEMORY-MAPPED BRAIN ARTIFACT
+# ==========================================
+# Alternative to djezzy_ai_brain5.pkl for multi-worker serving. Every array is
+# a plain .npy file opened with mmap, so all gunicorn workers share the same
+# pages through the OS page cache instead of each unpickling a private copy:
+#
+#   meta.json                    n-gram config, intercept, column names
+#   idf.npy, coef.npy            TF-IDF weights and SGD coefficients
+#   vocab_terms.npy              vocabulary as a sorted fixed-width string array; n-grams
+#                                sharing leading words are contiguous in it, so it is also
+#                                CompiledScorer's prefix index for cross n-grams
+#   vocab_index.npy              feature index of each sorted term
+#                                (both absent for hashed brains: meta has hash_features)
+#   scorer_*.npy, heads.json     precompiled product side of CompiledScorer
+#   catalog_<col>.bin/.idx.npy   catalog columns as UTF-8 blobs + row offsets
+#   autocomplete.json            precompiled keyword completions (autocomplete.py)
+#   typos.json                   query typo dictionary (typo_correction.py)
+#
+# Loading it needs neither scikit-learn nor pandas. A save is written to a
+# sibling temp directory and swapped in whole, so a worker or hot reload
+# opening the artifact never mixes new arrays with the old meta.json; each save
+# has its own meta "build" id, which the loader checks again once every file
+# is open (and retries if a save swapped the directory in the meantime).
+
+FORMAT_VERSION = 1
+LOAD_ATTEMPTS = 3
+CATALOG_COLUMNS = ["product_id", "product_name", "category", "description", "price", "search_text"]
+
+
+class SortedVocabulary:
+    """Read-only term -> index mapping over mmapped sorted arrays (binary search)."""
+
+    def __init__(self, terms, index):
+        self.terms = terms
+        self.index = index
+
+    def __len__(self):
+        return len(self.terms)
+
+    def get(self, term, default=None):
+        pos = np.searchsorted(self.terms, term)
+        if pos < len(self.terms) and self.terms[pos] == term:
+            return int(self.index[pos])
+        return default
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def items(self):
+        return zip(self.terms.tolist(), self.index.tolist())
+
+    def grams_after(self, words):
+        """[(remaining words as one string, index)] of the n-grams starting with `words`: a contiguous run of terms."""
+        prefix = " ".join(words) + " "
+        lo = np.searchsorted(self.terms, prefix)
+        hi = np.searchsorted(self.terms, prefix[:-1] + "!")  # "!" sorts right after " "
+        start = len(prefix)
+        return [(t[start:], i) for t, i in zip(self.terms[lo:hi].tolist(), self.index[lo:hi].tolist())]
+
+
+class FlatColumn:
+    """A text column stored as one UTF-8 blob plus row offsets; rows decode on access."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return bytes(self.blob[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def __iter__(self):
+        return (self[r] for r in range(len(self)))
+
+    def tolist(self):
+        return list(self)
+
+
+class FlatCatalog:
+    """Column access compatible with the parts of the product DataFrame the app uses."""
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+
+def _write_flat_column(directory, name, values):
+    encoded = ["" if v is None or v != v else str(v) for v in values]
+    encoded = [v.encode('utf-8') for v in encoded]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(os.path.join(directory, f"catalog_{name}.bin"), 'wb') as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(directory, f"catalog_{name}.idx.npy"), offsets)
+
+
+def _read_flat_column(directory, name):
+    offsets = np.load(os.path.join(directory, f"catalog_{name}.idx.npy"), mmap_mode='r')
+    path = os.path.join(directory, f"catalog_{name}.bin")
+    blob = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, np.uint8)
+    return FlatColumn(blob, offsets)
+
+
+def save_brain(directory, pipeline, product_db, scorer=None, indexes=None):
+    """Writes the mmap artifact for a trained ('tfidf', 'clf') pipeline + product database.
+
+    indexes: {name: JSON-safe state} of query-side indexes, saved as <name>.json.
+    """
+    if scorer is None:
+        scorer = CompiledScorer.from_pipeline(pipeline, product_db['search_text'])
+    directory = os.path.normpath(directory)
+    tmp = f"{directory}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        _write_brain(tmp, pipeline, product_db, scorer, indexes)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _swap_in(tmp, directory)
+
+
+def _swap_in(tmp, directory):
+    """Replaces `directory` by the complete `tmp` one."""
+    old = None
+    if os.path.exists(directory):
+        # os.replace cannot overwrite a non-empty directory: move the old artifact aside first
+        old = f"{directory}.{os.getpid()}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)  # Workers that mmapped its files keep their pages
+
+
+def _write_brain(directory, pipeline, product_db, scorer, indexes):
+    vec = pipeline.steps[0][1]
+
+    if not scorer.hashed:
+        terms = sorted(vec.vocabulary_)
+        np.save(os.path.join(directory, "vocab_terms.npy"), np.array(terms, dtype=str))
+        np.save(os.path.join(directory, "vocab_index.npy"),
+                np.array([vec.vocabulary_[t] for t in terms], dtype=np.int64))
+        np.save(os.path.join(directory, "idf.npy"), scorer.idf)
+    np.save(os.path.join(directory, "coef.npy"), scorer.coef)
+
+    state = scorer.export_state()
+    with open(os.path.join(directory, "heads.json"), 'w', encoding='utf-8') as f:
+        json.dump(state.pop("heads"), f)
+    for name, array in state.items():
+        np.save(os.path.join(directory, f"scorer_{name}.npy"), np.asarray(array))
+
+    for col in CATALOG_COLUMNS:
+        _write_flat_column(directory, col, product_db[col].tolist())
+    for name, state in (indexes or {}).items():
+        with open(os.path.join(directory, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "ngram_range": list(scorer.ngram_range),
+        "token_pattern": vec.token_pattern or DEFAULT_TOKEN_PATTERN,
+        "lowercase": scorer.lowercase,
+        "intercept": scorer.intercept,
+        "n_products": scorer.n_products,
+        "columns": CATALOG_COLUMNS,
+        "hash_features": scorer.vocabulary.n_features if scorer.hashed else None,
+        "build": uuid.uuid4().hex,
+    }
+    # Written last: a directory without meta.json is an incomplete artifact
+    with open(os.path.join(directory, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_brain(directory):
+    """Opens an mmap artifact; returns (CompiledScorer, FlatCatalog)."""
+    for attempt in range(LOAD_ATTEMPTS):
+        try:
+            meta = _read_meta(directory)
+            scorer, catalog = _open_brain(directory, meta)
+            if _read_meta(directory).get("build") == meta.get("build"):
+                return scorer, catalog
+        except FileNotFoundError:
+            if attempt == LOAD_ATTEMPTS - 1:
+                raise
+        time.sleep(0.05)  # A save was swapping the directory: open the new one
+    raise RuntimeError(f"Brain '{directory}' kept changing while it was being loaded.")
+
+
+def _open_brain(directory, meta):
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported brain format: {meta.get('format_version')}")
+
+    def load(name):
+        return np.load(os.path.join(directory, name), mmap_mode='r')
+
+    state = {name.lstrip("_"): load(f"scorer_{name.lstrip('_')}.npy")
+             for name in CompiledScorer.STATE_ARRAYS}
+    with open(os.path.join(directory, "heads.json"), encoding='utf-8') as f:
+        state["heads"] = json.load(f)
+
+    if meta.get("hash_features"):
+        vocabulary, idf = HashedVocabulary(meta["hash_features"]), np.ones(meta["hash_features"])
+    else:
+        vocabulary, idf = SortedVocabulary(load("vocab_terms.npy"), load("vocab_index.npy")), load("idf.npy")
+    scorer = CompiledScorer(
+        vocabulary, idf, load("coef.npy"), meta["intercept"],
+        ngram_range=meta["ngram_range"], token_pattern=meta["token_pattern"],
+        lowercase=meta["lowercase"], state=state,
+    )
+    catalog = FlatCatalog({col: _read_flat_column(directory, col) for col in meta["columns"]})
+    return scorer, catalog
+
+
+def load_index_state(directory, name):
+    """A saved query-side index state ('autocomplete', 'typos'), or None for artifacts written without it."""
+    path = os.path.join(directory, f"{name}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_mmap_brain(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "meta.json"))
+
+
+def convert(pickle_file, directory):
+    """Converts an existing pickle brain into the mmap format."""
+    import pickle
+    with open(pickle_file, 'rb') as f:
+        package = pickle.load(f)
+    indexes = {"autocomplete": package.get('autocomplete'), "typos": package.get('typo_correction')}
+    save_brain(directory, package['pipeline'], package['database'],
+               indexes={name: state for name, state in indexes.items() if state is not None})
+
+
+# ==========================================
+# RSS / STARTUP MEASUREMENT
+# ==========================================
+def _memory_kib():
+    """(RSS, PSS) of this process in KiB; PSS splits shared pages between sharers."""
+    rss = pss = 0
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+    if os.path.exists("/proc/self/smaps_rollup"):
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    return rss, pss
+
+
+def _worker(path, barrier, results):
+    start = time.perf_counter()
+    from product_store import ProductStore
+    if is_mmap_brain(path):
+        scorer, catalog = load_brain(path)
+    else:
+        import pickle
+        with open(path, 'rb') as f:
+            package = pickle.load(f)
+        catalog = package['database']
+        scorer = CompiledScorer.from_pipeline(package['pipeline'], catalog['search_text'])
+    ProductStore(catalog)
+    scorer.predict_proba("modem 4g")
+    startup = time.perf_counter() - start
+    barrier.wait()  # Measure while every worker is alive and sharing pages
+    results.put((startup,) + _memory_kib())
+    barrier.wait()
+
+
+def measure(path, workers):
+    import multiprocessing as mp
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(path, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    stats = [results.get() for _ in range(workers)]
+    for p in procs:
+        p.join()
+    startup = max(s[0] for s in stats)
+    return startup, sum(s[1] for s in stats), sum(s[2] for s in stats)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Djibly brain artifact tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert", help="Convert a pickle brain to the mmap format")
+    conv.add_argument("pickle_file", nargs="?", default="djezzy_ai_brain5.pkl")
+    conv.add_argument("directory", nargs="?", default="djezzy_ai_brain5.mmap")
+    meas = sub.add_parser("measure", help="Startup time and memory for N concurrent workers")
+    meas.add_argument("paths", nargs="+")
+    meas.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert(args.pickle_file, args.directory)
+        print(f"[SUCCESS] '{args.pickle_file}' converted to '{args.directory}'")
+    else:
+        for path in args.paths:
+            for n in args.workers:
+                startup, rss, pss = measure(path, n)
+                print(f"{path:<28} workers={n:<2} startup={startup * 1000:7.0f} ms   "
+                      f"total RSS={rss / 1024:7.1f} MiB   total PSS={pss / 1024:7.1f} MiB")
@@ -0,0 +1,84 @@
+import os
+import pickle
+from result_cache import model_version
+
+# ==========================================
+# BRAIN DELTAS (new products without a full retrain)
+# ==========================================
+# `ai_test5.py --add-products` updates the classifier with a few partial_fit
+# steps and changes a handful of product_db rows. Instead of rewriting
+# djezzy_ai_brain5.pkl, it writes djezzy_ai_brain5.delta.pkl next to it:
+#
+#   base_version   content hash of the .pkl this delta applies to
+#   clf            the updated classifier (replaces the pipeline's last step)
+#   removed_ids    product_db rows to drop
+#   upserts        product_db rows to add or replace (new / re-priced products)
+#
+# A delta for another base file is ignored. Deleting the delta file rolls back.
+
+DELTA_FORMAT = 1
+
+
+def delta_path(base_file):
+    return os.path.splitext(base_file)[0] + ".delta.pkl"
+
+
+def save_delta(base_file, clf, database, report=None):
+    """Writes the delta that turns base_file into (clf, database); deltas are cumulative, not chained."""
+    with open(base_file, 'rb') as f:
+        base_db = pickle.load(f)['database']
+    current = set(database['product_id'])
+    key = ['product_id', 'search_text']
+    unchanged = database[key].merge(base_db[key], on=key, how='left', indicator=True)['_merge'] == 'both'
+    path = delta_path(base_file)
+    delta = {
+        "format": DELTA_FORMAT,
+        "base_version": model_version(base_file),
+        "clf": clf,
+        "removed_ids": [pid for pid in base_db['product_id'] if pid not in current],
+        "upserts": database[~unchanged.to_numpy()].reset_index(drop=True),
+        "report": report,
+    }
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(delta, f)
+    os.replace(tmp, path)
+    return path
+
+
+def apply_delta(package, delta):
+    """Returns a copy of a {'pipeline', 'database'} package with the delta applied."""
+    import pandas as pd  # Not at module level: lite_brain checks versions without pandas
+    pipeline = package['pipeline']
+    pipeline.steps[-1] = (pipeline.steps[-1][0], delta["clf"])
+    db = package['database']
+    upserts = delta["upserts"]
+    drop = set(delta["removed_ids"]) | set(upserts['product_id'].tolist())
+    db = db[~db['product_id'].isin(drop)]
+    if len(upserts):
+        db = pd.concat([db, upserts[db.columns]], ignore_index=True)
+    return {'pipeline': pipeline, 'database': db.reset_index(drop=True)}
+
+
+def load_package(base_file):
+    """Unpickles a brain and applies its delta file, if there is one for this exact base."""
+    with open(base_file, 'rb') as f:
+        package = pickle.load(f)
+    path = delta_path(base_file)
+    if not os.path.exists(path):
+        return package
+    with open(path, 'rb') as f:
+        delta = pickle.load(f)
+    if delta.get("format") != DELTA_FORMAT or delta.get("base_version") != model_version(base_file):
+        print(f"Ignoring '{path}': it was made for another version of '{base_file}'.")
+        return package
+    return apply_delta(package, delta)
+
+
+def brain_version(base_file):
+    """model_version of the base brain, extended with the delta's when one is present."""
+    version = model_version(base_file)
+    path = delta_path(base_file)
+    if os.path.isfile(base_file) and os.path.exists(path):
+        version += "+" + model_version(path)
+    return version
@@ -0,0 +1,204 @@
+import re
+import math
+import numpy as np
+
+# ==========================================
+# FIRST-STAGE CANDIDATE RETRIEVAL
+# ==========================================
+# Shortlists `depth` products before the SGD re-ranker runs, for catalogs too
+# big to score in full. Two kinds of products make the re-ranker's top k:
+#
+# - Lexical matches: word-level BM25 over the product text. A query word the
+#   index does not know (a typo createdata5.mess_up_text would make) stands
+#   for the indexed words sharing at least MIN_GRAM_OVERLAP of its character
+#   trigrams (Dice), weighted by that overlap; "tabltte" still finds
+#   "tablette", a stray trigram in common finds nothing.
+# - Products the re-ranker favours whatever the query: its score has a large
+#   query-independent part (the `prior`, its scores for an empty query), and
+#   on the 50k synthetic catalog the 300 best of those hold 99% of the full
+#   scan's top 20. PRIOR_SHARE of the depth is kept for them, plus whatever
+#   the lexical matches leave unused.
+#
+# Catalogs of at most `depth` products are always scored in full.
+
+DEFAULT_DEPTH = 300
+GRAM_SIZE = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+MIN_GRAM_OVERLAP = 0.5
+PRIOR_SHARE = 0.5
+RECALL_TARGET = 0.95    # DEFAULT_DEPTH must keep this much of the full scan's top 20 on the 50k bench
+
+
+def words_of(text):
+    return re.sub(r'[^\w]+|_', ' ', str(text).lower()).split()
+
+
+def char_grams(text, n=GRAM_SIZE):
+    """Padded character n-grams of every word, e.g. 'wifi' -> ' wi', 'wif', 'ifi', 'fi '."""
+    grams = set()
+    for word in words_of(text):
+        padded = f" {word} "
+        for i in range(max(1, len(padded) - n + 1)):
+            grams.add(padded[i:i + n])
+    return grams
+
+
+def product_text(product_name, category, description):
+    """The fields the retriever indexes (the price is left out on purpose)."""
+    fields = ["" if v is None or v != v else str(v) for v in (product_name, category, description)]
+    return " ".join(fields)
+
+
+class CandidateIndex:
+    def __init__(self, texts, prior=None):
+        counts, lengths = {}, np.zeros(len(texts), dtype=np.float64)
+        for row, text in enumerate(texts):
+            words = words_of(text)
+            lengths[row] = len(words)
+            for w in words:
+                tf = counts.setdefault(w, {})
+                tf[row] = tf.get(row, 0) + 1
+
+        self.n_products = len(texts)
+        avg_length = lengths.mean() if self.n_products else 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length) if avg_length > 0 else lengths + BM25_K1
+        self.words = sorted(counts)
+        self.word_ids = {w: i for i, w in enumerate(self.words)}
+        # Per word: the rows containing it and their precomputed BM25 term weight
+        self.rows, self.weights = [], []
+        for w in self.words:
+            rows = np.fromiter(counts[w].keys(), dtype=np.int32, count=len(counts[w]))
+            tf = np.fromiter(counts[w].values(), dtype=np.float64, count=len(counts[w]))
+            idf = math.log(1 + (self.n_products - len(rows) + 0.5) / (len(rows) + 0.5))
+            self.rows.append(rows)
+            self.weights.append(idf * tf * (BM25_K1 + 1) / (tf + norm[rows]))
+
+        # Trigram -> indexed words, to match the words of a typo
+        self.gram_words = {}
+        self.gram_counts = np.zeros(len(self.words), dtype=np.int32)
+        for i, w in enumerate(self.words):
+            grams = char_grams(w)
+            self.gram_counts[i] = len(grams)
+            for g in grams:
+                self.gram_words.setdefault(g, []).append(i)
+        self.gram_words = {g: np.asarray(ids, dtype=np.int32) for g, ids in self.gram_words.items()}
+
+        self.by_prior = None
+        if prior is not None:
+            self.by_prior = np.argsort(-np.asarray(prior, dtype=np.float64), kind='stable').astype(np.int64)
+
+    @classmethod
+    def from_database(cls, product_db, prior=None):
+        texts = [product_text(n, c, d) for n, c, d in zip(product_db['product_name'].tolist(),
+                                                          product_db['category'].tolist(),
+                                                          product_db['description'].tolist())]
+        return cls(texts, prior)
+
+    def similar_words(self, word):
+        """(word id, weight) of the indexed words a query word stands for: itself, or close spellings."""
+        i = self.word_ids.get(word)
+        if i is not None:
+            return [(i, 1.0)]
+        grams = char_grams(word)
+        hits = [self.gram_words[g] for g in grams if g in self.gram_words]
+        if not hits:
+            return []
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.words))
+        dice = 2.0 * shared / (len(grams) + self.gram_counts)
+        close = np.flatnonzero(dice >= MIN_GRAM_OVERLAP)
+        return list(zip(close.tolist(), dice[close].tolist()))
+
+    def lexical_scores(self, clean_query):
+        """BM25 score of every product for the query (0 for products matching none of its words)."""
+        scores = np.zeros(self.n_products, dtype=np.float64)
+        for word in set(words_of(clean_query)):
+            for i, weight in self.similar_words(word):
+                scores[self.rows[i]] += weight * self.weights[i]
+        return scores
+
+    def candidates(self, clean_query, depth=DEFAULT_DEPTH):
+        """Sorted catalog positions of at most `depth` products to re-rank, or None to scan everything."""
+        if self.n_products <= depth:
+            return None
+
+        scores = self.lexical_scores(clean_query)
+        matched = np.flatnonzero(scores > 0)
+        lexical_depth = depth - int(depth * PRIOR_SHARE) if self.by_prior is not None else depth
+        if len(matched) > lexical_depth:
+            matched = matched[np.argpartition(-scores[matched], lexical_depth - 1)[:lexical_depth]]
+        if self.by_prior is None:
+            return np.sort(matched) if len(matched) else None
+        # The re-ranker's favourites fill the rest of the depth
+        rows = np.union1d(matched, self.by_prior[:depth - len(matched)])
+        if len(rows) < depth:
+            extra = self.by_prior[depth - len(matched):]
+            extra = extra[~np.isin(extra, rows)][:depth - len(rows)]
+            rows = np.union1d(rows, extra)
+        return rows
+
+
+# ==========================================
+# RECALL@K REPORT
+# ==========================================
+def recall_report(scorer, index, clean_queries, depths, k=20, threshold=0.35):
+    """Fraction of the full-scan top-k (above the serving threshold) kept by the first stage."""
+    report = {}
+    for depth in depths:
+        kept = total = 0
+        for q in clean_queries:
+            full = scorer.predict_proba(q)
+            ranked = np.argsort(-full, kind='stable')[:k]
+            top = set(ranked[full[ranked] > threshold].tolist())
+            rows = index.candidates(q, depth)
+            survivors = top if rows is None else top.intersection(rows.tolist())
+            kept += len(survivors)
+            total += len(top)
+        report[depth] = kept / total if total else 1.0
+    return report
+
+
+if __name__ == "__main__":
+    import pickle
+    import random
+    import time
+    from createdata5 import mess_up_text
+    from ai_test5 import preprocess_query, MODEL_FILE
+    from compiled_scorer import CompiledScorer, _synthetic_catalog
+
+    with open(MODEL_FILE, 'rb') as f:
+        package = pickle.load(f)
+    pipeline, db = package['pipeline'], package['database']
+
+    random.seed(7)
+    words = sorted({w for n in db['product_name'] for w in n.lower().split() if len(w) > 1})
+    queries = [" ".join(mess_up_text(random.choice(words)) for _ in range(random.randint(1, 2)))
+               for _ in range(150)]
+    queries += ["tablette", "wifi d-link", "telephone zte", "kitman hoco", "modem 4g"]
+    clean = [preprocess_query(q) for q in queries]
+
+    synthetic = _synthetic_catalog(db['search_text'].tolist(), 50000)
+    catalogs = [
+        ("v5", db['search_text'].tolist(), [10, 20, 50, 100]),
+        ("synthetic-50k", synthetic, [100, 300, 1000, 3000]),
+    ]
+
+    for name, texts, depths in catalogs:
+        scorer = CompiledScorer.from_pipeline(pipeline, texts)
+        prior = scorer.predict_proba("")
+        index = CandidateIndex.from_database(db, prior) if name == "v5" else CandidateIndex(texts, prior)
+        sample = clean if name == "v5" else clean[:40]
+        start = time.perf_counter()
+        for q in sample:
+            scorer.predict_proba(q)
+        full_ms = (time.perf_counter() - start) * 1000 / len(sample)
+        print(f"\n[{name}] {len(texts)} products, recall@20 of the full scan ({full_ms:.2f} ms/query):")
+        for depth, recall in recall_report(scorer, index, sample, depths).items():
+            start = time.perf_counter()
+            for q in sample:
+                rows = index.candidates(q, depth)
+                scorer.predict_proba(q, rows)
+            ms = (time.perf_counter() - start) * 1000 / len(sample)
+            gate = "ok" if recall >= RECALL_TARGET else f"below {RECALL_TARGET}"
+            print(f"   depth={depth:<5} recall={recall:.3f} ({gate})   two-stage {ms:.2f} ms/query"
+                  f"{'   <- DEFAULT_DEPTH' if depth == DEFAULT_DEPTH else ''}")
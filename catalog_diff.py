@@ -0,0 +1,134 @@
+import json
+import hashlib
+import difflib
+import pandas as pd
+
+# ==========================================
+# CATALOG CHANGE DETECTION
+# ==========================================
+# Product IDs are a hash of the normalized product name (createdata5's
+# unique_key), so the same product keeps its ID across scrapes. A snapshot of
+# the catalog is kept next to the dataset; each new scrape is diffed against it
+# so only added, removed, renamed or re-priced products need any work.
+
+STATE_FILE = 'catalog_state5.json'
+ID_LENGTH = 12  # 48 bits: collision-free in practice up to millions of products
+RENAME_SIMILARITY = 0.8
+
+
+def product_id(unique_key):
+    return hashlib.sha1(unique_key.encode('utf-8')).hexdigest()[:ID_LENGTH]
+
+
+def snapshot(products):
+    """{product id: fields that matter for the dataset, the brain and the image map}."""
+    fields = ("key", "name", "brand", "model", "category", "price", "image", "raw_title", "raw_description")
+    return {p['id']: {k: p.get(k) for k in fields} for p in products}
+
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_state(path, products, **extra):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"products": snapshot(products), **extra}, f, indent=1, ensure_ascii=False)
+
+
+def _is_rename(old, new):
+    if old.get("image") and old.get("image") == new.get("image"):
+        return True
+    similarity = difflib.SequenceMatcher(None, old["name"].lower(), new["name"].lower()).ratio()
+    return old["brand"] == new["brand"] and similarity >= RENAME_SIMILARITY
+
+
+def diff_catalogs(old, new):
+    """Compares two snapshots ({id: product}); renames pair a removed and an added product."""
+    added = sorted(set(new) - set(old))
+    removed = sorted(set(old) - set(new))
+    common = sorted(set(old) & set(new))
+    price_changed = [pid for pid in common if old[pid]["price"] != new[pid]["price"]]
+    image_changed = [pid for pid in common if old[pid].get("image") != new[pid].get("image")]
+
+    renamed = []
+    for new_id in list(added):
+        for old_id in removed:
+            if _is_rename(old[old_id], new[new_id]):
+                renamed.append((old_id, new_id))
+                removed.remove(old_id)
+                added.remove(new_id)
+                break
+
+    touched = set(price_changed) | set(image_changed)
+    return {
+        "added": added,
+        "removed": removed,
+        "renamed": renamed,
+        "price_changed": price_changed,
+        "image_changed": image_changed,
+        "unchanged": [pid for pid in common if pid not in touched],
+    }
+
+
+def format_diff(diff, old, new):
+    lines = [f"   + {new[pid]['name']} [{new[pid]['price']}]" for pid in diff["added"]]
+    lines += [f"   - {old[pid]['name']}" for pid in diff["removed"]]
+    lines += [f"   ~ {old[o]['name']} -> {new[n]['name']}" for o, n in diff["renamed"]]
+    lines += [f"   $ {new[pid]['name']}: {old[pid]['price']} -> {new[pid]['price']}" for pid in diff["price_changed"]]
+    return "\n".join(lines)
+
+
+# ==========================================
+# TARGETED REFRESH (product_db)
+# ==========================================
+# The image map needs no counterpart: app.load_images rebuilds it from the
+# scrape on every load and hot reload (under a millisecond), so renamed and
+# re-imaged products are picked up as soon as the app reloads.
+def search_text(name, category, description, price):
+    """Same text ai_test5 builds for product_db['search_text']."""
+    return f"{name} {category} {description} {price}"
+
+
+def refresh_product_db(product_db, diff, new):
+    """Applies a diff to a brain's product_db: drop gone rows, patch prices, append new products."""
+    gone = set(diff["removed"]) | {o for o, _ in diff["renamed"]}
+    db = product_db[~product_db['product_id'].isin(gone)].copy()
+
+    changed = db['product_id'].isin(diff["price_changed"])
+    for idx in db.index[changed]:
+        p = new[db.at[idx, 'product_id']]
+        db.at[idx, 'price'] = p["price"]
+        db.at[idx, 'search_text'] = search_text(db.at[idx, 'product_name'], db.at[idx, 'category'],
+                                                db.at[idx, 'description'], p["price"])
+
+    fresh = diff["added"] + [n for _, n in diff["renamed"]]
+    rows = [{"product_id": pid, "product_name": new[pid]["name"], "category": new[pid]["category"],
+             "description": new[pid]["model"], "price": new[pid]["price"],
+             "search_text": search_text(new[pid]["name"], new[pid]["category"], new[pid]["model"], new[pid]["price"])}
+            for pid in fresh]
+    if rows:
+        db = pd.concat([db, pd.DataFrame(rows)], ignore_index=True)
+    return db.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    from createdata5 import load_products
+    parser = argparse.ArgumentParser(description="Diff two scrapes (scraping5.json format)")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    def read(path):
+        with open(path, encoding='utf-8') as f:
+            return snapshot(load_products(json.load(f)))
+
+    old, new = read(args.old), read(args.new)
+    diff = diff_catalogs(old, new)
+    print(format_diff(diff, old, new) or "   (no change)")
+    print(f"[Diff] +{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['renamed'])} renamed, "
+          f"{len(diff['price_changed'])} price changes, {len(diff['unchanged'])} unchanged")
@@ -0,0 +1,275 @@
+import os
+import sys
+import time
+import pickle
+import argparse
+from collections import Counter
+import numpy as np
+
+# ==========================================
+# CATEGORY ROUTING (pre-filter for the re-ranker)
+# ==========================================
+# classifierrr.py's TF-IDF + LinearSVC category model, trained on the
+# user_query of every relevant (query, product) pair in dataset_train5.csv,
+# plus the product texts, and calibrated so its scores are probabilities. At
+# search time the query is routed to the fewest categories whose probabilities
+# add up to ROUTE_COVERAGE (at most MAX_CATEGORIES). Only products in those
+# categories are scored. When no such set exists (e.g. "samsung" or "4g",
+# which span phones and modems) every product is scored, as before.
+#
+# Categories overlap (cables are sold under Accessoire_Audio, Accessoire_Charge
+# and General), so routing changes what /search shows: it trades agreement
+# with the full scan for recall on the labelled products. The evaluation
+# reports both, with the share of the full scan's displayed results (top
+# SERVE_TOP_K above the threshold) that routing keeps checked against
+# FULL_SCAN_RECALL_GATE. Routing is opt-in for that reason: the router is
+# built on demand, saved next to the brain (djezzy_ai_brain5.router.pkl, a
+# generated file kept out of git) only when it passes the gate, and app.py
+# only uses it with DJIBLY_ROUTING=1.
+#
+#   python category_router.py              (evaluate on held-out queries, then save if the gate passes)
+#   python category_router.py --force      (save even when it fails the gate)
+
+ROUTER_FORMAT = 1
+ROUTE_COVERAGE = 0.95
+MAX_CATEGORIES = 3
+EVAL_TOP_K = 5
+SERVE_TOP_K = 20                # app.DEFAULT_TOP_K
+FULL_SCAN_RECALL_GATE = 0.99    # Routed results must keep this much of what the full scan shows
+
+
+def router_path(base_file):
+    return os.path.splitext(base_file)[0] + ".router.pkl"
+
+
+class CategoryRouter:
+    def __init__(self, coverage=ROUTE_COVERAGE, max_categories=MAX_CATEGORIES):
+        self.coverage = coverage
+        self.max_categories = max_categories
+        # Imported here so app.py can import this module without sklearn (lite brains)
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.svm import LinearSVC
+        from sklearn.calibration import CalibratedClassifierCV
+        from sklearn.pipeline import Pipeline
+        # Char n-grams: queries are short and typo'd ("tabltte", "modme")
+        self.pipeline = Pipeline([
+            ('tfidf', TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), sublinear_tf=True)),
+            ('clf', CalibratedClassifierCV(LinearSVC(), method='sigmoid', cv=3))
+        ])
+        self.classes = None
+        self._rows = None  # category -> sorted catalog positions, set by bind()
+        self._n_products = 0
+
+    def fit(self, clean_queries, categories):
+        self.pipeline.fit(clean_queries, categories)
+        self.classes = list(self.pipeline.classes_)
+        self._compile()
+        return self
+
+    def _compile(self):
+        """Flattens the fitted pipeline into arrays: sklearn's per-call overhead is ~3 ms per query."""
+        vec, calibrated = self.pipeline[0], self.pipeline[-1]
+        self._analyzer = vec.build_analyzer()
+        self._vocabulary = vec.vocabulary_
+        self._idf = vec.idf_
+        folds = calibrated.calibrated_classifiers_
+        # One row per (fold, class): LinearSVC weights, and the sigmoid calibration on top of them
+        self._coef = np.vstack([f.estimator.coef_ for f in folds]).T.copy()
+        self._intercept = np.concatenate([f.estimator.intercept_ for f in folds])
+        self._a = np.concatenate([[c.a_ for c in f.calibrators] for f in folds])
+        self._b = np.concatenate([[c.b_ for c in f.calibrators] for f in folds])
+        self._n_folds = len(folds)
+
+    def predict_proba(self, clean_query):
+        """Same as self.pipeline.predict_proba([clean_query])[0] (TF-IDF, calibrated LinearSVC folds)."""
+        counts = Counter(i for i in map(self._vocabulary.get, self._analyzer(clean_query)) if i is not None)
+        decision = self._intercept.copy()
+        if counts:
+            idx = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+            weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))) * self._idf[idx]
+            decision += (weights / np.linalg.norm(weights)) @ self._coef[idx]
+        probs = (1 / (1 + np.exp(self._a * decision + self._b))).reshape(self._n_folds, -1)
+        total = probs.sum(axis=1, keepdims=True)
+        probs = np.divide(probs, total, out=np.full_like(probs, 1 / probs.shape[1]), where=total != 0)
+        return probs.mean(axis=0)
+
+    def route(self, clean_query):
+        """The categories to search, or None when the query is too ambiguous to prune anything."""
+        return self._route(self.predict_proba(clean_query))
+
+    def _route(self, probs):
+        order = np.argsort(-probs)
+        total = 0.0
+        for n, i in enumerate(order[:self.max_categories], 1):
+            total += probs[i]
+            if total >= self.coverage:
+                return [self.classes[j] for j in order[:n]]
+        return None
+
+    def bind(self, categories):
+        """Indexes a catalog's category column (product_db / ProductStore order)."""
+        categories = np.asarray(categories)
+        self._n_products = len(categories)
+        self._rows = {cat: np.flatnonzero(categories == cat) for cat in np.unique(categories)}
+
+    def restrict(self, clean_query, rows=None):
+        """Narrows candidate rows (None = whole catalog) to the routed categories.
+
+        Returns the rows unchanged when routing is uncertain or would leave
+        nothing to score.
+        """
+        categories = self.routed_categories(clean_query)
+        if categories is None:
+            return rows
+        allowed = np.concatenate([self._rows[c] for c in categories])
+        if rows is None:
+            return np.sort(allowed)
+        kept = rows[np.isin(rows, allowed)]
+        return kept if len(kept) else rows
+
+    def routed_categories(self, clean_query):
+        """route() limited to the bound catalog; None unless it prunes some but not all products."""
+        if self._rows is None or not clean_query:
+            return None
+        categories = [c for c in self.route(clean_query) or () if c in self._rows]
+        routed = sum(len(self._rows[c]) for c in categories)
+        return categories if 0 < routed < self._n_products else None
+
+    def save(self, path, report=None):
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump({"format": ROUTER_FORMAT, "pipeline": self.pipeline, "classes": self.classes,
+                         "coverage": self.coverage, "max_categories": self.max_categories, "report": report}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        if saved.get("format") != ROUTER_FORMAT:
+            raise ValueError(f"'{path}' is not a category router this version can read.")
+        router = cls(saved["coverage"], saved["max_categories"])
+        router.pipeline, router.classes = saved["pipeline"], saved["classes"]
+        router._compile()
+        return router
+
+
+# ==========================================
+# TRAINING DATA & EVALUATION
+# ==========================================
+def training_pairs(df):
+    """(clean query, category) for every relevant pair, plus each product's own text."""
+    from ai_test5 import preprocess_query, build_product_db
+    relevant = df[df['relevance_label'] == 1]
+    products = build_product_db(df)
+    queries = relevant['user_query'].map(preprocess_query).tolist() + \
+        products['product_name'].fillna('').str.lower().map(preprocess_query).tolist()
+    return queries, relevant['category'].tolist() + products['category'].tolist()
+
+
+def split_by_query(df, val_fraction=0.2, seed=42):
+    from ai_test5 import preprocess_query
+    clean = df['user_query'].map(preprocess_query)
+    queries = np.array(sorted(clean.unique()))
+    np.random.RandomState(seed).shuffle(queries)
+    held_out = clean.isin(set(queries[:int(len(queries) * val_fraction)]))
+    return df[~held_out], df[held_out]
+
+
+def evaluate(router, scorer, product_db, held_out, threshold=0.35, k=EVAL_TOP_K, serve_k=SERVE_TOP_K):
+    """Pruning and recall loss of routed scoring against a full scan, on held-out queries."""
+    from ai_test5 import preprocess_query
+    router.bind(product_db['category'])
+    relevant = held_out[held_out['relevance_label'] == 1]
+    positives = relevant.groupby(relevant['user_query'].map(preprocess_query))['product_id'].agg(set)
+    ids = product_db['product_id'].to_numpy()
+    categories = product_db['category'].to_numpy()
+
+    scored = fallbacks = correct = 0
+    recall_full, recall_routed, kept_results = [], [], []
+    route_s = 0.0
+    for q, wanted in positives.items():
+        t = time.perf_counter()
+        rows = router.restrict(q)
+        route_s += time.perf_counter() - t
+        full = scorer.predict_proba(q)
+        top_full = np.argsort(-full, kind='stable')[:k]
+        if rows is None:
+            fallbacks += 1
+            rows = np.arange(len(ids))
+            routed = full
+        else:
+            routed = np.full(len(ids), -1.0)
+            routed[rows] = scorer.predict_proba(q, rows)
+        top_routed = np.argsort(-routed, kind='stable')[:k]
+        scored += len(rows)
+        wanted_rows = np.flatnonzero(np.isin(ids, list(wanted)))
+        correct += set(categories[wanted_rows]) <= set(categories[rows])
+        recall_full.append(np.isin(ids[top_full], list(wanted)).sum() / min(k, len(wanted)))
+        recall_routed.append(np.isin(ids[top_routed], list(wanted)).sum() / min(k, len(wanted)))
+        # What /search shows: the full scan's top serve_k above the threshold
+        shown_full = np.argsort(-full, kind='stable')[:serve_k]
+        shown = set(shown_full[full[shown_full] > threshold].tolist())
+        if shown:
+            shown_routed = np.argsort(-routed, kind='stable')[:serve_k]
+            kept_results.append(len(shown & set(shown_routed.tolist())) / len(shown))
+
+    n = len(positives)
+    return {
+        "queries": n,
+        "pruned_fraction": 1 - scored / (n * len(ids)),
+        "fallback_rate": fallbacks / n,
+        "routing_accuracy": correct / n,
+        f"recall@{k}_full": float(np.mean(recall_full)),
+        f"recall@{k}_routed": float(np.mean(recall_routed)),
+        f"recall@{serve_k}_vs_full_scan": float(np.mean(kept_results)) if kept_results else 1.0,
+        "route_ms": route_s / n * 1000,
+    }
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    from ai_test5 import DATASET_FILE, MODEL_FILE
+    from brain_delta import load_package
+    from compiled_scorer import CompiledScorer
+    parser = argparse.ArgumentParser(description="Train and evaluate the query -> category router")
+    parser.add_argument("--dataset", default=DATASET_FILE)
+    parser.add_argument("--model", default=MODEL_FILE, help="Brain to evaluate against and save next to")
+    parser.add_argument("--coverage", type=float, default=ROUTE_COVERAGE)
+    parser.add_argument("--max-categories", type=int, default=MAX_CATEGORIES)
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--force", action="store_true", help="Save the router even when it fails the gate")
+    args = parser.parse_args()
+
+    try:
+        df = pd.read_csv(args.dataset)
+        package = load_package(args.model)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    product_db = package['database'].reset_index(drop=True)
+    scorer = CompiledScorer.from_pipeline(package['pipeline'], product_db['search_text'])
+
+    train, held_out = split_by_query(df, args.val_fraction)
+    router = CategoryRouter(args.coverage, args.max_categories).fit(*training_pairs(train))
+    report = evaluate(router, scorer, product_db, held_out)
+    print(f"[Router] {report['queries']} held-out queries, coverage {args.coverage}, "
+          f"up to {args.max_categories} categories")
+    print(f"   pruned {report['pruned_fraction']:.1%} of scored products, full-scan fallback on "
+          f"{report['fallback_rate']:.1%} of queries, routing accuracy {report['routing_accuracy']:.1%}")
+    print(f"   recall@{EVAL_TOP_K} of the labelled products: full scan {report[f'recall@{EVAL_TOP_K}_full']:.3f}, "
+          f"routed {report[f'recall@{EVAL_TOP_K}_routed']:.3f}; {report['route_ms']:.2f} ms/route")
+    kept = report[f"recall@{SERVE_TOP_K}_vs_full_scan"]
+    passed = kept >= FULL_SCAN_RECALL_GATE
+    print(f"   recall@{SERVE_TOP_K} against the full scan's results: {kept:.3f} "
+          f"(gate {FULL_SCAN_RECALL_GATE}) {'ok' if passed else 'FAILED'}")
+
+    if not passed and not args.force:
+        print("[ERROR] Router not saved: it fails the gate (--force saves it anyway).")
+        sys.exit(0 if args.no_save else 1)
+    if not args.no_save:
+        router = CategoryRouter(args.coverage, args.max_categories).fit(*training_pairs(df))
+        path = router_path(args.model)
+        router.save(path, report)
+        print(f"[SUCCESS] Router trained on all queries and saved to '{path}'")
@@ -0,0 +1,454 @@
+import re
+import time
+import struct
+import numpy as np
+
+# ==========================================
+# COMPILED SCORING ENGINE
+# ==========================================
+# The brain scores "QUERY | PRODUCT" strings with TF-IDF (word 1-3 grams,
+# l2 norm) followed by a logistic SGDClassifier. Running the pipeline means
+# re-tokenizing every product for every query. Because the model is linear,
+# the score can be split into parts that only depend on the product (computed
+# once here) and parts that only depend on the query (computed once per
+# request). The only terms touching both sides are the n-grams that span the
+# " | " join (last query words + first product words); those are resolved per
+# unique product "head" (its first two tokens).
+
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+
+def word_ngrams(tokens, ngram_range):
+    """Same n-gram expansion as sklearn's `_word_ngrams` (no stop words)."""
+    min_n, max_n = ngram_range
+    grams = []
+    n_tokens = len(tokens)
+    for n in range(min_n, max_n + 1):
+        for i in range(n_tokens - n + 1):
+            grams.append(" ".join(tokens[i:i + n]))
+    return grams
+
+
+def murmurhash3_32(key, seed=0, positive=False):
+    """Pure-Python MurmurHash3 (x86, 32-bit) of a str's UTF-8 bytes; same values as sklearn.utils.murmurhash3_32."""
+    data = key.encode('utf-8') if isinstance(key, str) else bytes(key)
+    h = seed & 0xFFFFFFFF
+    n_blocks = len(data) // 4
+    for (k,) in struct.iter_unpack("<I", data[:n_blocks * 4]):
+        k = (k * 0xCC9E2D51) & 0xFFFFFFFF
+        k = ((k << 15) | (k >> 17)) & 0xFFFFFFFF
+        h ^= (k * 0x1B873593) & 0xFFFFFFFF
+        h = ((h << 13) | (h >> 19)) & 0xFFFFFFFF
+        h = (h * 5 + 0xE6546B64) & 0xFFFFFFFF
+    tail = data[n_blocks * 4:]
+    if tail:
+        k = int.from_bytes(tail, "little")
+        k = (k * 0xCC9E2D51) & 0xFFFFFFFF
+        k = ((k << 15) | (k >> 17)) & 0xFFFFFFFF
+        h ^= (k * 0x1B873593) & 0xFFFFFFFF
+    h ^= len(data)
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h if positive or h < 0x80000000 else h - 0x100000000
+
+
+class HashedVocabulary:
+    """Term -> feature index for HashingVectorizer(alternate_sign=False) brains."""
+    hashed = True
+
+    def __init__(self, n_features, pure_python=False):
+        # sklearn's C hash is faster; the pure-Python one keeps the lite runtime free of sklearn
+        if pure_python:
+            self._hash = murmurhash3_32
+        else:
+            try:
+                from sklearn.utils import murmurhash3_32 as fast_hash
+                self._hash = fast_hash
+            except ImportError:
+                self._hash = murmurhash3_32
+        self.n_features = n_features
+
+    def __len__(self):
+        return self.n_features
+
+    def get(self, term, default=None):
+        # Same as sklearn's _hashing_fast: abs() of the signed 32-bit hash
+        return abs(self._hash(term, seed=0, positive=False)) % self.n_features
+
+
+class CompiledScorer:
+    def __init__(self, vocabulary, idf, coef, intercept, search_texts=None,
+                 ngram_range=(1, 3), token_pattern=DEFAULT_TOKEN_PATTERN, lowercase=True, state=None):
+        self.vocabulary = vocabulary
+        # Every n-gram has a feature in a hashed brain, so cross-join grams are hashed per query
+        self.hashed = getattr(vocabulary, "hashed", False)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(np.ravel(intercept)[0])
+        self.ngram_range = tuple(ngram_range)
+        self.lowercase = lowercase
+        self._token_re = re.compile(token_pattern)
+
+        if self.ngram_range[0] != 1:
+            raise ValueError("Compiled scoring needs ngram_range starting at 1.")
+
+        if state is not None:
+            self._load_state(state)
+        else:
+            self._compile_products(list(search_texts))
+        self._compile_prefixes()
+
+    @classmethod
+    def from_pipeline(cls, pipeline, search_texts):
+        """Builds a scorer from a (vectorizer, SGDClassifier) pipeline saved by ai_test5."""
+        if len(pipeline.steps) != 2:
+            raise ValueError("Compiled scoring needs a (vectorizer, classifier) pipeline.")
+        vec, clf = pipeline.steps[0][1], pipeline.steps[1][1]
+        hashed = not hasattr(vec, 'vocabulary_')
+
+        supported = (
+            getattr(vec, 'analyzer', None) == 'word' and vec.tokenizer is None and vec.preprocessor is None
+            and vec.stop_words is None and vec.strip_accents is None and not vec.binary and vec.norm == 'l2'
+            and getattr(clf, 'loss', None) == 'log_loss' and len(clf.classes_) == 2
+        )
+        if hashed:
+            supported = supported and hasattr(vec, 'n_features') and not vec.alternate_sign
+        else:
+            supported = supported and not vec.sublinear_tf and vec.use_idf
+        if not supported:
+            raise ValueError("Pipeline configuration is not supported by the compiled scorer.")
+
+        if hashed:
+            vocabulary, idf = HashedVocabulary(vec.n_features), np.ones(vec.n_features)
+        else:
+            vocabulary, idf = vec.vocabulary_, vec.idf_
+        return cls(vocabulary, idf, clf.coef_[0], clf.intercept_, search_texts,
+                   ngram_range=vec.ngram_range, token_pattern=vec.token_pattern,
+                   lowercase=vec.lowercase)
+
+    # --- Tokenization (mirrors TfidfVectorizer's word analyzer) ---
+    def tokenize(self, text):
+        if self.lowercase:
+            text = text.lower()
+        return self._token_re.findall(text)
+
+    def _weigh(self, grams):
+        """Maps n-grams to {feature index: tf * idf}, ignoring unknown n-grams."""
+        weights = {}
+        for g in grams:
+            idx = self.vocabulary.get(g)
+            if idx is not None:
+                weights[idx] = weights.get(idx, 0.0) + self.idf[idx]
+        return weights
+
+    # --- Product side (done once at load time) ---
+    def _compile_products(self, texts):
+        n = len(texts)
+        rows, cols, vals = [], [], []
+        head_index = {}
+        head_ids = np.empty(n, dtype=np.int64)
+
+        for r, text in enumerate(texts):
+            tokens = self.tokenize(str(text))
+            for idx, w in self._weigh(word_ngrams(tokens, self.ngram_range)).items():
+                rows.append(r)
+                cols.append(idx)
+                vals.append(w)
+            head = tuple(tokens[:2])
+            head_ids[r] = head_index.setdefault(head, len(head_index))
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        vals = np.asarray(vals, dtype=np.float64)
+
+        self.n_products = n
+        self.p_dot = np.bincount(rows, weights=vals * self.coef[cols], minlength=n)
+        self.p_sq = np.bincount(rows, weights=vals * vals, minlength=n)
+
+        # Postings (column-major) so product x query overlaps only touch query terms
+        order = np.argsort(cols, kind='stable')
+        cols_sorted = cols[order]
+        self._post_terms, starts = np.unique(cols_sorted, return_index=True)
+        self._post_ptr = np.append(starts, len(cols_sorted))
+        self._post_rows = rows[order]
+        self._post_vals = vals[order]
+
+        self._index_heads(list(head_index.keys()), head_ids)
+
+    def _index_heads(self, heads, head_ids):
+        self._heads = heads
+        self._head_ids = head_ids
+        self._heads_by_first = {}
+        for h, head in enumerate(self._heads):
+            if head:
+                self._heads_by_first.setdefault(head[0], []).append(h)
+        self._head_by_pair = {head: h for h, head in enumerate(self._heads) if len(head) == 2}
+
+        member_order = np.argsort(head_ids, kind='stable')
+        bounds = np.searchsorted(head_ids[member_order], np.arange(len(self._heads) + 1))
+        self._head_members = [member_order[bounds[h]:bounds[h + 1]] for h in range(len(self._heads))]
+
+    # --- Precompiled state (saved in the mmap brain so workers skip compilation) ---
+    STATE_ARRAYS = ("p_dot", "p_sq", "_post_terms", "_post_ptr", "_post_rows", "_post_vals", "_head_ids")
+
+    def export_state(self):
+        state = {name.lstrip("_"): getattr(self, name) for name in self.STATE_ARRAYS}
+        state["heads"] = [list(head) for head in self._heads]
+        return state
+
+    def _load_state(self, state):
+        for name in self.STATE_ARRAYS:
+            setattr(self, name, state[name.lstrip("_")])
+        self.n_products = len(self.p_dot)
+        self._index_heads([tuple(head) for head in state["heads"]], self._head_ids)
+
+    def _compile_prefixes(self):
+        """Indexes vocabulary bi/tri-grams by their leading words for cross n-gram lookup.
+
+        Nothing to build for a hashed brain (grams are hashed per query) or for
+        a vocabulary that answers grams_after itself (the mmap brain's sorted
+        terms, shared by every worker instead of copied into each).
+        """
+        self._prefixes = None
+        if self.hashed or hasattr(self.vocabulary, "grams_after"):
+            return
+        self._prefixes = {}
+        max_n = self.ngram_range[1]
+        for gram, idx in self.vocabulary.items():
+            parts = gram.split(" ")
+            for n in range(1, min(len(parts), max_n)):
+                self._prefixes.setdefault(tuple(parts[:n]), []).append((" ".join(parts[n:]), idx))
+
+    def _grams_after(self, words):
+        """[(remaining words as one string, feature index)] of the vocabulary n-grams starting with `words`."""
+        if self._prefixes is None:
+            return self.vocabulary.grams_after(words)
+        return self._prefixes.get(words, ())
+
+    def _postings(self, idx):
+        pos = np.searchsorted(self._post_terms, idx)
+        if pos < len(self._post_terms) and self._post_terms[pos] == idx:
+            lo, hi = self._post_ptr[pos], self._post_ptr[pos + 1]
+            return self._post_rows[lo:hi], self._post_vals[lo:hi]
+        return None, None
+
+    def _cross_weights(self, q_tokens, only=None):
+        """{head id: {feature index: weight}} for n-grams spanning the ' | ' join (heads in `only`, if given)."""
+        cross = {}
+        if not q_tokens or self.ngram_range[1] < 2:
+            return cross
+
+        def add(h, idx):
+            if only is not None and h not in only:
+                return
+            w = cross.setdefault(h, {})
+            w[idx] = w.get(idx, 0.0) + self.idf[idx]
+
+        if self.hashed:
+            get = self.vocabulary.get
+            last = q_tokens[-1]
+            for first, heads in self._heads_by_first.items():
+                idx2 = get(f"{last} {first}")
+                idx3 = get(f"{q_tokens[-2]} {last} {first}") if len(q_tokens) >= 2 and self.ngram_range[1] >= 3 else None
+                for h in heads:
+                    add(h, idx2)
+                    if idx3 is not None:
+                        add(h, idx3)
+            if self.ngram_range[1] >= 3:
+                for pair, h in self._head_by_pair.items():
+                    add(h, get(f"{last} {pair[0]} {pair[1]}"))
+            return cross
+
+        for rest, idx in self._grams_after((q_tokens[-1],)):
+            first, _, second = rest.partition(" ")
+            heads = self._heads_by_first.get(first)
+            if heads is None:
+                continue  # No product starts with that word
+            if not second:
+                for h in heads:
+                    add(h, idx)
+            else:
+                h = self._head_by_pair.get((first, second))
+                if h is not None:
+                    add(h, idx)
+
+        if len(q_tokens) >= 2 and self.ngram_range[1] >= 3:
+            for rest, idx in self._grams_after((q_tokens[-2], q_tokens[-1])):
+                if " " not in rest:
+                    for h in self._heads_by_first.get(rest, ()):
+                        add(h, idx)
+        return cross
+
+    @staticmethod
+    def _locate(rows, targets):
+        """Positions of `targets` in the scored subset, and which of them are in it."""
+        if rows is None:
+            return targets, None
+        pos = np.searchsorted(rows, targets)
+        hit = rows[np.minimum(pos, len(rows) - 1)] == targets
+        return pos[hit], hit
+
+    # --- Query side (done once per request) ---
+    def _parse_query(self, clean_query):
+        q_tokens = self.tokenize(str(clean_query))
+        q_weights = self._weigh(word_ngrams(q_tokens, self.ngram_range))
+        q_dot = sum(w * self.coef[i] for i, w in q_weights.items())
+        q_sq = sum(w * w for w in q_weights.values())
+        return q_tokens, q_weights, q_dot, q_sq
+
+    def vectorize(self, clean_query):
+        """Query-side features; can be passed back as `query=` to skip re-parsing."""
+        return self._parse_query(clean_query)
+
+    def _add_cross(self, q_tokens, q_weights, dot, sq, rows=None):
+        """Adds the n-grams spanning the join, shared by every product with the same head."""
+        # A shortlist only holds a few of the heads: skip the others before locating anything
+        present = None if rows is None else set(np.unique(self._head_ids[rows]).tolist())
+        for h, x_weights in self._cross_weights(q_tokens, present).items():
+            members, _ = self._locate(rows, self._head_members[h])
+            if len(members) == 0:
+                continue
+            x_dot = sum(w * self.coef[i] for i, w in x_weights.items())
+            x_sq = sum(w * w for w in x_weights.values())
+            x_q = sum(w * q_weights.get(i, 0.0) for i, w in x_weights.items())
+            dot[members] += x_dot
+            sq[members] += x_sq + 2.0 * x_q
+            for idx, xw in x_weights.items():
+                p_rows, vals = self._postings(idx)
+                if p_rows is not None:
+                    same_head = self._head_ids[p_rows] == h
+                    pos, hit = self._locate(rows, p_rows[same_head])
+                    vals = vals[same_head]
+                    sq[pos] += 2.0 * xw * (vals if hit is None else vals[hit])
+
+    def _finish(self, dot, sq):
+        norm = np.sqrt(sq)
+        scores = np.divide(dot, norm, out=np.zeros_like(dot), where=norm > 0)
+        return scores + self.intercept
+
+    def decision_function(self, clean_query, rows=None, query=None):
+        """Raw scores for every product, or only for `rows` (sorted, unique positions)."""
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            if len(rows) == 0:
+                return np.zeros(0)
+
+        q_tokens, q_weights, q_dot, q_sq = query if query is not None else self._parse_query(clean_query)
+
+        if rows is None:
+            dot = self.p_dot + q_dot
+            sq = self.p_sq + q_sq
+        else:
+            dot = self.p_dot[rows] + q_dot
+            sq = self.p_sq[rows] + q_sq
+
+        # Overlap between query terms and product terms
+        for idx, qw in q_weights.items():
+            p_rows, vals = self._postings(idx)
+            if p_rows is not None:
+                pos, hit = self._locate(rows, p_rows)
+                sq[pos] += 2.0 * qw * (vals if hit is None else vals[hit])
+
+        self._add_cross(q_tokens, q_weights, dot, sq, rows)
+        return self._finish(dot, sq)
+
+    def decision_function_many(self, clean_queries):
+        """(n_queries, n_products) raw scores, one pass over the batch's distinct terms."""
+        parsed = [self._parse_query(q) for q in clean_queries]
+        q_dot = np.array([p[2] for p in parsed], dtype=np.float64)
+        q_sq = np.array([p[3] for p in parsed], dtype=np.float64)
+
+        dot = q_dot[:, None] + self.p_dot[None, :]
+        sq = q_sq[:, None] + self.p_sq[None, :]
+
+        # Query x product overlaps, grouped by term so shared terms are gathered once
+        by_term = {}
+        for qi, (_, q_weights, _, _) in enumerate(parsed):
+            for idx, qw in q_weights.items():
+                queries, weights = by_term.setdefault(idx, ([], []))
+                queries.append(qi)
+                weights.append(qw)
+        for idx, (queries, weights) in by_term.items():
+            p_rows, vals = self._postings(idx)
+            if p_rows is not None:
+                sq[np.ix_(queries, p_rows)] += 2.0 * np.outer(weights, vals)
+
+        for qi, (q_tokens, q_weights, _, _) in enumerate(parsed):
+            self._add_cross(q_tokens, q_weights, dot[qi], sq[qi])
+        return self._finish(dot, sq)
+
+    def predict_proba(self, clean_query, rows=None, query=None):
+        """Probability of the 'match' class, in catalog order (or `rows` order)."""
+        return 1.0 / (1.0 + np.exp(-self.decision_function(clean_query, rows, query)))
+
+    def predict_proba_many(self, clean_queries):
+        """Match probabilities for a batch of queries, one row per query."""
+        return 1.0 / (1.0 + np.exp(-self.decision_function_many(clean_queries)))
+
+
+# ==========================================
+# PARITY & LATENCY CHECK
+# ==========================================
+def _synthetic_catalog(search_texts, size, seed=0):
+    """Mutates real product texts into a larger catalog with new model numbers."""
+    from createdata5 import mess_up_text
+    import random
+    rng = random.Random(seed)
+    random.seed(seed)
+    base = list(search_texts)
+    out = []
+    for i in range(size):
+        words = rng.choice(base).split()
+        words = [mess_up_text(w) if rng.random() < 0.2 else w for w in words]
+        words.insert(min(2, len(words)), f"X{i % 997}")
+        out.append(" ".join(words))
+    return out
+
+
+def _time_it(fn, queries, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for q in queries:
+            fn(q)
+        best = min(best, (time.perf_counter() - start) / len(queries))
+    return best * 1000
+
+
+if __name__ == "__main__":
+    import pickle
+    import random
+    from createdata5 import mess_up_text
+    from ai_test5 import preprocess_query, MODEL_FILE
+
+    with open(MODEL_FILE, 'rb') as f:
+        package = pickle.load(f)
+    pipeline = package['pipeline']
+    texts = package['database']['search_text'].tolist()
+
+    random.seed(42)
+    words = sorted({w for t in texts for w in t.lower().split()})
+    queries = ["tablette", "wifi d-link", "telephone zte", "kitman hoco", "modem 4g", "", "zte blade a35"]
+    queries += [" ".join(mess_up_text(random.choice(words)) for _ in range(random.randint(1, 3)))
+                for _ in range(200)]
+    clean = [preprocess_query(q) for q in queries]
+
+    for name, catalog in [("v5", texts), ("synthetic-50k", _synthetic_catalog(texts, 50000))]:
+        t0 = time.perf_counter()
+        scorer = CompiledScorer.from_pipeline(pipeline, catalog)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        def full_pipeline(q):
+            return pipeline.predict_proba([q + " | " + t for t in catalog])[:, 1]
+
+        sample = clean if name == "v5" else clean[:5]
+        max_err = max(np.abs(scorer.predict_proba(q) - full_pipeline(q)).max() for q in sample)
+
+        print(f"\n[{name}] {len(catalog)} products (compiled in {build_ms:.0f} ms)")
+        print(f"   Parity: max |compiled - pipeline| = {max_err:.2e} over {len(sample)} queries")
+        print(f"   Pipeline: {_time_it(full_pipeline, sample[:10], repeat=1):.2f} ms/query")
+        print(f"   Compiled: {_time_it(scorer.predict_proba, sample[:10]):.2f} ms/query")
+        assert max_err < 1e-9, "Compiled scorer diverged from the pipeline!"
@@ -1,8 +1,14 @@
+import os
+import io
 import json
 import csv
+import gzip
 import random
 import re
-import uuid
+import time
+import hashlib
+from multiprocessing import Pool
+from catalog_diff import STATE_FILE, product_id, load_state, save_state, snapshot, diff_catalogs, format_diff
 
 # ==========================================
 # CONFIGURATION
@@ -12,6 +18,12 @@ OUTPUT_FILE = 'dataset_train5.csv'  # Saving as the new version
 
 TARGET_DATASET_SIZE = 3500 
 
+# Sharded generator (--shards): products are processed in fixed blocks, each
+# with its own seeded RNG, so the output never depends on the worker count
+SHARD_DIR = 'dataset_train5_shards'
+BLOCK_PRODUCTS = 8
+HEADERS = ["product_id", "product_name", "category", "description", "price", "user_query", "relevance_label"]
+
 # Keep the boosting logic (It was good for balancing)
 # HIGH (15x): Tablets/Modems need to be visible
 HIGH_BOOST = ["Tablette", "Routeur_Modem"]
@@ -31,7 +43,7 @@ CATEGORY_KEYWORDS = {
 # ==========================================
 # 1. THE TYPO ENGINE (Simulating "Lazy User")
 # ==========================================
-def mess_up_text(text):
+def mess_up_text(text, rng=random):
     """
     Takes a clean word (e.g., 'tablette') and breaks it 
     like a human typing fast on a phone.
@@ -39,26 +51,26 @@ def mess_up_text(text):
     if len(text) < 3: return text # Don't mess up 2-letter words
     
     # 30% chance to return perfect text (Clean search)
-    if random.random() < 0.3:
+    if rng.random() < 0.3:
         return text
 
     chars = list(text)
-    action = random.choice(['delete', 'swap', 'duplicate', 'nothing'])
+    action = rng.choice(['delete', 'swap', 'duplicate', 'nothing'])
 
     try:
         if action == 'delete':
             # Remove one random character (e.g. 'tablette' -> 'tabltte')
-            idx = random.randint(0, len(chars) - 1)
+            idx = rng.randint(0, len(chars) - 1)
             del chars[idx]
         
         elif action == 'swap':
             # Swap two neighbor chars (e.g. 'wifi' -> 'wfii')
-            idx = random.randint(0, len(chars) - 2)
+            idx = rng.randint(0, len(chars) - 2)
             chars[idx], chars[idx+1] = chars[idx+1], chars[idx]
             
         elif action == 'duplicate':
             # Double a char (e.g. 'samsung' -> 'sammsung')
-            idx = random.randint(0, len(chars) - 1)
+            idx = rng.randint(0, len(chars) - 1)
             chars.insert(idx, chars[idx])
             
     except IndexError:
@@ -122,18 +134,8 @@ def extract_core_keywords(prod):
         
     return list(keywords)
 
-# ==========================================
-# 3. MAIN GENERATOR
-# ==========================================
-def create_dataset_v5():
-    try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            raw_data = json.load(f)
-    except FileNotFoundError:
-        print(f"[ERROR] {INPUT_FILE} not found.")
-        return
-
-    # --- Step 1: Deduplicate & Clean ---
+def load_products(raw_data):
+    """Deduplicated, cleaned products from the raw scraping records (IDs are stable across scrapes)."""
     products_map = {}
     for item in raw_data:
         brand = clean_text(item.get("title", ""))       
@@ -148,15 +150,87 @@ def create_dataset_v5():
         
         if unique_key not in products_map and unique_key != "":
             products_map[unique_key] = {
-                "id": str(uuid.uuid4())[:8],
+                "id": product_id(unique_key),
+                "key": unique_key,
                 "brand": brand,
                 "model": model,
                 "name": clean_name,
                 "category": get_category(clean_name),
-                "price": clean_price(item.get("price", "0 DA"))
+                "price": clean_price(item.get("price", "0 DA")),
+                "image": item.get("image"),
+                "raw_title": item.get("title", ""),
+                "raw_description": item.get("description", "")
             }
 
-    unique_products = list(products_map.values())
+    return list(products_map.values())
+
+def product_rows(prod, unique_products, base_rows, rng=random):
+    """Positive and negative training rows for one product."""
+    # Determine number of rows (Keeping your boosting logic)
+    if prod['category'] in HIGH_BOOST:
+        n_rows = base_rows * 15
+    elif prod['category'] in MEDIUM_BOOST:
+        n_rows = base_rows * 3
+    else:
+        n_rows = max(5, int(base_rows * 0.3)) 
+
+    # Get core words: ["samsung", "galaxy", "a55"] (sorted: set order changes between runs)
+    core_words = sorted(extract_core_keywords(prod))
+    
+    # --- POSITIVES (Matches) ---
+    n_pos = int(n_rows * 0.5)
+    for _ in range(n_pos):
+        # Pick a base word
+        base = rng.choice(core_words)
+        # Mess it up (Typo)
+        query = mess_up_text(base, rng)
+        
+        yield {
+            "product_id": prod['id'],
+            "product_name": prod['name'],
+            "category": prod['category'],
+            "description": prod['model'],
+            "price": prod['price'],
+            "user_query": query,
+            "relevance_label": 1 # MATCH
+        }
+
+    # --- NEGATIVES (Non-Matches) ---
+    n_neg = n_rows - n_pos
+    for _ in range(n_neg):
+        other = rng.choice(unique_products)
+        while other['id'] == prod['id']:
+            other = rng.choice(unique_products)
+
+        # Smart Negative:
+        # If I am selling a Tablet, I want to learn that "Samsung" (phone) is NOT me.
+        other_words = sorted(extract_core_keywords(other))
+        base = rng.choice(other_words)
+        query = mess_up_text(base, rng)
+
+        yield {
+            "product_id": prod['id'],
+            "product_name": prod['name'],
+            "category": prod['category'],
+            "description": prod['model'],
+            "price": prod['price'],
+            "user_query": query,
+            "relevance_label": 0 # NO MATCH
+        }
+
+# ==========================================
+# 3. MAIN GENERATOR
+# ==========================================
+def create_dataset_v5():
+    try:
+        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+            raw_data = json.load(f)
+    except FileNotFoundError:
+        print(f"[ERROR] {INPUT_FILE} not found.")
+        return
+
+    # --- Step 1: Deduplicate & Clean ---
+    unique_products = load_products(raw_data)
     print(f"[Init] Processed {len(unique_products)} unique products.")
 
     # --- Step 2: Generate Short & Messy Data ---
@@ -166,70 +240,221 @@ def create_dataset_v5():
     base_rows = max(10, TARGET_DATASET_SIZE // len(unique_products))
 
     for prod in unique_products:
-        # Determine number of rows (Keeping your boosting logic)
-        if prod['category'] in HIGH_BOOST:
-            n_rows = base_rows * 15
-        elif prod['category'] in MEDIUM_BOOST:
-            n_rows = base_rows * 3
-        else:
-            n_rows = max(5, int(base_rows * 0.3)) 
-
-        # Get core words: ["samsung", "galaxy", "a55"]
-        core_words = extract_core_keywords(prod)
-        
-        # --- POSITIVES (Matches) ---
-        n_pos = int(n_rows * 0.5)
-        for _ in range(n_pos):
-            # Pick a base word
-            base = random.choice(core_words)
-            # Mess it up (Typo)
-            query = mess_up_text(base)
-            
-            dataset_rows.append({
-                "product_id": prod['id'],
-                "product_name": prod['name'],
-                "category": prod['category'],
-                "description": prod['model'],
-                "price": prod['price'],
-                "user_query": query,
-                "relevance_label": 1 # MATCH
-            })
-
-        # --- NEGATIVES (Non-Matches) ---
-        n_neg = n_rows - n_pos
-        for _ in range(n_neg):
-            other = random.choice(unique_products)
-            while other['id'] == prod['id']:
-                other = random.choice(unique_products)
-
-            # Smart Negative:
-            # If I am selling a Tablet, I want to learn that "Samsung" (phone) is NOT me.
-            other_words = extract_core_keywords(other)
-            base = random.choice(other_words)
-            query = mess_up_text(base)
-
-            dataset_rows.append({
-                "product_id": prod['id'],
-                "product_name": prod['name'],
-                "category": prod['category'],
-                "description": prod['model'],
-                "price": prod['price'],
-                "user_query": query,
-                "relevance_label": 0 # NO MATCH
-            })
+        dataset_rows.extend(product_rows(prod, unique_products, base_rows))
 
     # --- Step 3: Save ---
     random.shuffle(dataset_rows)
     
-    headers = ["product_id", "product_name", "category", "description", "price", "user_query", "relevance_label"]
-    
     with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=headers)
+        writer = csv.DictWriter(f, fieldnames=HEADERS)
         writer.writeheader()
         writer.writerows(dataset_rows)
 
     print(f"[Done] Generated {len(dataset_rows)} rows in '{OUTPUT_FILE}'.")
     print(f"[Info] Queries are now short (1-2 words) and include realistic typos.")
 
+# ==========================================
+# 4. SHARDED GENERATOR (parallel, seeded, streaming)
+# ==========================================
+# Phase 1: each block of products streams its rows to per-shard spill files,
+#          picking a random shard per row (the "scatter" half of the shuffle).
+# Phase 2: each shard (total / n_shards rows) is shuffled in memory with its
+#          own seed and written out. Shards can be read in any order.
+_worker_products = None
+
+def _init_worker(products):
+    global _worker_products
+    _worker_products = products
+
+def _generate_block(task):
+    seed, block, base_rows, n_shards, spill_dir = task
+    rng = random.Random(f"{seed}:block:{block}")
+    start = block * BLOCK_PRODUCTS
+    paths = [os.path.join(spill_dir, f"block{block:05d}_shard{s:04d}.csv") for s in range(n_shards)]
+    files = [open(p, 'w', newline='', encoding='utf-8') for p in paths]
+    writers = [csv.writer(f) for f in files]
+    rows = 0
+    try:
+        for prod in _worker_products[start:start + BLOCK_PRODUCTS]:
+            for row in product_rows(prod, _worker_products, base_rows, rng):
+                writers[rng.randrange(n_shards)].writerow([row[h] for h in HEADERS])
+                rows += 1
+    finally:
+        for f in files:
+            f.close()
+    return rows
+
+def _write_shard(path, fmt, rows):
+    if fmt == "npz":
+        import numpy as np
+        columns = {h: np.array([r[i] for r in rows], dtype=str) for i, h in enumerate(HEADERS)}
+        columns["relevance_label"] = columns["relevance_label"].astype(np.int8)
+        np.savez_compressed(path, **columns)
+        return
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    writer.writerows(rows)
+    data = buffer.getvalue().encode('utf-8')
+    if fmt == "csv.gz":
+        with open(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0, filename='') as f:
+            f.write(data)  # mtime=0 and no name: byte-identical archives
+    else:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+def _shuffle_shard(task):
+    seed, shard, n_blocks, spill_dir, out_path, fmt = task
+    rows = []
+    for block in range(n_blocks):
+        spill = os.path.join(spill_dir, f"block{block:05d}_shard{shard:04d}.csv")
+        with open(spill, newline='', encoding='utf-8') as f:
+            rows.extend(csv.reader(f))
+        os.remove(spill)
+    random.Random(f"{seed}:shard:{shard}").shuffle(rows)
+    _write_shard(out_path, fmt, rows)
+    with open(out_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return {"file": os.path.basename(out_path), "rows": len(rows), "sha256": digest}
+
+def create_dataset_sharded(seed=0, n_shards=8, workers=None, scale=1, fmt="csv", out_dir=SHARD_DIR):
+    """Reproducible dataset written as shuffled shards; same seed -> byte-identical files."""
+    try:
+        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+            raw_data = json.load(f)
+    except FileNotFoundError:
+        print(f"[ERROR] {INPUT_FILE} not found.")
+        return
+
+    unique_products = load_products(raw_data)
+    base_rows = max(10, TARGET_DATASET_SIZE * scale // len(unique_products))
+    n_blocks = (len(unique_products) + BLOCK_PRODUCTS - 1) // BLOCK_PRODUCTS
+    spill_dir = os.path.join(out_dir, "_spill")
+    os.makedirs(spill_dir, exist_ok=True)
+    print(f"[Init] {len(unique_products)} products in {n_blocks} blocks -> {n_shards} shards ({fmt})")
+
+    ext = {"csv": ".csv", "csv.gz": ".csv.gz", "npz": ".npz"}[fmt]
+    with Pool(workers, initializer=_init_worker, initargs=(unique_products,)) as pool:
+        total = sum(pool.map(_generate_block, [(seed, b, base_rows, n_shards, spill_dir) for b in range(n_blocks)]))
+        shards = pool.map(_shuffle_shard, [(seed, s, n_blocks, spill_dir, os.path.join(out_dir, f"part-{s:04d}{ext}"), fmt)
+                                           for s in range(n_shards)])
+    os.rmdir(spill_dir)
+
+    manifest = {"seed": seed, "scale": scale, "format": fmt, "rows": total, "headers": HEADERS, "shards": shards}
+    with open(os.path.join(out_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"[Done] Generated {total} rows in {n_shards} shards under '{out_dir}'.")
+
+# ==========================================
+# 5. INCREMENTAL REBUILD (only changed products)
+# ==========================================
+# Rows of each product come from an RNG seeded with its ID, so a product's
+# rows do not depend on when it was generated. The previous scrape is kept in
+# catalog_state5.json; a new scrape is diffed against it and the dataset is
+# patched in one streaming pass: rows of removed/renamed products are dropped,
+# re-priced products get their price column updated (queries do not depend on
+# price) and only added/renamed products get new rows. An existing dataset
+# without a state file (e.g. the committed one) is never overwritten unless
+# --full is given.
+
+def _seeded_rows(prod, unique_products, base_rows, seed):
+    return product_rows(prod, unique_products, base_rows, random.Random(f"{seed}:{prod['id']}"))
+
+def update_dataset(seed=0, output=OUTPUT_FILE, state_file=STATE_FILE, full=False):
+    """Brings OUTPUT_FILE in line with INPUT_FILE, regenerating only what the scrape diff requires."""
+    start = time.perf_counter()
+    try:
+        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+            unique_products = load_products(json.load(f))
+    except FileNotFoundError:
+        print(f"[ERROR] {INPUT_FILE} not found.")
+        return
+    new = snapshot(unique_products)
+    by_id = {p['id']: p for p in unique_products}
+    state = None if full or not os.path.exists(output) else load_state(state_file)
+    if state is None and not full and os.path.exists(output):
+        print(f"[ERROR] No '{state_file}' to diff against; '{output}' was not built incrementally. "
+              f"Run once with --incremental --full to rebuild it and record the state.")
+        return
+    if state is not None and state.get("seed") != seed:
+        print(f"[ERROR] '{state_file}' was built with seed {state.get('seed')}, not {seed}. "
+              f"Use that seed or rebuild with --full.")
+        return
+
+    if state is None:
+        base_rows = max(10, TARGET_DATASET_SIZE // len(unique_products))
+        rows = [row for prod in unique_products for row in _seeded_rows(prod, unique_products, base_rows, seed)]
+        random.Random(seed).shuffle(rows)
+        with open(output, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=HEADERS)
+            writer.writeheader()
+            writer.writerows(rows)
+        save_state(state_file, unique_products, seed=seed, base_rows=base_rows)
+        print(f"[Done] Full build: {len(rows)} rows for {len(unique_products)} products "
+              f"in {time.perf_counter() - start:.2f}s.")
+        return {"full": True, "rows": len(rows)}
+
+    old, base_rows = state["products"], state["base_rows"]
+    diff = diff_catalogs(old, new)
+    gone = set(diff["removed"]) | {o for o, _ in diff["renamed"]}
+    repriced = set(diff["price_changed"])
+    kept = patched = dropped = 0
+
+    tmp = output + ".tmp"
+    with open(output, newline='', encoding='utf-8') as src, open(tmp, 'w', newline='', encoding='utf-8') as dst:
+        writer = csv.DictWriter(dst, fieldnames=HEADERS)
+        writer.writeheader()
+        for row in csv.DictReader(src):
+            pid = row['product_id']
+            if pid in gone:
+                dropped += 1
+                continue
+            if pid in repriced:
+                row['price'] = by_id[pid]['price']
+                patched += 1
+            else:
+                kept += 1
+            writer.writerow(row)
+        generated = 0
+        for pid in diff["added"] + [n for _, n in diff["renamed"]]:
+            for row in _seeded_rows(by_id[pid], unique_products, base_rows, seed):
+                writer.writerow(row)
+                generated += 1
+    os.replace(tmp, output)
+    save_state(state_file, unique_products, seed=seed, base_rows=base_rows)
+
+    elapsed = time.perf_counter() - start
+    total = kept + patched + generated
+    changes = format_diff(diff, old, new)
+    if changes:
+        print(changes)
+    print(f"[Diff] +{len(diff['added'])} added, -{len(diff['removed'])} removed, {len(diff['renamed'])} renamed, "
+          f"{len(diff['price_changed'])} re-priced, {len(diff['unchanged'])} unchanged")
+    print(f"[Rows] {kept} kept, {patched} price-patched, {dropped} dropped, {generated} generated "
+          f"-> {total} rows in {elapsed:.2f}s")
+    print(f"[Info] Skipped regenerating {kept + patched} of {total} rows "
+          f"({(kept + patched) / total:.0%}); {len(diff['unchanged'])}/{len(new)} products untouched.")
+    return {"full": False, "diff": diff, "kept": kept, "patched": patched, "dropped": dropped,
+            "generated": generated, "seconds": elapsed}
+
 if __name__ == "__main__":
-    create_dataset_v5()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate the Djibly v5 training dataset")
+    parser.add_argument("--shards", type=int, help="Parallel, seeded generator writing N shuffled shards")
+    parser.add_argument("--workers", type=int, help="Processes for --shards (default: all CPUs)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=int, default=1, help="Multiply TARGET_DATASET_SIZE")
+    parser.add_argument("--format", choices=["csv", "csv.gz", "npz"], default="csv",
+                        help="npz: compressed columnar arrays (one per column)")
+    parser.add_argument("--out-dir", default=SHARD_DIR)
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Diff {INPUT_FILE} against {STATE_FILE} and only regenerate changed products")
+    parser.add_argument("--full", action="store_true", help="With --incremental: rebuild everything")
+    args = parser.parse_args()
+
+    if args.incremental:
+        update_dataset(args.seed, full=args.full)
+    elif args.shards:
+        create_dataset_sharded(args.seed, args.shards, args.workers, args.scale, args.format, args.out_dir)
+    else:
+        create_dataset_v5()
\ No newline at end of file
@@ -0,0 +1,356 @@
+import os
+import io
+import json
+import time
+import hashlib
+import argparse
+import threading
+import urllib.request
+from collections import OrderedDict
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================================
+# LOCAL IMAGE THUMBNAIL CACHE (/img/<hash>)
+# ==========================================
+# Result cards used to load every picture from djezzy.dz (and the placeholder
+# from via.placeholder.com): third-party round trips that make the page slow
+# on shop Wi-Fi. `python image_cache.py` fetches every image scraping5.json
+# references once, shrinks it to card size (THUMB_SIZE, WebP, or JPEG when
+# Pillow has no WebP support) and stores it under the hash of its bytes:
+#
+#   image_cache5/index.json            source URL -> hash, hash -> file + content type
+#   image_cache5/<hash>.webp|.jpg      one file per distinct thumbnail
+#
+# app.py and asgi.py then serve /img/<hash> from disk, keeping the most
+# requested bodies in memory (BODY_CACHE_BYTES): a hash names exactly one
+# content, so a body read once never goes stale. Responses carry an ETag and
+# a year-long immutable Cache-Control: browsers ask once, ever, and a
+# revalidation gets a 304 without the file being touched. Products whose
+# image was not ingested keep their original URL; products without one get
+# the bundled static/placeholder.svg.
+#
+# Thumbnails need Pillow (requirements.txt). Without it, ingest falls back
+# to storing images as downloaded (the scraped ones are already ~150x200
+# thumbnails) after checking their magic bytes, and says so.
+# Re-running only fetches URLs the cache has not seen (--refresh redoes all).
+#
+#   python image_cache.py                             (fetch from the web)
+#   python image_cache.py --local-dir scraped_images  (same file names, no network)
+#   python image_cache.py --check                     (ingest from a local dir + /img responses, ETag/304 included)
+
+IMAGE_CACHE_DIR = "image_cache5"
+MANIFEST = "index.json"
+CACHE_FORMAT = 1
+THUMB_SIZE = (220, 220)     # .card-img is 220 px high
+THUMB_QUALITY = 80
+HASH_CHARS = 20
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 10
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+BODY_CACHE_BYTES = 32 * 1024 * 1024  # Thumbnail bodies kept in memory by ImageCache.response
+USER_AGENT = "DjiblyImageCache/1.0"
+
+EXTENSIONS = {"image/webp": ".webp", "image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif"}
+_MAGIC = [(b"\x89PNG\r\n\x1a\n", "image/png"), (b"\xff\xd8\xff", "image/jpeg"), (b"GIF87a", "image/gif"),
+          (b"GIF89a", "image/gif")]
+
+
+def manifest_path(directory):
+    return os.path.join(directory, MANIFEST)
+
+
+def sniff_image_type(data):
+    """Content type from the magic bytes, or None when data is not a PNG/JPEG/GIF/WebP image."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, content_type in _MAGIC:
+        if data.startswith(magic):
+            return content_type
+    return None
+
+
+def _atomic_write(path, data):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ImageCache:
+    """Read side of the cache: URL rewriting for the product store and /img/<hash> responses."""
+
+    def __init__(self, directory=IMAGE_CACHE_DIR, body_cache_bytes=BODY_CACHE_BYTES):
+        self.directory = directory      # None: an empty cache (engines built without one)
+        self.sources, self.files, self.version = {}, {}, None
+        self.body_cache_bytes = body_cache_bytes
+        self._bodies = OrderedDict()    # digest -> bytes, least recently served first
+        self._body_bytes = 0
+        self._lock = threading.Lock()
+        path = manifest_path(directory) if directory is not None else None
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                raw = f.read()
+            manifest = json.loads(raw)
+            if manifest.get("format") == CACHE_FORMAT:
+                self.sources, self.files = manifest["sources"], manifest["files"]
+                self.version = hashlib.sha1(raw).hexdigest()[:12]
+            else:
+                print(f"Ignoring '{path}': written by another version (re-run image_cache.py --refresh).")
+
+    def __len__(self):
+        return len(self.files)
+
+    def url_for(self, source_url):
+        digest = self.sources.get(source_url)
+        return f"/img/{digest}" if digest is not None else None
+
+    def localize(self, image_map):
+        """image_map with every ingested URL replaced by its /img/<hash> path."""
+        return {key: self.url_for(url) or url for key, url in image_map.items()}
+
+    def response(self, digest, if_none_match=""):
+        """(status, body, content_type, headers) for GET /img/<digest>."""
+        entry = self.files.get(digest)
+        if entry is None:
+            return 404, b"", None, []
+        etag = f'"{digest}"'
+        headers = [("ETag", etag), ("Cache-Control", CACHE_CONTROL)]
+        if if_none_match and any(t.strip() in (etag, f"W/{etag}", "*") for t in if_none_match.split(",")):
+            return 304, b"", entry["type"], headers
+        body = self._body(digest, entry["file"])
+        if body is None:
+            return 404, b"", None, []
+        return 200, body, entry["type"], headers
+
+    def _body(self, digest, name):
+        """The file's bytes, from memory when served before (None if it is gone from disk)."""
+        with self._lock:
+            body = self._bodies.get(digest)
+            if body is not None:
+                self._bodies.move_to_end(digest)
+                return body
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        if len(body) <= self.body_cache_bytes:
+            with self._lock:
+                if digest not in self._bodies:
+                    self._bodies[digest] = body
+                    self._body_bytes += len(body)
+                while self._body_bytes > self.body_cache_bytes:
+                    _, evicted = self._bodies.popitem(last=False)
+                    self._body_bytes -= len(evicted)
+        return body
+
+
+# ==========================================
+# INGESTION
+# ==========================================
+def source_urls(json_file):
+    """Distinct image URLs of a scraping JSON, in file order."""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    return list(dict.fromkeys(item["image"] for item in items if item.get("image")))
+
+
+def fetch(url, local_dir=None, timeout=FETCH_TIMEOUT):
+    """The image bytes, from local_dir (by file name) when given, else over HTTP(S) or file://."""
+    if local_dir is not None:
+        with open(os.path.join(local_dir, os.path.basename(urlparse(url).path)), 'rb') as f:
+            data = f.read(MAX_SOURCE_BYTES + 1)
+    else:
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            data = response.read(MAX_SOURCE_BYTES + 1)
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ValueError(f"larger than {MAX_SOURCE_BYTES // (1024 * 1024)} MB")
+    return data
+
+
+def have_pillow():
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def as_downloaded(data):
+    """(data, content type) unchanged: the fallback when Pillow is not installed."""
+    content_type = sniff_image_type(data)
+    if content_type is None:
+        raise ValueError("not a PNG, JPEG, GIF or WebP image")
+    return data, content_type
+
+
+def make_thumbnail(data, size=THUMB_SIZE, quality=THUMB_QUALITY):
+    """(bytes, content type) of a card-size thumbnail; as_downloaded(data) when Pillow is not installed."""
+    try:
+        from PIL import Image, features
+    except ImportError:
+        return as_downloaded(data)
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail(size, Image.LANCZOS)
+    out = io.BytesIO()
+    if features.check("webp"):
+        image.save(out, "WEBP", quality=quality, method=6)
+        return out.getvalue(), "image/webp"
+    if image.mode in ("RGBA", "LA", "P"):
+        # JPEG has no alpha: flatten onto the card's white background
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    image.convert("RGB").save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue(), "image/jpeg"
+
+
+def store(directory, data, content_type):
+    """Writes a thumbnail under the hash of its bytes (once); returns (digest, file name)."""
+    digest = hashlib.sha256(data).hexdigest()[:HASH_CHARS]
+    name = digest + EXTENSIONS.get(content_type, "")
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        _atomic_write(path, data)
+    return digest, name
+
+
+def ingest(json_file, directory=IMAGE_CACHE_DIR, local_dir=None, workers=FETCH_WORKERS, refresh=False):
+    """Fetches and thumbnails every image json_file references; returns a report dict."""
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    cache = ImageCache(directory)
+    sources = {} if refresh else dict(cache.sources)
+    files = {} if refresh else dict(cache.files)
+    urls = source_urls(json_file)
+    todo = [u for u in urls if u not in sources or sources[u] not in files]
+
+    def work(url):
+        try:
+            original = fetch(url, local_dir)
+            data, content_type = make_thumbnail(original)
+            digest, name = store(directory, data, content_type)
+            return url, digest, {"file": name, "type": content_type}, len(original), len(data), None
+        except Exception as e:
+            return url, None, None, 0, 0, e
+
+    fetched = failed = bytes_in = bytes_out = 0
+    with ThreadPoolExecutor(max(1, workers)) as pool:  # Fetching is network-bound: threads overlap the waits
+        for url, digest, entry, size_in, size_out, error in pool.map(work, todo):
+            if error is not None:
+                failed += 1
+                print(f"[ERROR] {url}: {error}")
+                continue
+            sources[url], files[digest] = digest, entry
+            fetched += 1
+            bytes_in += size_in
+            bytes_out += size_out
+
+    manifest = {"format": CACHE_FORMAT, "thumb_size": list(THUMB_SIZE), "sources": sources, "files": files}
+    _atomic_write(manifest_path(directory), json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+    return {"urls": len(urls), "fetched": fetched, "cached": len(urls) - len(todo), "failed": failed,
+            "files": len(files), "bytes_in": bytes_in, "bytes_out": bytes_out, "resized": have_pillow(),
+            "seconds": time.perf_counter() - start}
+
+
+# ==========================================
+# SELF-CHECK
+# ==========================================
+def _png(width, height, rgb):
+    """A solid-colour PNG built with zlib alone, so the check runs with or without Pillow."""
+    import zlib
+    import struct
+
+    def chunk(kind, payload):
+        return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload))
+    rows = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def check():
+    """ingest(local_dir=...) into a temp cache, then /img responses (200, ETag/304, 404); returns failures."""
+    import tempfile
+    results = []
+    with tempfile.TemporaryDirectory(prefix="djibly-images-") as workdir:
+        local_dir, cache_dir = os.path.join(workdir, "scraped"), os.path.join(workdir, "cache")
+        os.makedirs(local_dir)
+        files = {"red.png": _png(300, 400, (200, 0, 0)), "blue.png": _png(150, 200, (0, 0, 200)),
+                 "broken.jpg": b"<html>not an image</html>"}
+        for name, data in files.items():
+            with open(os.path.join(local_dir, name), 'wb') as f:
+                f.write(data)
+        base = "https://www.djezzy.dz/images/"
+        items = [{"image": base + name} for name in ["red.png", "blue.png", "red.png", "broken.jpg", "missing.png"]]
+        json_file = os.path.join(workdir, "scraping.json")
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump(items + [{"name": "no image"}], f)
+
+        first = ingest(json_file, cache_dir, local_dir, workers=2)
+        again = ingest(json_file, cache_dir, local_dir, workers=2)
+        results.append(("ingest --local-dir", (first["urls"], first["fetched"], first["failed"], first["files"]) == (4, 2, 2, 2)))
+        results.append(("re-run fetches only what failed", (again["cached"], again["fetched"], again["failed"]) == (2, 0, 2)))
+
+        cache = ImageCache(cache_dir)
+        red, blue = cache.sources.get(base + "red.png"), cache.sources.get(base + "blue.png")
+        results.append(("URLs rewritten to /img/<hash>", cache.url_for(base + "red.png") == f"/img/{red}"
+                        and cache.url_for(base + "broken.jpg") is None))
+        status, body, content_type, headers = cache.response(red)
+        headers = dict(headers)
+        with open(os.path.join(cache_dir, cache.files[red]["file"]), 'rb') as f:
+            on_disk = f.read()
+        results.append(("200 with ETag + immutable", status == 200 and body == on_disk
+                        and content_type == cache.files[red]["type"] and headers.get("ETag") == f'"{red}"'
+                        and headers.get("Cache-Control") == CACHE_CONTROL))
+        if have_pillow():
+            from PIL import Image
+            size = Image.open(io.BytesIO(body)).size
+            results.append(("resized to fit THUMB_SIZE", size[0] <= THUMB_SIZE[0] and size[1] <= THUMB_SIZE[1]))
+        etag = headers.get("ETag", "")
+        revalidated = [cache.response(red, tag)[:2] for tag in (etag, f"W/{etag}", f'"other", {etag}', "*")]
+        results.append(("If-None-Match -> 304, no body", all(r == (304, b"") for r in revalidated)))
+        results.append(("other ETag -> 200", cache.response(red, f'"{blue}"')[0] == 200))
+        results.append(("unknown hash -> 404", cache.response("0" * HASH_CHARS)[0] == 404))
+        for name in os.listdir(cache_dir):
+            if name != MANIFEST:
+                os.remove(os.path.join(cache_dir, name))
+        results.append(("served body kept in memory", cache.response(red)[:2] == (200, on_disk)
+                        and cache.response(blue)[0] == 404))
+
+        png = files["blue.png"]
+        try:
+            as_downloaded(files["broken.jpg"])
+            rejected = False
+        except ValueError:
+            rejected = True
+        results.append(("fallback without Pillow", as_downloaded(png) == (png, "image/png") and rejected))
+
+    for name, ok in results:
+        print(f"[Images] {name:<34} {'OK' if ok else 'FAILED'}")
+    return sum(not ok for _, ok in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch and thumbnail the catalog images for /img/<hash>")
+    parser.add_argument("--json", default="scraping5.json", help="Scraping file listing the image URLs")
+    parser.add_argument("--dir", default=os.environ.get("DJIBLY_IMAGE_CACHE", IMAGE_CACHE_DIR))
+    parser.add_argument("--local-dir", help="Read images from this directory (matched by file name) instead")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--refresh", action="store_true", help="Re-fetch every URL, not only new ones")
+    parser.add_argument("--check", action="store_true", help="Self-check on generated images in a temp dir")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(1 if check() else 0)
+
+    if not have_pillow():
+        print("[Images] Pillow is not installed: storing images as downloaded, not resized (pip install Pillow).")
+    report = ingest(args.json, args.dir, args.local_dir, args.workers, args.refresh)
+    print(f"[Images] {report['urls']} URLs: {report['fetched']} fetched, {report['cached']} already cached, "
+          f"{report['failed']} failed in {report['seconds']:.1f}s")
+    if report["fetched"]:
+        print(f"   {report['bytes_in'] / 1024:.0f} KB downloaded -> {report['bytes_out'] / 1024:.0f} KB of thumbnails; "
+              f"{report['files']} files in '{args.dir}'")
@@ -0,0 +1,312 @@
+import os
+import re
+import sys
+import json
+import time
+import numpy as np
+from compiled_scorer import CompiledScorer, HashedVocabulary, DEFAULT_TOKEN_PATTERN
+from brain_artifact import FlatColumn, FlatCatalog
+from candidate_index import CandidateIndex, DEFAULT_DEPTH
+from product_store import ProductStore
+from suggest import Suggester, SUGGEST_TOP_K
+from autocomplete import AutocompleteIndex, load_autocomplete, DEFAULT_COMPLETIONS
+from typo_correction import TypoCorrector, load_typo_corrector
+
+# ==========================================
+# SKLEARN-FREE INFERENCE RUNTIME (POS boxes)
+# ==========================================
+# Importing pandas + scikit-learn is most of the startup time of the Tk POS,
+# yet answering a query only needs the vocabulary, the IDF weights and the
+# logistic coefficients. `ai_test5.py --export-lite` (also run after every
+# training) writes those, the n-gram config, the synonyms preprocess_query
+# uses, the autocomplete and typo indexes and the catalog into one .npz next to the brain
+# (djezzy_ai_brain5.lite.npz, a generated file kept out of git), together
+# with CompiledScorer's precomputed product side. LiteBrain loads it with
+# NumPy alone, no pickle involved.
+#
+# The export records the brain_version() it was made from, so the POS can
+# ignore it once the brain or its delta changes.
+#
+#   python -m pytest test_lite_brain.py   (parity with the pipeline on createdata5 queries)
+#   python lite_brain.py --measure        (import-to-first-result time and peak RSS, pickle vs lite)
+
+LITE_FORMAT = 1
+CATALOG_COLUMNS = ["product_id", "product_name", "category", "description", "price", "search_text"]
+
+
+def lite_path(base_file):
+    return os.path.splitext(base_file)[0] + ".lite.npz"
+
+
+def preprocess_query(query, synonyms):
+    """ai_test5.preprocess_query without pandas: lowercase, drop punctuation, append synonyms."""
+    if query is None or (isinstance(query, float) and query != query):
+        return ""
+    text = str(query).lower().strip()
+    text = re.sub(r'[^\w\s]', '', text)
+
+    expanded = []
+    for w in text.split():
+        expanded.append(w)
+        if w in synonyms:
+            expanded.append(synonyms[w])
+    return " ".join(expanded)
+
+
+def _flat(values):
+    """A text column as one UTF-8 blob + row offsets (brain_artifact's FlatColumn layout)."""
+    encoded = [("" if v is None or v != v else str(v)).encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def export_lite(path, pipeline, product_db, synonyms, base_version=None, scorer=None):
+    """Writes the .lite.npz for a trained pipeline; raises ValueError if CompiledScorer cannot run it."""
+    if scorer is None:
+        scorer = CompiledScorer.from_pipeline(pipeline, product_db['search_text'])
+    vec = pipeline.steps[0][1]
+    arrays = {"coef": scorer.coef}
+    if not scorer.hashed:
+        # Terms in feature-index order, so the index is the position
+        terms = sorted(vec.vocabulary_, key=vec.vocabulary_.get)
+        arrays["vocab_terms"], _ = _flat(["\n".join(terms)])
+        arrays["idf"] = scorer.idf
+
+    state = scorer.export_state()
+    heads = state.pop("heads")
+    for name, array in state.items():
+        arrays[f"scorer_{name}"] = np.asarray(array)
+    for col in CATALOG_COLUMNS:
+        arrays[f"catalog_{col}"], arrays[f"catalog_{col}_idx"] = _flat(product_db[col].tolist())
+
+    meta = {
+        "format": LITE_FORMAT,
+        "base_version": base_version,
+        "ngram_range": list(scorer.ngram_range),
+        "token_pattern": vec.token_pattern or DEFAULT_TOKEN_PATTERN,
+        "lowercase": scorer.lowercase,
+        "intercept": scorer.intercept,
+        "hash_features": scorer.vocabulary.n_features if scorer.hashed else None,
+        "synonyms": dict(synonyms),
+        "columns": CATALOG_COLUMNS,
+        "heads": heads,
+    }
+    arrays["meta"] = np.array(json.dumps(meta, ensure_ascii=False))
+    arrays["autocomplete"] = _json_array(AutocompleteIndex.build(product_db, synonyms).state())
+    arrays["typos"] = _json_array(TypoCorrector.build(product_db, synonyms).state())
+
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def _json_array(state):
+    """A JSON-safe state as UTF-8 bytes: as a NumPy str it would take 4 bytes per character."""
+    return np.frombuffer(json.dumps(state, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+
+
+def _read_json_array(arrays, name):
+    return json.loads(bytes(arrays[name]).decode('utf-8')) if name in arrays else None
+
+
+def is_lite_brain(path):
+    return path.endswith(".lite.npz") and os.path.isfile(path)
+
+
+def exported_version(path):
+    """brain_version() of the brain a .lite.npz was exported from (reads only its metadata)."""
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(str(data["meta"])).get("base_version")
+
+
+class LiteBrain:
+    """A .lite.npz export: compiled scorer, catalog and query preprocessing, without sklearn or pandas."""
+
+    def __init__(self, path, retrieval_depth=DEFAULT_DEPTH, typo_correction=False):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        meta = json.loads(str(arrays.pop("meta")))
+        if meta.get("format") != LITE_FORMAT:
+            raise ValueError(f"'{path}' is not a lite brain this version can read.")
+        self.base_version = meta["base_version"]
+        self.synonyms = meta["synonyms"]
+        self.retrieval_depth = retrieval_depth
+
+        if meta["hash_features"]:
+            vocabulary = HashedVocabulary(meta["hash_features"], pure_python=True)
+            idf = np.ones(meta["hash_features"])
+        else:
+            terms = bytes(arrays["vocab_terms"]).decode('utf-8').split("\n")
+            vocabulary, idf = {t: i for i, t in enumerate(terms)}, arrays["idf"]
+        state = {name.lstrip("_"): arrays[f"scorer_{name.lstrip('_')}"] for name in CompiledScorer.STATE_ARRAYS}
+        state["heads"] = meta["heads"]
+        self.scorer = CompiledScorer(vocabulary, idf, arrays["coef"], meta["intercept"],
+                                     ngram_range=meta["ngram_range"], token_pattern=meta["token_pattern"],
+                                     lowercase=meta["lowercase"], state=state)
+
+        self.catalog = FlatCatalog({col: FlatColumn(arrays[f"catalog_{col}"], arrays[f"catalog_{col}_idx"])
+                                    for col in meta["columns"]})
+        self.product_id = self.catalog["product_id"].tolist()
+        self.store = ProductStore(self.catalog)
+        self.retriever = CandidateIndex.from_database(self.catalog, self.scorer.predict_proba(""))
+        self.typos = None
+        if typo_correction:
+            self.typos = load_typo_corrector(_read_json_array(arrays, "typos"), self.catalog, self.synonyms, vocabulary)
+        self.suggester = Suggester(self.scorer, self.catalog["search_text"], self.clean, self.synonyms,
+                                   self.retriever, retrieval_depth)
+        self.autocomplete = load_autocomplete(_read_json_array(arrays, "autocomplete"), self.catalog, self.synonyms)
+
+    def preprocess(self, query):
+        return preprocess_query(query, self.synonyms)
+
+    def clean(self, query):
+        """preprocess(), after typo correction when it is on (see typo_correction.py)."""
+        if self.typos is not None:
+            query = self.typos.correct(query)
+        return self.preprocess(query)
+
+    def score(self, clean_query):
+        """Match probability of every product (0 outside the retriever's shortlist)."""
+        rows = self.retriever.candidates(clean_query, self.retrieval_depth)
+        if rows is None:
+            return self.scorer.predict_proba(clean_query)
+        full = np.zeros(len(self.store))
+        full[rows] = self.scorer.predict_proba(clean_query, rows)
+        return full
+
+    def search(self, user_query, top_k=15, threshold=0.0):
+        """The best products as dicts (product_db columns + ai_score), best first."""
+        probs = self.score(self.clean(user_query))
+        best = self.store.top_k(probs, top_k, threshold)
+        return self._rows(best, probs[best])
+
+    def suggest(self, user_query, top_k=SUGGEST_TOP_K, threshold=0.0):
+        """search() for a query still being typed (its last word is completed, see suggest.py)."""
+        rows, probs = self.suggester.score(user_query)
+        best = self.store.top_k(probs, top_k, threshold)
+        return self._rows(best if rows is None else rows[best], probs[best])
+
+    def complete(self, text, n=DEFAULT_COMPLETIONS):
+        """Keyword completions of text (see autocomplete.py)."""
+        return self.autocomplete.complete(text, n)
+
+    def _rows(self, rows, scores):
+        return [{"product_id": self.product_id[i], "product_name": self.store.product_name[i],
+                 "category": self.store.category[i], "description": self.store.description[i],
+                 "price": self.store.price[i], "ai_score": float(p)} for i, p in zip(rows, scores)]
+
+
+# ==========================================
+# PARITY QUERIES & STARTUP MEASUREMENT
+# ==========================================
+EDGE_QUERIES = [None, float("nan"), "", "   ", "Modem Wifi!!", "ROUTEUR D-LINK", "hètf", "Tel 4G ?",
+                "kitman, hoco", "  tab   ipad  ", "zte_blade a35", "cable type-c usb", "jawl pas cher"]
+
+
+def createdata5_queries(n, seed=7):
+    """Queries drawn the way createdata5 draws training queries (typo'd core words), with another seed."""
+    import random
+    import createdata5
+    with open(createdata5.INPUT_FILE, 'r', encoding='utf-8') as f:
+        products = createdata5.load_products(json.load(f))
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < n:
+        prod = rng.choice(products)
+        queries.extend(row["user_query"] for row in createdata5.product_rows(prod, products, 1, rng))
+    rng.shuffle(queries)
+    return queries[:n]
+
+
+def _hashed_pipeline(dataset_file, n_features=2 ** 18, rows=20000):
+    """A small HashingVectorizer brain, so the pure-Python murmurhash path is checked end to end."""
+    import pandas as pd
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.pipeline import Pipeline
+    from ai_test5 import build_features
+    df = pd.read_csv(dataset_file, nrows=rows)
+    pipeline = Pipeline([
+        ('hash', HashingVectorizer(analyzer='word', ngram_range=(1, 3), n_features=n_features,
+                                   alternate_sign=False, norm='l2')),
+        ('clf', SGDClassifier(loss='log_loss', penalty='l2', alpha=1e-4, random_state=42))
+    ])
+    return pipeline.fit(build_features(df), df['relevance_label'])
+
+
+_FIRST_RESULT = {
+    # What tkinter_interface5 did at startup before the lite export existed
+    "pickle": (
+        "import pandas, sklearn\n"
+        "from brain_delta import load_package\n"
+        "from compiled_scorer import CompiledScorer\n"
+        "from candidate_index import CandidateIndex\n"
+        "from ai_test5 import preprocess_query\n"
+        "package = load_package({path!r})\n"
+        "db = package['database']\n"
+        "scorer = CompiledScorer.from_pipeline(package['pipeline'], db['search_text'])\n"
+        "retriever = CandidateIndex.from_database(db, scorer.predict_proba(''))\n"
+        "q = preprocess_query({query!r})\n"
+        "scorer.predict_proba(q, retriever.candidates(q))\n"
+    ),
+    "lite": (
+        "from lite_brain import LiteBrain\n"
+        "LiteBrain({path!r}).search({query!r})\n"
+    ),
+}
+
+
+def _first_result(kind, path, query):
+    """(seconds from interpreter start to first result, peak RSS MiB, sklearn/pandas imported) in a fresh process."""
+    import subprocess
+    # VmHWM, not ru_maxrss: the latter survives exec and would report this (parent) process's peak
+    code = ("import time, sys\nstart = time.perf_counter()\n"
+            + _FIRST_RESULT[kind].format(path=path, query=query)
+            + "seconds = time.perf_counter() - start\n"
+              "hwm = [l.split()[1] for l in open('/proc/self/status') if l.startswith('VmHWM:')][0]\n"
+              "print(seconds, int(hwm) / 1024, 'sklearn' in sys.modules or 'pandas' in sys.modules)\n")
+    t = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+    return time.perf_counter() - t, float(out[0]), float(out[1]), out[2] == "True"
+
+
+def measure(model_file, lite_file, query="modem wifi", repeat=3):
+    report = {}
+    for kind, path in [("pickle", model_file), ("lite", lite_file)]:
+        runs = [_first_result(kind, path, query) for _ in range(repeat)]
+        report[kind] = {"process_s": min(r[0] for r in runs), "first_result_s": min(r[1] for r in runs),
+                        "peak_rss_mib": max(r[2] for r in runs), "imports_sklearn_or_pandas": runs[0][3]}
+        r = report[kind]
+        print(f"   {kind:<7} import -> first result {r['first_result_s'] * 1000:7.0f} ms   "
+              f"(process {r['process_s'] * 1000:5.0f} ms)   peak RSS {r['peak_rss_mib']:6.1f} MiB   "
+              f"sklearn/pandas imported: {'yes' if r['imports_sklearn_or_pandas'] else 'no'}")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sklearn-free inference runtime for the POS")
+    parser.add_argument("--model", default="djezzy_ai_brain5.pkl")
+    parser.add_argument("--lite", help="Lite export to measure (default: next to --model)")
+    parser.add_argument("--measure", action="store_true", help="Startup time and peak RSS, pickle vs lite")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    if not args.measure:
+        parser.error("nothing to do: use --measure (parity: python -m pytest test_lite_brain.py)")
+
+    report = {}
+    if args.measure:
+        lite_file = args.lite or lite_path(args.model)
+        if not os.path.exists(lite_file):
+            print(f"[ERROR] '{lite_file}' not found. Run `python ai_test5.py --export-lite` first.")
+            sys.exit(1)
+        print(f"[Lite] first search on '{args.model}' vs '{lite_file}', best of {args.repeat}")
+        report["startup"] = measure(args.model, lite_file, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    sys.exit(0)
@@ -0,0 +1,252 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from createdata5 import INPUT_FILE, load_products, extract_core_keywords, mess_up_text
+from bench_serving import SERVERS, percentile, _free_port, _wait_ready
+
+# ==========================================
+# LOAD REPLAY FOR POST /search
+# ==========================================
+# Replays a query log (JSONL: {"query": "..."} or a bare JSON string per line)
+# against app:app, in-process through Flask's test client or over HTTP against
+# a gunicorn started here (one run per --workers value) or an existing --url.
+#
+#   closed loop (default)  --concurrency N clients, each sends as soon as its
+#                          previous request returns
+#   open loop              --rate R requests/s with Poisson arrivals; latency
+#                          is counted from the scheduled send time, so time
+#                          spent waiting for a free client shows up as latency
+#
+# Requests sent during the first --warmup seconds are excluded from the report.
+#
+#   python load_replay.py --synthesize 10000 --out queries.jsonl
+#   python load_replay.py queries.jsonl --target gunicorn --workers 1 2 4 --rate 200
+
+RESULT_COUNT_BUCKETS = [(0, 0), (1, 5), (6, 10), (11, 20), (21, None)]
+
+
+# ==========================================
+# 1. QUERY LOGS
+# ==========================================
+def read_log(path):
+    queries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            queries.append(entry["query"] if isinstance(entry, dict) else str(entry))
+    return queries
+
+
+def synthesize_log(n, zipf_s=1.1, typo_rate=0.3, seed=0, input_file=INPUT_FILE):
+    """n queries over the v5 catalog keywords; keyword popularity follows Zipf(s)."""
+    rng = random.Random(seed)
+    random.seed(seed)  # mess_up_text uses the global RNG
+    with open(input_file, 'r', encoding='utf-8') as f:
+        products = load_products(json.load(f))
+    keywords = sorted({k for prod in products for k in extract_core_keywords(prod) if k})
+    rng.shuffle(keywords)  # Popularity rank is independent of alphabetical order
+    weights = [1.0 / (rank ** zipf_s) for rank in range(1, len(keywords) + 1)]
+    picks = rng.choices(keywords, weights=weights, k=n)
+    return [mess_up_text(q) if rng.random() < typo_rate else q for q in picks]
+
+
+def write_log(path, queries):
+    with open(path, 'w', encoding='utf-8') as f:
+        for q in queries:
+            f.write(json.dumps({"query": q}, ensure_ascii=False) + "\n")
+
+
+# ==========================================
+# 2. TRANSPORTS (one per client thread)
+# ==========================================
+class InProcessClient:
+    def __init__(self):
+        import app
+        self.client = app.app.test_client()
+
+    def search(self, query):
+        resp = self.client.post('/search', json={"query": query})
+        return resp.status_code, resp.get_json(silent=True)
+
+    def close(self):
+        pass
+
+
+class HTTPClient:
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+
+    def search(self, query):
+        try:
+            self.conn.request("POST", "/search", json.dumps({"query": query}), {"Content-Type": "application/json"})
+            resp = self.conn.getresponse()
+            body = resp.read()
+        except OSError:
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            return "error", None
+        try:
+            return resp.status, json.loads(body)
+        except ValueError:
+            return resp.status, None
+
+    def close(self):
+        self.conn.close()
+
+
+# ==========================================
+# 3. REPLAY
+# ==========================================
+def replay(make_client, queries, concurrency, duration, rate=None, warmup=0.0, seed=0):
+    """Sends queries in log order (looping) for warmup + duration seconds; returns the samples."""
+    rng = random.Random(seed)
+    total = warmup + duration
+    start = time.perf_counter() + 0.1
+    if rate:
+        # Open loop: the arrival schedule is fixed up front, whatever the server does
+        schedule, t = [], 0.0
+        while t < total:
+            schedule.append(start + t)
+            t += rng.expovariate(rate)
+    samples = []  # (scheduled offset, latency, status, result count)
+    lock = threading.Lock()
+    next_index = [0]
+
+    def client_loop():
+        client = make_client()
+        try:
+            while True:
+                with lock:
+                    i = next_index[0]
+                    next_index[0] += 1
+                if rate:
+                    if i >= len(schedule):
+                        return
+                    send_at = schedule[i]
+                    delay = send_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                else:
+                    send_at = time.perf_counter()
+                    if send_at - start >= total:
+                        return
+                status, body = client.search(queries[i % len(queries)])
+                done = time.perf_counter()
+                count = len(body) if isinstance(body, list) else None
+                with lock:
+                    samples.append((send_at - start, done - send_at, status, count))
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=client_loop, daemon=True) for _ in range(concurrency)]
+    wait = start - time.perf_counter()
+    if wait > 0:
+        time.sleep(wait)
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return [s for s in samples if s[0] >= warmup]
+
+
+def summarize(samples, duration):
+    latencies = sorted(s[1] for s in samples)
+    errors = sum(1 for s in samples if s[2] != 200)
+    counts = [s[3] for s in samples if s[2] == 200 and s[3] is not None]
+    distribution = {}
+    for lo, hi in RESULT_COUNT_BUCKETS:
+        label = str(lo) if lo == hi else (f"{lo}+" if hi is None else f"{lo}-{hi}")
+        distribution[label] = sum(1 for c in counts if c >= lo and (hi is None or c <= hi))
+    return {
+        "requests": len(samples),
+        "throughput_rps": (len(samples) - errors) / duration,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "mean_results": sum(counts) / len(counts) if counts else 0.0,
+        "result_counts": distribution,
+    }
+
+
+def _print_summary(label, stats):
+    print(f"{label:<22} {stats['throughput_rps']:8.1f} req/s   p50={stats['p50_ms']:7.1f}  "
+          f"p95={stats['p95_ms']:7.1f}  p99={stats['p99_ms']:8.1f} ms   errors={stats['error_rate']:.1%}   "
+          f"results={stats['result_counts']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a query log against POST /search")
+    parser.add_argument("log", nargs="?", help="JSONL query log to replay")
+    parser.add_argument("--synthesize", type=int, metavar="N", help="Write a synthetic Zipf log of N queries")
+    parser.add_argument("--out", default="queries.jsonl", help="Output file for --synthesize")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent of keyword popularity")
+    parser.add_argument("--typo-rate", type=float, default=0.3)
+    parser.add_argument("--target", choices=["inprocess", "gunicorn"], default="inprocess")
+    parser.add_argument("--url", help="Replay against an already running server (host:port)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="gunicorn worker counts to try")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, help="Open-loop arrival rate (requests/s)")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        write_log(args.out, synthesize_log(args.synthesize, args.zipf_s, args.typo_rate, args.seed))
+        print(f"[SUCCESS] {args.synthesize} queries written to '{args.out}'")
+        if not args.log:
+            sys.exit(0)
+    if not args.log:
+        parser.error("a query log (or --synthesize) is required")
+
+    queries = read_log(args.log)
+    mode = f"open loop {args.rate:g} req/s" if args.rate else f"closed loop x{args.concurrency}"
+    print(f"[Replay] {len(queries)} queries from '{args.log}', {mode}, "
+          f"{args.warmup:g}s warmup + {args.duration:g}s")
+
+    def run(label, make_client):
+        stats = summarize(replay(make_client, queries, args.concurrency, args.duration,
+                                 args.rate, args.warmup, args.seed), args.duration)
+        stats.update(target=label, concurrency=args.concurrency, rate=args.rate)
+        _print_summary(label, stats)
+        return stats
+
+    report = []
+    if args.url:
+        host, _, port = args.url.replace("http://", "").rstrip("/").partition(":")
+        report.append(run(args.url, lambda: HTTPClient(host, int(port or 80))))
+    elif args.target == "inprocess":
+        import app  # Load the brain before the clock starts
+        report.append(run("inprocess", InProcessClient))
+    else:
+        for workers in args.workers:
+            port = _free_port()
+            cmd = [part.format(port=port) for part in SERVERS["gunicorn"]] + ["--workers", str(workers)]
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                if not _wait_ready(port):
+                    print(f"[ERROR] gunicorn with {workers} workers did not start")
+                    continue
+                stats = run(f"gunicorn workers={workers}", lambda: HTTPClient("127.0.0.1", port))
+                stats["workers"] = workers
+                report.append(stats)
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,116 @@
+import sys
+import numpy as np
+
+# ==========================================
+# COLUMNAR PRODUCT STORE (request hot path)
+# ==========================================
+# The unpickled `database` DataFrame is converted once, when the model loads,
+# into read-only NumPy columns with the image URL already resolved. A search
+# then only touches the score vector and the k winning rows: no DataFrame
+# copy, no extra column, no full sort, no iterrows().
+
+PLACEHOLDER_IMAGE = "/static/placeholder.svg"  # Bundled: no third-party request for missing pictures
+COLUMNS = ("product_name", "price", "category", "description")
+
+
+def image_key(product_name):
+    """Normalized key used by app.load_images (lowercase, no spaces)."""
+    return str(product_name).lower().replace(" ", "")
+
+
+def _frozen(values):
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    column.flags.writeable = False
+    return column
+
+
+class ProductStore:
+    __slots__ = ("size", "product_name", "price", "category", "description", "image")
+
+    def __init__(self, product_db, image_map=None, placeholder=PLACEHOLDER_IMAGE):
+        image_map = image_map or {}
+        self.size = len(product_db)
+        for col in COLUMNS:
+            setattr(self, col, _frozen(product_db[col].tolist()))
+        self.image = _frozen([image_map.get(image_key(n), placeholder) for n in self.product_name])
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def top_k(probs, k, threshold):
+        """Positions (into `probs`) of the k best scores above threshold, best first."""
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        above = np.flatnonzero(probs > threshold)
+        if len(above) > k:
+            # Keep every product tied with the k-th best: catalog order decides which of them make the cut
+            kth = np.partition(probs[above], len(above) - k)[len(above) - k]
+            above = above[probs[above] >= kth]
+        # Best score first, catalog order among equal scores
+        return above[np.lexsort((above, -probs[above]))][:k]
+
+    def records(self, rows, probs):
+        """Response dicts for catalog `rows`, same shape as the original /search JSON."""
+        return [{
+            "name": self.product_name[r],
+            "price": self.price[r],
+            "category": self.category[r],
+            "description": self.description[r],
+            "score": round(float(p) * 100),
+            "image": self.image[r],
+        } for r, p in zip(rows.tolist(), probs.tolist())]
+
+    def nbytes(self):
+        """Approximate resident size of the columns and the strings they hold."""
+        total = 0
+        for col in COLUMNS + ("image",):
+            column = getattr(self, col)
+            total += column.nbytes + sum(sys.getsizeof(v) for v in column)
+        return total
+
+
+# ==========================================
+# MEMORY & ALLOCATION REPORT
+# ==========================================
+if __name__ == "__main__":
+    import tracemalloc
+    import app
+
+    engine = app.ai_engine
+    engine.cache = None  # Measure the search path itself, not cache hits
+    db = engine.product_db
+    queries = ["modem 4g", "samsung", "tablette", "kitman hoco", "zte blade", "cable type-c"]
+
+    def pandas_search(user_query, top_k=20):
+        # The pre-columnar request path, kept here for comparison only
+        clean_query = app.preprocess_query(user_query)
+        candidates = db.copy()
+        candidates['ai_score'] = engine.scorer.predict_proba(clean_query)
+        results = candidates[candidates['ai_score'] > 0.35].sort_values(by='ai_score', ascending=False).head(top_k)
+        output = []
+        for _, row in results.iterrows():
+            img_url = engine.images.get(image_key(row['product_name']), PLACEHOLDER_IMAGE)
+            output.append({"name": row['product_name'], "price": row['price'], "category": row['category'],
+                           "description": row['description'], "score": round(row['ai_score'] * 100),
+                           "image": img_url})
+        return output
+
+    for q in queries:
+        assert pandas_search(q) == engine.search(q), f"Response changed for '{q}'"
+
+    print(f"Catalog: {len(db)} products")
+    print(f"   DataFrame (deep):   {db.memory_usage(deep=True).sum() / 1024:.1f} KiB")
+    print(f"   ProductStore:       {engine.store.nbytes() / 1024:.1f} KiB (image URLs included)")
+
+    for name, fn in [("pandas path", pandas_search), ("columnar path", engine.search)]:
+        peaks = []
+        tracemalloc.start()
+        for q in queries:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(q)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+        print(f"   {name:<14} peak allocation {sum(peaks) / len(peaks) / 1024:.1f} KiB/query")
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import itertools
+from collections import OrderedDict
+
+# ==========================================
+# QUERY RESULT CACHE
+# ==========================================
+# Search traffic is heavily skewed (suggestion chips, "modem 4g", "samsung"),
+# so finished /search responses are cached per worker in a bounded LRU keyed on
+# the normalized query + search parameters. An optional SQLite file acts as a
+# second tier shared by every gunicorn worker on the box. Entries are tagged
+# with the model version, so loading a different brain invalidates them.
+# The SQLite tier is only trimmed back to its bound every `trim_every` puts,
+# from a background thread, so a put is a single INSERT on the request path.
+
+
+def model_version(filename):
+    """Content hash of a brain file (or mmap brain directory), used to tag cache entries."""
+    digest = hashlib.sha1()
+    paths = [filename]
+    if os.path.isdir(filename):
+        paths = [os.path.join(filename, name) for name in sorted(os.listdir(filename))]
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class SQLiteCache:
+    """Cross-process cache tier backed by a local SQLite file."""
+
+    def __init__(self, path, max_entries=10000, trim_every=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.trim_every = trim_every or max(1, max_entries // 20)
+        self._local = threading.local()
+        self._puts = itertools.count(1)
+        self._trimming = threading.Lock()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS results ("
+                       "key TEXT PRIMARY KEY, version TEXT, value TEXT, "
+                       "expires_at REAL, last_used REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, version):
+        db = self._connect()
+        row = db.execute("SELECT value, expires_at FROM results WHERE key = ? AND version = ?",
+                         (key, version)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            db.execute("DELETE FROM results WHERE key = ?", (key,))
+            return None
+        db.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def put(self, key, version, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        db = self._connect()
+        db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                   (key, version, json.dumps(value), expires_at, now))
+        if next(self._puts) % self.trim_every == 0 and self._trimming.acquire(blocking=False):
+            threading.Thread(target=self._trim, name="sqlite-cache-trim", daemon=True).start()
+
+    def _trim(self):
+        """LRU trim: drops the least recently used rows beyond max_entries, if the table grew past it."""
+        try:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            try:
+                (count,) = conn.execute("SELECT COUNT(*) FROM results").fetchone()
+                if count > self.max_entries:
+                    conn.execute("DELETE FROM results WHERE key IN (SELECT key FROM results "
+                                 "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[ERROR] SQLite cache trim failed: {e}")
+        finally:
+            self._trimming.release()
+
+    def purge_other_versions(self, version):
+        self._connect().execute("DELETE FROM results WHERE version != ?", (version,))
+
+
+class ResultCache:
+    def __init__(self, max_entries=1024, ttl=None, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.shared_hits = 0
+
+    @staticmethod
+    def make_key(clean_query, top_k, threshold):
+        return json.dumps([clean_query, top_k, threshold])
+
+    def set_version(self, version):
+        """Drops every cached result if the model version changed."""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.purge_other_versions(version)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        if self.shared is not None:
+            value = self.shared.get(key, self.version)
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._store(key, value)
+        if self.shared is not None:
+            self.shared.put(key, self.version, value, self.ttl)
+
+    def _store(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_hits": self.shared_hits,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def cache_from_env():
+    """ResultCache configured by DJIBLY_CACHE_SIZE / _TTL / _DB, or None when disabled."""
+    size = int(os.environ.get("DJIBLY_CACHE_SIZE", 1024))
+    if size <= 0:
+        return None
+    ttl = float(os.environ.get("DJIBLY_CACHE_TTL", 0)) or None
+    db_path = os.environ.get("DJIBLY_CACHE_DB")
+    shared = SQLiteCache(db_path, max_entries=size * 10) if db_path else None
+    return ResultCache(max_entries=size, ttl=ttl, shared=shared)
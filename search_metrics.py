@@ -0,0 +1,179 @@
+import os
+import time
+import bisect
+import threading
+
+# ==========================================
+# SEARCH METRICS (Prometheus text format)
+# ==========================================
+# Each /search is timed stage by stage with a lap timer (one perf_counter call
+# per stage) and the timings go into fixed-bucket histograms. /metrics renders
+# them, plus request/result counters and the engine gauges the app passes in.
+# Values are per worker process, like /admin/status.
+# Set DJIBLY_METRICS=0 to turn all of it off (the timer becomes a no-op).
+
+METRICS_ENABLED = os.environ.get("DJIBLY_METRICS", "1").lower() not in ("0", "false", "off")
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RESULT_BUCKETS = (0, 1, 5, 10, 20, 50, 100)
+STAGES = ("preprocess", "cache_lookup", "retrieve", "route", "vectorize", "classify",
+          "threshold_sort", "records", "serialize")
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels=""):
+        sep = "," if labels else ""
+        out, running = [], 0
+        for bound, n in zip(self.bounds, self.counts):
+            running += n
+            out.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {running}')
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        out.append(f"{name}_sum{suffix} {self.sum!r}")
+        out.append(f"{name}_count{suffix} {self.count}")
+        return out
+
+
+class StageTimer:
+    """Lap timer: each lap() charges the time since the previous lap to a stage."""
+    __slots__ = ("metrics", "last")
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.metrics.observe_stage(stage, now - self.last)
+        self.last = now
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def lap(self, stage):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class SearchMetrics:
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.stages = {stage: Histogram(LATENCY_BUCKETS) for stage in STAGES}
+        self.requests = {}  # endpoint -> Histogram of end-to-end seconds
+        self.statuses = {}  # (endpoint, status) -> count
+        self.results = Histogram(RESULT_BUCKETS)
+        self.zero_results = 0
+
+    def timer(self):
+        return StageTimer(self) if self.enabled else NULL_TIMER
+
+    def observe_stage(self, stage, seconds):
+        if self.enabled:
+            with self._lock:
+                self.stages[stage].observe(seconds)
+
+    def observe_results(self, count):
+        if self.enabled:
+            with self._lock:
+                self.results.observe(count)
+                if count == 0:
+                    self.zero_results += 1
+
+    def observe_request(self, endpoint, status, seconds):
+        if self.enabled:
+            with self._lock:
+                hist = self.requests.get(endpoint)
+                if hist is None:
+                    hist = self.requests[endpoint] = Histogram(LATENCY_BUCKETS)
+                hist.observe(seconds)
+                self.statuses[endpoint, status] = self.statuses.get((endpoint, status), 0) + 1
+
+    def render(self, gauges=()):
+        """Prometheus text exposition; `gauges` is a list of (name, help, value, labels)."""
+        out = []
+
+        def header(name, help_text, kind):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            header("djibly_search_stage_seconds", "Time spent in each stage of a search.", "histogram")
+            for stage, hist in self.stages.items():
+                out.extend(hist.lines("djibly_search_stage_seconds", f'stage="{stage}"'))
+
+            header("djibly_request_seconds", "End-to-end request handling time.", "histogram")
+            for endpoint, hist in sorted(self.requests.items()):
+                out.extend(hist.lines("djibly_request_seconds", f'endpoint="{endpoint}"'))
+
+            header("djibly_requests_total", "Requests by endpoint and HTTP status.", "counter")
+            for (endpoint, status), n in sorted(self.statuses.items()):
+                out.append(f'djibly_requests_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+
+            header("djibly_search_results", "Number of results returned per search.", "histogram")
+            out.extend(self.results.lines("djibly_search_results"))
+
+            header("djibly_search_zero_results_total", "Searches that returned no result.", "counter")
+            out.append(f"djibly_search_zero_results_total {self.zero_results}")
+            searches = self.results.count
+            header("djibly_search_zero_result_rate", "Share of searches that returned no result.", "gauge")
+            out.append(f"djibly_search_zero_result_rate {self.zero_results / searches if searches else 0.0:.6g}")
+
+        for name, help_text, value, labels in gauges:
+            if value is None:
+                continue
+            header(name, help_text, "gauge")
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            out.append(f"{name}{{{label_text}}} {float(value)!r}" if label_text else f"{name} {float(value)!r}")
+        return "\n".join(out) + "\n"
+
+
+metrics = SearchMetrics()
+
+
+# ==========================================
+# OVERHEAD CHECK
+# ==========================================
+if __name__ == "__main__":
+    os.environ["DJIBLY_CACHE_SIZE"] = "0"  # Time real searches, not cache hits
+    import app
+    from search_metrics import metrics  # The instance app.py uses (this file runs as __main__)
+
+    engine = app.ai_engine
+    queries = ["modem 4g", "samsung", "tablette", "kitman hoco", "zte blade", "cable type-c"] * 50
+
+    def run(enabled):
+        metrics.enabled = enabled
+        start = time.perf_counter()
+        for q in queries:
+            engine.search(q)
+        return (time.perf_counter() - start) / len(queries) * 1e6
+
+    # Interleaved, best of 10 each: a single CPU drifts too much for back-to-back runs
+    timings = {False: [], True: []}
+    for _ in range(10):
+        for enabled in (False, True):
+            timings[enabled].append(run(enabled))
+    off, on = min(timings[False]), min(timings[True])
+    print(f"search: {off:.1f} us/query without metrics, {on:.1f} us/query with metrics "
+          f"({(on - off) / off * 100:+.1f}%)")
+    print("\nStage means:")
+    for stage, hist in metrics.stages.items():
+        if hist.count:
+            print(f"   {stage:<15} {hist.sum / hist.count * 1e6:8.1f} us")
@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import multiprocessing as mp
+import numpy as np
+from compiled_scorer import CompiledScorer
+from candidate_index import CandidateIndex
+from product_store import ProductStore
+
+# ==========================================
+# SHARDED SCORING (multi-process, top-k merge)
+# ==========================================
+# product_db is split into contiguous shards, one per worker process. Each
+# worker keeps its shard for its whole life: a CompiledScorer over the shard's
+# products, or the plain pipeline when the brain cannot be compiled, and
+# optionally a candidate index over the shard. For a query, every shard keeps
+# only its local top-k; those (row, probability) pairs are all that travel
+# back, and the parent merges them into the global top-k.
+#
+# No process ever builds the full query x product feature matrix. The pipeline
+# fallback vectorizes CHUNK_SIZE products at a time, keeping a running top-k.
+# The CompiledScorer never builds that matrix (its per-query state is two
+# float vectors per shard). Chunking it would repeat the query's postings
+# work per chunk (~60% slower at 100k products), so it scores its shard in
+# one call.
+#
+# Each pipe has its own lock, taken in shard order from the request's send to
+# its reply, so concurrent requests (threaded gunicorn, the ASGI pool) follow
+# one another through the shards instead of waiting for each other's whole
+# round trip. If a shard process dies, the request raises ShardFailure and so
+# does every later one: the caller scores in-process instead.
+#
+# Category routing is decided over the whole catalog, as
+# CategoryRouter.restrict does in-process: a shard whose candidates routing
+# empties scores nothing and says so, and only when that happens on every
+# shard is the query scored again without routing.
+#
+#   with ShardedScorer(pipeline, product_db, n_shards=4) as sharded:
+#       rows, probs = sharded.top_k("modem 4g", k=20, threshold=0.35)
+#
+#   python sharded_scorer.py queries.jsonl --model djezzy_ai_brain5.pkl --out results.jsonl
+#   python sharded_scorer.py --bench --size 100000 --shards 1 2 4
+
+CHUNK_SIZE = 20_000  # Products scored per call inside a shard
+
+
+def shard_bounds(n_products, n_shards):
+    """[(start, stop)] of n_shards contiguous, near-equal slices."""
+    edges = np.linspace(0, n_products, n_shards + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def _merge_top_k(rows, probs, k, threshold):
+    order = np.argsort(rows, kind='stable')  # Ties go to the earlier catalog row, as in a single scan
+    best = order[ProductStore.top_k(probs[order], k, threshold)]
+    return rows[best], probs[best]
+
+
+class _Shard:
+    """One worker's products; rows it returns are catalog positions (offset added)."""
+
+    def __init__(self, pipeline, product_db, offset, chunk_size, retrieval_depth, compile=True):
+        self.offset = offset
+        self.chunk_size = chunk_size
+        self.retrieval_depth = retrieval_depth
+        self.texts = product_db['search_text'].tolist()
+        self.category = np.asarray(product_db['category'].tolist(), dtype=object)
+        self.pipeline = pipeline
+        self.scorer = None
+        if compile:
+            try:
+                self.scorer = CompiledScorer.from_pipeline(pipeline, self.texts)
+            except ValueError:
+                pass
+        self.retriever = None
+        if retrieval_depth:
+            prior = self.scorer.predict_proba("") if self.scorer is not None else None
+            self.retriever = CandidateIndex.from_database(product_db, prior)
+
+    def top_k(self, clean_query, k, threshold, categories=None):
+        """(catalog rows, probabilities, routed out): the last is True when routing left no candidate here."""
+        rows = self.retriever.candidates(clean_query, self.retrieval_depth) if self.retriever else None
+        if categories is not None:
+            allowed = np.isin(self.category, categories)
+            rows = np.flatnonzero(allowed) if rows is None else rows[allowed[rows]]
+            if len(rows) == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0), True
+        return self._top_k(clean_query, rows, k, threshold) + (False,)
+
+    def _top_k(self, clean_query, rows, k, threshold):
+        if self.scorer is not None:
+            if rows is None:
+                probs = self.scorer.predict_proba(clean_query)
+                best = ProductStore.top_k(probs, k, threshold)
+                return best + self.offset, probs[best]
+            best_rows, best_probs = _merge_top_k(rows, self.scorer.predict_proba(clean_query, rows), k, threshold)
+            return best_rows + self.offset, best_probs
+
+        if rows is None:
+            rows = np.arange(len(self.texts))
+        best_rows, best_probs = np.zeros(0, dtype=np.int64), np.zeros(0)
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            texts = [clean_query + " | " + self.texts[r] for r in chunk.tolist()]
+            probs = self.pipeline.predict_proba(texts)[:, 1]
+            best_rows, best_probs = _merge_top_k(np.concatenate([best_rows, chunk]),
+                                                 np.concatenate([best_probs, probs]), k, threshold)
+        return best_rows + self.offset, best_probs
+
+
+def _serve_shard(conn, pipeline, product_db, offset, chunk_size, retrieval_depth, compile):
+    try:
+        shard = _Shard(pipeline, product_db, offset, chunk_size, retrieval_depth, compile)
+    except Exception as e:
+        conn.send(e)
+        return
+    conn.send("ready")
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        try:
+            conn.send([shard.top_k(*args) for args in request])
+        except Exception as e:
+            conn.send(e)
+
+
+class ShardFailure(RuntimeError):
+    """A shard process died or its pipe broke; the ShardedScorer cannot score any more."""
+
+
+class ShardedScorer:
+    """Persistent worker processes, each holding a slice of product_db."""
+
+    def __init__(self, pipeline, product_db, n_shards=None, chunk_size=CHUNK_SIZE, retrieval_depth=None,
+                 compile=True):
+        n_shards = max(1, min(n_shards or os.cpu_count() or 1, len(product_db)))
+        self.chunk_size = chunk_size
+        self.bounds = shard_bounds(len(product_db), n_shards)
+        # fork: shards inherit the pipeline and their slice without pickling, and
+        # the parent's __main__ (e.g. app.py) is not re-imported in the workers
+        ctx = mp.get_context("fork")
+        self._conns, self._procs = [], []
+        for start, stop in self.bounds:
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_serve_shard, daemon=True, name=f"djibly-shard-{start}",
+                               args=(child, pipeline, product_db.iloc[start:stop].reset_index(drop=True),
+                                     start, chunk_size, retrieval_depth, compile))
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+        self._locks = [threading.Lock() for _ in self._conns]  # One request at a time per pipe
+        self.failure = None
+        for conn in self._conns:
+            status = conn.recv()
+            if status != "ready":
+                self.close()
+                raise status
+
+    @property
+    def n_shards(self):
+        return len(self.bounds)
+
+    def top_k_many(self, clean_queries, k, threshold, categories=None):
+        """[(catalog rows, probabilities)] per query, best first.
+
+        k and threshold may be per-query lists; categories, if given, is a
+        per-query list of category names to restrict to (None = all).
+        """
+        n = len(clean_queries)
+        ks = k if isinstance(k, (list, tuple)) else [k] * n
+        thresholds = threshold if isinstance(threshold, (list, tuple)) else [threshold] * n
+        cats = categories if categories is not None else [None] * n
+        request = list(zip(clean_queries, ks, thresholds, cats))
+        if self.failure is not None:
+            raise ShardFailure(self.failure)
+        replies, held, released, current = [], 0, 0, 0
+        try:
+            for current, (lock, conn) in enumerate(zip(self._locks, self._conns)):
+                lock.acquire()
+                held += 1
+                conn.send(request)
+            for current, (lock, conn) in enumerate(zip(self._locks, self._conns)):
+                replies.append(conn.recv())
+                lock.release()
+                released += 1
+        except (EOFError, OSError) as e:  # The shard's end of the pipe is gone (BrokenPipeError is an OSError)
+            shard = self._procs[current]
+            self.failure = f"shard {shard.name} (exit code {shard.exitcode}): {type(e).__name__} {e}".rstrip()
+            raise ShardFailure(self.failure) from e
+        finally:
+            for lock in self._locks[released:held]:
+                lock.release()
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+
+        merged = []
+        for i in range(n):
+            rows = np.concatenate([reply[i][0] for reply in replies])
+            probs = np.concatenate([reply[i][1] for reply in replies])
+            merged.append(_merge_top_k(rows, probs, ks[i], thresholds[i]))
+        # Routing left nothing to score anywhere: like CategoryRouter.restrict, score the unrouted candidates
+        unrouted = [i for i in range(n) if cats[i] is not None and all(reply[i][2] for reply in replies)]
+        if unrouted:
+            rescored = self.top_k_many([clean_queries[i] for i in unrouted], [ks[i] for i in unrouted],
+                                       [thresholds[i] for i in unrouted])
+            for i, result in zip(unrouted, rescored):
+                merged[i] = result
+        return merged
+
+    def top_k(self, clean_query, k, threshold, categories=None):
+        return self.top_k_many([clean_query], k, threshold, [categories])[0]
+
+    def close(self):
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        self._conns, self._procs = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ==========================================
+# OFFLINE BATCH SCORING & SCALING BENCHMARK
+# ==========================================
+def _single_process_top_k(score, clean_queries, k, threshold):
+    """Reference: the whole catalog scored in one call per query."""
+    results = []
+    for q in clean_queries:
+        probs = score(q)
+        best = ProductStore.top_k(probs, k, threshold)
+        results.append((best, probs[best]))
+    return results
+
+
+def _peak_rss_mib(who):
+    import resource
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def bench(size, shard_counts, n_queries, chunk_size, k, threshold, use_pipeline=False, seed=0):
+    import resource
+    import tempfile
+    from brain_delta import load_package
+    from bench_search import build_brain, query_workload
+    from ai_test5 import preprocess_query
+    with tempfile.TemporaryDirectory(prefix="djibly-shards-") as workdir:
+        package = load_package(build_brain(workdir, size, seed))
+    pipeline, db = package['pipeline'], package['database']
+    queries = [preprocess_query(q) for q in query_workload(db['product_name'].tolist(), n_queries, seed)]
+    mode = "pipeline (no compiled scorer)" if use_pipeline else "compiled scorer"
+    print(f"[Bench] {len(db)} products, {len(queries)} queries, top-{k}, {mode}, chunk {chunk_size}, "
+          f"{os.cpu_count()} CPUs")
+
+    # Shards are forked before the reference run, so they do not inherit its memory
+    runs = []
+    for n in shard_counts:
+        t = time.perf_counter()
+        sharded = ShardedScorer(pipeline, db, n, chunk_size, compile=not use_pipeline)
+        runs.append((n, sharded, time.perf_counter() - t))
+
+    if use_pipeline:
+        texts = db['search_text']
+        score = lambda q: pipeline.predict_proba(q + " | " + texts)[:, 1]
+    else:
+        scorer = CompiledScorer.from_pipeline(pipeline, db['search_text'])
+        score = scorer.predict_proba
+    t = time.perf_counter()
+    reference = _single_process_top_k(score, queries, k, threshold)
+    base_s = time.perf_counter() - t
+    print(f"   single process      {len(queries) / base_s:8.1f} q/s   {base_s / len(queries) * 1000:7.2f} ms/query   "
+          f"peak RSS {_peak_rss_mib(resource.RUSAGE_SELF):6.0f} MiB")
+
+    report = {"products": len(db), "queries": len(queries), "cpus": os.cpu_count(), "mode": mode,
+              "single_process_qps": len(queries) / base_s, "sharded": []}
+    for n, sharded, startup_s in runs:
+        with sharded:
+            sharded.top_k(queries[0], k, threshold)
+            t = time.perf_counter()
+            one_by_one = [sharded.top_k(q, k, threshold) for q in queries]
+            single_s = time.perf_counter() - t
+            t = time.perf_counter()
+            sharded.top_k_many(queries, k, threshold)
+            batch_s = time.perf_counter() - t
+        # Ties at the k-th place may pick different rows; the scores must agree
+        same = all(np.allclose(a[1], b[1]) for a, b in zip(one_by_one, reference))
+        row = {"shards": n, "startup_s": startup_s, "qps": len(queries) / single_s,
+               "batch_qps": len(queries) / batch_s, "speedup": base_s / single_s, "same_results": same}
+        report["sharded"].append(row)
+        print(f"   {n:2d} shards           {row['qps']:8.1f} q/s   {single_s / len(queries) * 1000:7.2f} ms/query   "
+              f"batch {row['batch_qps']:8.1f} q/s   x{row['speedup']:.2f}   startup {startup_s:.1f}s   "
+              f"{'same top-k' if same else 'RESULTS DIFFER'}")
+    report["peak_shard_rss_mib"] = _peak_rss_mib(resource.RUSAGE_CHILDREN)
+    print(f"   largest shard process peak RSS {report['peak_shard_rss_mib']:.0f} MiB")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score queries over a sharded catalog, or benchmark shard scaling")
+    parser.add_argument("queries", nargs="?", help="JSONL query log (load_replay.py format)")
+    parser.add_argument("--model", default="djezzy_ai_brain5.pkl")
+    parser.add_argument("--out", help="JSONL output (one result list per query); stdout if omitted")
+    parser.add_argument("--shards", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=0.35)
+    parser.add_argument("--batch", type=int, default=256, help="Queries sent to the shards per round trip")
+    parser.add_argument("--bench", action="store_true", help="Measure 1..N shard scaling on a synthetic catalog")
+    parser.add_argument("--size", type=int, default=100000, help="Catalog size for --bench")
+    parser.add_argument("--bench-queries", type=int, default=200)
+    parser.add_argument("--pipeline", action="store_true", help="Bench the uncompiled pipeline path (chunked)")
+    parser.add_argument("--json", help="Write the --bench report here")
+    args = parser.parse_args()
+
+    if args.bench:
+        report = bench(args.size, args.shards, args.bench_queries, args.chunk_size, args.top_k, args.threshold,
+                       args.pipeline)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        sys.exit(0)
+    if not args.queries:
+        parser.error("a query log (or --bench) is required")
+
+    from brain_delta import load_package
+    from ai_test5 import preprocess_query
+    from load_replay import read_log
+    package = load_package(args.model)
+    db = package['database'].reset_index(drop=True)
+    store = ProductStore(db)
+    queries = read_log(args.queries)
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    start = time.perf_counter()
+    with ShardedScorer(package['pipeline'], db, args.shards[0], args.chunk_size) as sharded:
+        for i in range(0, len(queries), args.batch):
+            batch = queries[i:i + args.batch]
+            for q, (rows, probs) in zip(batch, sharded.top_k_many([preprocess_query(q) for q in batch],
+                                                                  args.top_k, args.threshold)):
+                out.write(json.dumps({"query": q, "results": store.records(rows, probs)}, ensure_ascii=False) + "\n")
+    if args.out:
+        out.close()
+    print(f"[SUCCESS] {len(queries)} queries scored on {args.shards[0]} shards in "
+          f"{time.perf_counter() - start:.1f}s", file=sys.stderr)
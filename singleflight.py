@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+# ==========================================
+# REQUEST COALESCING (single-flight)
+# ==========================================
+# When a promotion goes live, many users send the same query within the same
+# second, before the result cache has an entry for it. Only the first request
+# for a key (the "leader") runs the search; identical requests that arrive
+# while it is in flight wait for it and share its result (or its error).
+#
+# In the asyncio version the work runs in a task of its own, which every
+# request for the key (the leader's included) awaits through asyncio.shield:
+# a client that disconnects cancels only its own wait, never the search the
+# others are waiting for.
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread version, for the Flask/gunicorn workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+def _retrieve(task):
+    """Marks the task's error as retrieved when every request for it went away."""
+    if not task.cancelled():
+        task.exception()
+
+
+class AsyncSingleFlight:
+    """asyncio version, for the ASGI app (only used from the event loop thread)."""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self._calls[key] = asyncio.get_running_loop().create_task(self._run(key, fn, *args))
+            task.add_done_callback(_retrieve)
+            self.leaders += 1
+        return await asyncio.shield(task)
+
+    async def _run(self, key, fn, *args):
+        try:
+            return await fn(*args)
+        finally:
+            del self._calls[key]
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
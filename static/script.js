@@ -3,6 +3,30 @@ const resultsGrid = document.getElementById('resultsGrid');
 const loadingSpinner = document.getElementById('loadingSpinner');
 const resultsHeader = document.getElementById('resultsHeader');
 const resultsCount = document.getElementById('resultsCount');
+const completionList = document.getElementById('completions');
+
+// Search-as-you-type: wait for a pause in typing, then ask /suggest.
+// Only the latest request matters, so starting one aborts the previous one.
+const SUGGEST_DEBOUNCE_MS = 120;
+const SUGGEST_MIN_CHARS = 2;
+let suggestTimer = null;
+let inflight = null;
+let completing = null;  // Keyword completions (/complete) have their own request: they are not results
+
+function startRequest() {
+    clearTimeout(suggestTimer);
+    if (inflight) inflight.abort();
+    inflight = new AbortController();
+    return inflight;
+}
+
+searchInput.addEventListener('input', function () {
+    clearTimeout(suggestTimer);
+    const query = searchInput.value.trim();
+    complete(query);
+    if (query.length < SUGGEST_MIN_CHARS) return;
+    suggestTimer = setTimeout(() => suggest(query), SUGGEST_DEBOUNCE_MS);
+});
 
 // Allow Enter key to search
 searchInput.addEventListener('keypress', function (e) {
@@ -16,9 +40,47 @@ function fillSearch(text) {
     performSearch();
 }
 
+async function suggest(query) {
+    const controller = startRequest();
+    try {
+        const response = await fetch('/suggest?q=' + encodeURIComponent(query), { signal: controller.signal });
+        if (!response.ok) return;  // Busy server: the next keystroke or Enter will ask again
+        const data = await response.json();
+        if (controller !== inflight) return;  // Superseded while the body was read
+        renderResults(data.results, query);
+    } catch (error) {
+        if (error.name !== 'AbortError') console.error('Error:', error);
+    }
+}
+
+async function complete(query) {
+    if (completing) completing.abort();
+    completing = new AbortController();
+    const controller = completing;
+    if (!query) {
+        completionList.innerHTML = '';
+        return;
+    }
+    try {
+        const response = await fetch('/complete?q=' + encodeURIComponent(query), { signal: controller.signal });
+        if (!response.ok) return;
+        const data = await response.json();
+        if (controller !== completing) return;
+        completionList.innerHTML = '';
+        data.completions.forEach(text => {
+            const option = document.createElement('option');
+            option.value = text;
+            completionList.appendChild(option);
+        });
+    } catch (error) {
+        if (error.name !== 'AbortError') console.error('Error:', error);
+    }
+}
+
 async function performSearch() {
     const query = searchInput.value.trim();
     if (!query) return;
+    const controller = startRequest();
 
     // UI State: Loading
     resultsGrid.innerHTML = '';
@@ -32,29 +94,40 @@ async function performSearch() {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({ query: query }),
+            signal: controller.signal,
         });
 
         const results = await response.json();
+        if (controller !== inflight) return;
         renderResults(results, query);
     } catch (error) {
+        if (error.name === 'AbortError') return;
         console.error('Error:', error);
         resultsGrid.innerHTML = '<p class="empty-state">Erreur de connexion au serveur.</p>';
     } finally {
-        loadingSpinner.classList.add('hidden');
+        if (controller === inflight) loadingSpinner.classList.add('hidden');
     }
 }
 
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
 function renderResults(results, query) {
     if (results.length === 0) {
+        resultsHeader.classList.add('hidden');
         resultsGrid.innerHTML = `
             <div class="empty-state">
                 <i class="fas fa-search-minus"></i>
-                <p>Aucun résultat trouvé pour "${query}".</p>
+                <p>Aucun résultat trouvé pour "${escapeHtml(query)}".</p>
             </div>
         `;
         return;
     }
 
+    resultsGrid.innerHTML = '';
     resultsHeader.classList.remove('hidden');
     resultsCount.textContent = `${results.length} produits trouvés`;
 
@@ -66,7 +139,7 @@ function renderResults(results, query) {
         // Format price: Add space for thousands if needed (simple implementation)
 
         card.innerHTML = `
-            <img src="${product.image}" alt="${product.name}" class="card-img" onerror="this.src='https://via.placeholder.com/200x200?text=Djezzy'">
+            <img src="${product.image}" alt="${product.name}" class="card-img" onerror="this.onerror=null; this.src='/static/placeholder.svg'">
             <div class="card-body">
                 <span class="card-cat">${product.category}</span>
                 <h3 class="card-title">${product.name}</h3>
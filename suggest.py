@@ -0,0 +1,153 @@
+import re
+import bisect
+import threading
+from collections import OrderedDict
+import numpy as np
+from candidate_index import DEFAULT_DEPTH
+
+# ==========================================
+# SEARCH-AS-YOU-TYPE (/suggest)
+# ==========================================
+# While a query is being typed its last word is usually unfinished: "mod" and
+# "mode" are not in the brain's vocabulary, so scoring them as they are would
+# rank products by the query-independent part of the model. The last word is
+# therefore completed against the catalog's own words first. Candidates are the
+# products having a word that starts with it, and the query is scored with the
+# most common such word ("mod" -> "modem"). Synonym keys complete as well
+# ("kitm" -> "kitman") and stand for the products of the word they expand to.
+# The words before it are finished and go through preprocess_query as usual; a
+# trailing space finishes the last word too. When no catalog word starts with
+# it (a typo), the char n-gram retriever picks the candidates, as for /search.
+#
+# Work is reused between keystrokes. One more letter can only narrow the
+# matching words to a sub-range of the previous keystroke's sorted range, so
+# that range (kept in a small LRU with its candidate rows and completion) is
+# searched instead of the whole word list. Parsed queries live in the same
+# LRU, so backspacing and popular prefixes are not re-tokenized.
+
+SUGGEST_TOP_K = 8
+MIN_PREFIX = 2          # Shorter last words are not completed (the tokenizer drops 1-letter words anyway)
+STATE_CACHE_SIZE = 4096
+WORD_RE = re.compile(r"[^\W_]{2,}")  # Splits "Routeur_Modem" too, so "mod" completes to "modem"
+
+
+class Suggester:
+    def __init__(self, scorer, search_texts, preprocess, synonyms=None, retriever=None, depth=DEFAULT_DEPTH,
+                 cache_size=STATE_CACHE_SIZE):
+        self.scorer = scorer
+        self.preprocess = preprocess
+        self.retriever = retriever
+        self.depth = depth
+        postings = {}
+        for r, text in enumerate(search_texts):
+            for w in WORD_RE.findall(str(text).lower()):
+                postings.setdefault(w, set()).add(r)
+        for key, value in (synonyms or {}).items():
+            if value in postings:
+                postings.setdefault(key, set()).update(postings[value])
+        self.words = sorted(postings)
+        self._rows = [np.array(sorted(postings[w]), dtype=np.int64) for w in self.words]
+        self._df = np.array([len(rows) for rows in self._rows], dtype=np.int64)
+        self.cache_size = cache_size
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(raw_query):
+        """Lowercase words without punctuation; a trailing space means the last word is finished."""
+        text = re.sub(r'[^\w\s]', '', str(raw_query).lower())
+        words = " ".join(text.split())
+        return words + " " if words and text[-1:].isspace() else words
+
+    def _cached(self, key, build):
+        with self._lock:
+            value = self._states.get(key)
+            if value is not None:
+                self._states.move_to_end(key)
+                return value
+        value = build()
+        with self._lock:
+            self._states[key] = value
+            if len(self._states) > self.cache_size:
+                self._states.popitem(last=False)
+        return value
+
+    def _prefix_state(self, prefix):
+        """(lo, hi, rows, completion) for the catalog words starting with prefix."""
+        def build():
+            lo, hi = 0, len(self.words)
+            if len(prefix) > MIN_PREFIX:
+                # The previous keystroke's words bound this one's
+                with self._lock:
+                    parent = self._states.get(("prefix", prefix[:-1]))
+                if parent is not None:
+                    lo, hi = parent[0], parent[1]
+            lo = bisect.bisect_left(self.words, prefix, lo, hi)
+            hi = bisect.bisect_left(self.words, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo, hi)
+            if lo == hi:
+                return lo, hi, None, None
+            rows = self._rows[lo] if hi - lo == 1 else np.unique(np.concatenate(self._rows[lo:hi]))
+            # A finished word stays as typed, otherwise the most common completion (alphabetical on ties)
+            completion = prefix if self.words[lo] == prefix else self.words[lo + int(np.argmax(self._df[lo:hi]))]
+            return lo, hi, rows, completion
+        return self._cached(("prefix", prefix), build)
+
+    def score(self, raw_query):
+        """(rows, probs) for a query being typed; rows are sorted catalog positions, or None for all of them."""
+        text = self.normalize(raw_query)
+        words = text.split()
+        rows = None
+        if words and not text.endswith(" ") and len(words[-1]) >= MIN_PREFIX:
+            _, _, prefix_rows, completion = self._prefix_state(words[-1])
+            if completion is not None:
+                words[-1], rows = completion, prefix_rows
+        clean = self.preprocess(" ".join(words))
+        if rows is None and self.retriever is not None:
+            rows = self.retriever.candidates(clean, self.depth)
+        query = self._cached(("query", clean), lambda: self.scorer.vectorize(clean))
+        return rows, self.scorer.predict_proba(clean, rows, query)
+
+
+# ==========================================
+# KEYSTROKE LATENCY BENCHMARK
+# ==========================================
+def typing_workload(n_queries, seed=7):
+    """Every prefix of createdata5-style queries and of product names, as if typed key by key."""
+    import json
+    import random
+    from createdata5 import INPUT_FILE, load_products
+    from lite_brain import createdata5_queries
+    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+        names = [p["name"] for p in load_products(json.load(f))]
+    rng = random.Random(seed)
+    queries = createdata5_queries(n_queries // 2, seed) + rng.sample(names, min(len(names), n_queries - n_queries // 2))
+    return [q[:i] for q in queries for i in range(1, len(q) + 1)]
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import argparse
+    parser = argparse.ArgumentParser(description="Server time per keystroke of GET /suggest")
+    parser.add_argument("--model", default="djezzy_ai_brain5.pkl")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    # The result cache is off, so every keystroke is scored (the Suggester's own LRU stays on)
+    os.environ["DJIBLY_MODEL"] = args.model
+    os.environ["DJIBLY_CACHE_SIZE"] = "0"
+    import app
+    from bench_serving import percentile
+    client = app.app.test_client()
+    keystrokes = typing_workload(args.queries)
+    times, empty = [], 0
+    for prefix in keystrokes:
+        start = time.perf_counter()
+        response = client.get("/suggest", query_string={"q": prefix})
+        times.append((time.perf_counter() - start) * 1000)
+        empty += not response.get_json()["results"]
+    times.sort()
+    print(f"[Bench] {len(keystrokes)} keystrokes over {args.queries} queries, {len(app.ai_engine.store)} products "
+          f"('{args.model}')")
+    print(f"   /suggest server time: p50 {percentile(times, 50):.2f} ms   p95 {percentile(times, 95):.2f} ms   "
+          f"p99 {percentile(times, 99):.2f} ms   max {times[-1]:.2f} ms   ({empty} keystrokes with no result)")
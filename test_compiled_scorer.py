@@ -0,0 +1,78 @@
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+from ai_test5 import DATASET_FILE, MODEL_FILE, build_features, preprocess_query
+from brain_delta import load_package
+from compiled_scorer import CompiledScorer
+from createdata5 import mess_up_text
+
+# CompiledScorer must give the sklearn pipeline's probabilities on
+# "query | product" texts, cross n-grams over the " | " join included.
+TOLERANCE = 1e-9
+
+
+def _queries(texts, n=150, seed=42):
+    rng = random.Random(seed)
+    words = sorted({w for t in texts for w in t.lower().split()})
+    queries = ["", "tablette", "wifi d-link", "telephone zte", "kitman hoco", "modem 4g", "zte blade a35",
+               "Routeur D-LINK 4G ?", "cable type-c usb", "samsung galaxy a15 noir"]
+    queries += [" ".join(mess_up_text(rng.choice(words), rng) for _ in range(rng.randint(1, 3))) for _ in range(n)]
+    return list(dict.fromkeys(preprocess_query(q) for q in queries))
+
+
+def _pipeline_proba(pipeline, clean_query, texts):
+    return pipeline.predict_proba([clean_query + " | " + t for t in texts])[:, 1]
+
+
+@pytest.fixture(scope="module")
+def v5():
+    try:
+        package = load_package(MODEL_FILE)
+    except FileNotFoundError:
+        pytest.skip(f"'{MODEL_FILE}' not trained")
+    return package['pipeline'], package['database']['search_text'].tolist()
+
+
+@pytest.fixture(scope="module")
+def hashed():
+    df = pd.read_csv(DATASET_FILE, nrows=5000)
+    pipeline = Pipeline([
+        ('hash', HashingVectorizer(analyzer='word', ngram_range=(1, 3), n_features=2 ** 18,
+                                   alternate_sign=False, norm='l2')),
+        ('clf', SGDClassifier(loss='log_loss', penalty='l2', alpha=1e-4, random_state=42))
+    ]).fit(build_features(df), df['relevance_label'])
+    texts = list(dict.fromkeys(build_features(df).str.split(" | ", n=1, regex=False).str[1]))[:200]
+    return pipeline, texts
+
+
+@pytest.mark.parametrize("brain", ["v5", "hashed"])
+def test_matches_pipeline(brain, request):
+    pipeline, texts = request.getfixturevalue(brain)
+    scorer = CompiledScorer.from_pipeline(pipeline, texts)
+    assert scorer.hashed == (brain == "hashed")
+    for q in _queries(texts):
+        np.testing.assert_allclose(scorer.predict_proba(q), _pipeline_proba(pipeline, q, texts),
+                                   rtol=0, atol=TOLERANCE, err_msg=repr(q))
+
+
+@pytest.mark.parametrize("brain", ["v5", "hashed"])
+def test_rows_subset_matches_pipeline(brain, request):
+    pipeline, texts = request.getfixturevalue(brain)
+    scorer = CompiledScorer.from_pipeline(pipeline, texts)
+    rows = np.arange(0, len(texts), 3)
+    for q in _queries(texts, n=30):
+        expected = _pipeline_proba(pipeline, q, [texts[r] for r in rows])
+        np.testing.assert_allclose(scorer.predict_proba(q, rows), expected, rtol=0, atol=TOLERANCE, err_msg=repr(q))
+
+
+def test_batch_matches_single(v5):
+    pipeline, texts = v5
+    scorer = CompiledScorer.from_pipeline(pipeline, texts)
+    queries = _queries(texts, n=30)
+    batch = scorer.predict_proba_many(queries)
+    for q, probs in zip(queries, batch):
+        np.testing.assert_allclose(probs, scorer.predict_proba(q), rtol=0, atol=TOLERANCE, err_msg=repr(q))
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from ai_test5 import DATASET_FILE, MODEL_FILE, SYNONYMS, preprocess_query
+from brain_delta import load_package
+from lite_brain import LiteBrain, export_lite, createdata5_queries, EDGE_QUERIES, _hashed_pipeline
+from product_store import ProductStore
+
+# LiteBrain (NumPy only) must rank like ai_test5 + the sklearn pipeline on
+# the queries createdata5 trains on: same top-k, same probabilities.
+TOP_K = 15
+TOLERANCE = 1e-9
+
+
+@pytest.fixture(scope="module")
+def package():
+    try:
+        return load_package(MODEL_FILE)
+    except FileNotFoundError:
+        pytest.skip(f"'{MODEL_FILE}' not trained")
+
+
+@pytest.fixture(scope="module")
+def queries():
+    return createdata5_queries(300, seed=7) + EDGE_QUERIES
+
+
+@pytest.fixture(scope="module", params=["tfidf", "hashed"])
+def brain(request, package, tmp_path_factory):
+    pipeline = package['pipeline'] if request.param == "tfidf" else _hashed_pipeline(DATASET_FILE, rows=5000)
+    db = package['database'].reset_index(drop=True)
+    path = export_lite(str(tmp_path_factory.mktemp("lite") / f"{request.param}.lite.npz"), pipeline, db, SYNONYMS)
+    return LiteBrain(path), pipeline, db
+
+
+def test_preprocess_matches_ai_test5(brain, queries):
+    lite, _, _ = brain
+    for q in queries:
+        assert lite.preprocess(q) == preprocess_query(q), repr(q)
+
+
+def test_search_matches_pipeline(brain, queries):
+    lite, pipeline, db = brain
+    texts = db['search_text'].tolist()
+    product_ids = db['product_id'].tolist()
+    for q in queries:
+        clean = preprocess_query(q)
+        expected = pipeline.predict_proba([clean + " | " + t for t in texts])[:, 1]
+        best = ProductStore.top_k(expected, TOP_K, 0.0)
+        results = lite.search(q, TOP_K)
+        np.testing.assert_allclose([r["ai_score"] for r in results], expected[best], rtol=0, atol=TOLERANCE,
+                                   err_msg=repr(q))
+        assert [r["product_id"] for r in results] == [product_ids[i] for i in best], repr(q)
@@ -1,16 +1,27 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pickle
-import pandas as pd
+import numpy as np
 import re
 import os
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import SGDClassifier
-from sklearn.pipeline import Pipeline
+import math
+import time
+import queue
+import threading
+from compiled_scorer import CompiledScorer
+from candidate_index import CandidateIndex, DEFAULT_DEPTH
+from brain_delta import load_package, brain_version
+from lite_brain import LiteBrain, lite_path, exported_version
+from suggest import Suggester, SUGGEST_TOP_K
+from typo_correction import load_typo_corrector
 
 # ==========================================
 # 1. THE AI BACKEND (Synced with Training)
 # ==========================================
+RETRIEVAL_DEPTH = DEFAULT_DEPTH  # Candidates kept by the char n-gram index before re-ranking
+SCORE_THRESHOLD = 0.35  # The "Golden Threshold" we found in training (see tune_brain.py)
+# Replace misspelled query words before preprocessing, as app.py does (opt-in, see typo_correction.py)
+TYPO_CORRECTION = os.environ.get("DJIBLY_TYPO_CORRECTION", "0") == "1"
+
 # STRICTLY Hardware Synonyms (No Offers/Plans)
 SYNONYMS = {
     # Smartphones
@@ -60,44 +71,299 @@ def preprocess_query(query):
     return " ".join(expanded)
 
 class DjezzySearchAI:
-    def __init__(self):
+    def __init__(self, retrieval_depth=RETRIEVAL_DEPTH):
         self.product_db = None
         self.pipeline = None
+        self.scorer = None
+        self.retriever = None
+        self.suggester = None
+        self.typos = None
+        self.retrieval_depth = retrieval_depth
 
     def load_model(self, filename):
         try:
-            with open(filename, 'rb') as f:
-                model_package = pickle.load(f)
+            model_package = load_package(filename)
             self.pipeline = model_package['pipeline']
             self.product_db = model_package['database']
+            self.compile_scorer()
+            self.build_retriever()
+            if TYPO_CORRECTION:
+                vocabulary = self.scorer.vocabulary if self.scorer is not None else None
+                self.typos = load_typo_corrector(model_package.get('typo_correction'), self.product_db, SYNONYMS,
+                                                 vocabulary)
+            if self.scorer is not None:
+                self.suggester = Suggester(self.scorer, self.product_db['search_text'], self.clean_query,
+                                           SYNONYMS, self.retriever, self.retrieval_depth)
             return True
         except Exception as e:
             print(f"Error loading model: {e}")
             return False
 
+    def compile_scorer(self):
+        """Precomputes product features so each query is vectorized only once."""
+        try:
+            self.scorer = CompiledScorer.from_pipeline(self.pipeline, self.product_db['search_text'])
+        except ValueError as e:
+            self.scorer = None
+            print(f"Compiled scorer unavailable, using full pipeline: {e}")
+
+    def build_retriever(self):
+        """Character n-gram index that shortlists candidates for the re-ranker."""
+        prior = self.scorer.predict_proba("") if self.scorer is not None else None
+        self.retriever = CandidateIndex.from_database(self.product_db, prior)
+
+    def clean_query(self, user_query):
+        """preprocess_query, after typo correction when it is on (like LiteBrain.clean)."""
+        if self.typos is not None:
+            user_query = self.typos.correct(user_query)
+        return preprocess_query(user_query)
+
+    def score(self, clean_query):
+        rows = self.retriever.candidates(clean_query, self.retrieval_depth) if self.retriever else None
+        if self.scorer is not None:
+            probs = self.scorer.predict_proba(clean_query, rows)
+        else:
+            texts = self.product_db['search_text']
+            if rows is not None:
+                texts = texts.iloc[rows]
+            probs = self.pipeline.predict_proba(clean_query + " | " + texts)[:, 1]
+        if rows is None:
+            return probs
+        # Products outside the shortlist are never relevant
+        full = np.zeros(len(self.product_db))
+        full[rows] = probs
+        return full
+
     def search(self, user_query, top_k=15):
-        if self.product_db is None: return pd.DataFrame()
+        """Best products as dicts (product_db columns + ai_score), like LiteBrain.search."""
+        if self.product_db is None: return []
         
-        clean_query = preprocess_query(user_query)
+        clean_query = self.clean_query(user_query)
         
         # Create candidates matching training feature format
         candidates = self.product_db.copy()
-        candidate_features = clean_query + " | " + candidates['search_text']
         
         try:
             # Get AI Probability
-            probs = self.pipeline.predict_proba(candidate_features)[:, 1]
-            candidates['ai_score'] = probs
+            candidates['ai_score'] = self.score(clean_query)
             
             # Return top results
-            return candidates.sort_values(by='ai_score', ascending=False).head(top_k)
+            return candidates.sort_values(by='ai_score', ascending=False).head(top_k).to_dict('records')
         except Exception as e:
             print(f"Search error: {e}")
-            return pd.DataFrame()
+            return []
+
+    def suggest(self, user_query, top_k=SUGGEST_TOP_K):
+        """search() for a query still being typed (its last word is completed, see suggest.py)."""
+        if self.suggester is None:
+            return self.search(user_query, top_k)
+        try:
+            rows, probs = self.suggester.score(user_query)
+            best = np.argsort(-probs, kind='stable')[:top_k]
+            candidates = self.product_db.iloc[best if rows is None else rows[best]].copy()
+            candidates['ai_score'] = probs[best]
+            return candidates.to_dict('records')
+        except Exception as e:
+            print(f"Suggest error: {e}")
+            return []
+
+def load_engine(model_filename):
+    """The sklearn-free lite export when it matches the brain (fast start on POS boxes), else the pickle.
+
+    Returns None when there is no brain at all and False when it failed to load.
+    """
+    lite_file = lite_path(model_filename)
+    if os.path.exists(lite_file):
+        if not os.path.exists(model_filename) or exported_version(lite_file) == brain_version(model_filename):
+            try:
+                return LiteBrain(lite_file, RETRIEVAL_DEPTH, TYPO_CORRECTION)
+            except Exception as e:
+                print(f"Error loading lite brain, falling back to the pickle: {e}")
+        else:
+            print(f"'{lite_file}' is older than '{model_filename}' (run `ai_test5.py --export-lite`); using the pickle.")
+    if not os.path.exists(model_filename):
+        return None
+    engine = DjezzySearchAI()
+    return engine if engine.load_model(model_filename) else False
 
 # ==========================================
 # 2. THE MODERN UI
 # ==========================================
+SEARCH_TOP_K = 20
+POLL_MS = 15            # How often the Tk thread checks for finished searches while one is running
+TYPE_DEBOUNCE_MS = 150  # Pause in typing before the results follow the entry (search-as-you-type)
+MIN_TYPED_CHARS = 2
+CARD_WIDTH = 550
+CARD_HEIGHT = 118       # Fixed row pitch (px) of the virtualized result list, gap included
+CARD_GAP = 12
+
+
+class SearchWorker(threading.Thread):
+    """Runs engine.search off the Tk thread. Only the newest request matters: a
+    request still waiting when another arrives is dropped, and results of a
+    superseded search are never handed back. The worker never touches Tk;
+    results go through `results`, which the UI drains from an after() poll.
+    """
+
+    def __init__(self, engine):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.generation = 0
+        self.results = queue.Queue()  # (generation, query, rows or exception)
+        self._cond = threading.Condition()
+        self._request = None
+
+    def submit(self, query, top_k=SEARCH_TOP_K, typing=False):
+        """Queues a search (engine.suggest while typing) and returns its generation number."""
+        with self._cond:
+            self.generation += 1
+            self._request = (self.generation, query, top_k, typing)
+            self._cond.notify()
+            return self.generation
+
+    def cancel(self):
+        """Makes every submitted search stale."""
+        with self._cond:
+            self.generation += 1
+            self._request = None
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._request is None:
+                    self._cond.wait()
+                generation, query, top_k, typing = self._request
+                self._request = None
+            search = getattr(self.engine, "suggest", self.engine.search) if typing else self.engine.search
+            try:
+                rows = [row for row in search(query, top_k=top_k) if row['ai_score'] > SCORE_THRESHOLD]
+            except Exception as e:
+                rows = e
+            if self.is_current(generation):
+                self.results.put((generation, query, rows))
+
+
+def visible_range(top, height, row_height, n_rows):
+    """[first, last) of the rows intersecting the viewport [top, top + height)."""
+    first = max(0, min(n_rows, int(top // row_height)))
+    last = max(first, min(n_rows, int(math.ceil((top + height) / row_height))))
+    return first, last
+
+
+class ResultCard:
+    """One result card (name, price, category, description, match bar), built once and re-filled."""
+
+    def __init__(self, canvas, colors, fonts):
+        self.colors = colors
+        self.frame = tk.Frame(canvas, bg="white", padx=15, pady=12)
+        self.window = canvas.create_window(0, 0, window=self.frame, anchor="nw",
+                                           width=CARD_WIDTH, height=CARD_HEIGHT - CARD_GAP, state="hidden")
+        self.index = None
+
+        # 1. Header: Name + Price
+        header = tk.Frame(self.frame, bg="white")
+        header.pack(fill="x")
+        self.name = tk.Label(header, font=fonts["title"], bg="white", fg=colors["dark"])
+        self.name.pack(side="left")
+        self.price = tk.Label(header, font=fonts["price"], bg="white", fg=colors["primary"])
+        self.price.pack(side="right")
+
+        # 2. Category Tag
+        self.category = tk.Label(self.frame, font=("Segoe UI", 8, "bold"), bg="white", fg="#0984e3", anchor="w")
+        self.category.pack(fill="x", pady=(2, 0))
+
+        # 3. Description
+        self.description = tk.Label(self.frame, font=("Segoe UI", 9), bg="white", fg="#636E72", anchor="w")
+        self.description.pack(fill="x", pady=(2, 8))
+
+        # 4. AI Confidence Bar
+        bar_frame = tk.Frame(self.frame, bg="white")
+        bar_frame.pack(fill="x")
+        tk.Label(bar_frame, text="Match:", font=("Segoe UI", 7, "bold"), bg="white", fg="#B2BEC3").pack(side="left")
+        progress_bg = tk.Frame(bar_frame, bg="#F0F2F5", height=5, width=150)
+        progress_bg.pack(side="left", padx=10)
+        progress_bg.pack_propagate(False)
+        self.fill = tk.Frame(progress_bg, height=5)
+        self.fill.pack(side="left")
+        self.percent = tk.Label(bar_frame, font=("Segoe UI", 8, "bold"), bg="white")
+        self.percent.pack(side="right")
+
+    def show(self, row):
+        self.name.config(text=row['product_name'])
+        self.price.config(text=f"{row['price']}")
+        self.category.config(text=f"[{row.get('category', 'Product')}]")
+        desc = str(row['description'])
+        if len(desc) > 80: desc = desc[:80] + "..."
+        self.description.config(text=desc)
+        score = int(row['ai_score'] * 100)
+        bar_color = self.colors["accent"] if score > 75 else self.colors["medium"]
+        self.fill.config(bg=bar_color, width=int((score / 100) * 150))
+        self.percent.config(text=f"{score}%", fg=bar_color)
+
+
+class VirtualResultList:
+    """Scrollable result list whose only widgets are a pool of cards covering the viewport.
+
+    Scrolling moves the pool to the rows now visible and re-fills the cards, so
+    the widget count (and the cost of showing results) does not depend on how
+    many results there are.
+    """
+
+    def __init__(self, parent, colors, fonts):
+        self.colors, self.fonts = colors, fonts
+        self.canvas = tk.Canvas(parent, bg=colors["bg"], highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set, yscrollincrement=CARD_HEIGHT // 4)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.message = self.canvas.create_text(CARD_WIDTH // 2, 60, text="", fill="#b2bec3",
+                                               font=("Segoe UI", 11), justify="center")
+        self.rows = []
+        self.pool = []
+
+        self.canvas.bind("<Configure>", lambda e: self.render())
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind_all(sequence, self._on_wheel)
+
+    def set_rows(self, rows, message=""):
+        self.rows = rows
+        for card in self.pool:
+            card.index = None
+        self.canvas.itemconfigure(self.message, text=message)
+        self.canvas.configure(scrollregion=(0, 0, CARD_WIDTH, len(rows) * CARD_HEIGHT))
+        self.canvas.yview_moveto(0)
+        self.render()
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.render()
+
+    def _on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.yview("scroll", -1, "units")
+        elif event.num == 5 or event.delta < 0:
+            self.yview("scroll", 1, "units")
+
+    def render(self):
+        first, last = visible_range(self.canvas.canvasy(0), max(1, self.canvas.winfo_height()),
+                                    CARD_HEIGHT, len(self.rows))
+        while len(self.pool) < last - first:
+            self.pool.append(ResultCard(self.canvas, self.colors, self.fonts))
+        for offset, card in enumerate(self.pool):
+            index = first + offset
+            if index >= last:
+                self.canvas.itemconfigure(card.window, state="hidden")
+                continue
+            if card.index != index:
+                card.show(self.rows[index])
+                card.index = index
+            self.canvas.coords(card.window, 0, index * CARD_HEIGHT)
+            self.canvas.itemconfigure(card.window, state="normal")
+
+
 class DjezzySearchApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -125,20 +391,25 @@ class DjezzySearchApp(tk.Tk):
         }
 
         # --- Load AI ---
-        self.engine = DjezzySearchAI()
         self.model_loaded = False
         
         # SYNCED FILENAME
         model_filename = "djezzy_ai_brain5.pkl"
         
-        if os.path.exists(model_filename):
-            if self.engine.load_model(model_filename):
-                self.model_loaded = True
-                print(f"Loaded {model_filename} successfully.")
-            else:
-                messagebox.showerror("Error", f"Failed to load '{model_filename}'.")
-        else:
+        self.engine = load_engine(model_filename)
+        if self.engine:
+            self.model_loaded = True
+            print(f"Loaded {model_filename} successfully ({type(self.engine).__name__}).")
+        elif self.engine is None:
             messagebox.showwarning("Warning", f"File '{model_filename}' not found! Please run the training script first.")
+        else:
+            messagebox.showerror("Error", f"Failed to load '{model_filename}'.")
+        self.worker = None
+        self._pending = None  # Generation of the search the UI is waiting for
+        self._typing_timer = None
+        if self.model_loaded:
+            self.worker = SearchWorker(self.engine)
+            self.worker.start()
 
         # --- Build Layout ---
         self.create_header()
@@ -178,6 +449,7 @@ class DjezzySearchApp(tk.Tk):
                               bd=0, bg="white")
         self.entry.pack(fill="x", padx=15, pady=12)
         self.entry.focus()
+        self.search_var.trace_add("write", self.on_type)
 
         # Buttons
         btn_frame = tk.Frame(frame, bg=self.COLORS["bg"])
@@ -220,18 +492,7 @@ class DjezzySearchApp(tk.Tk):
     def create_results_area(self):
         container = tk.Frame(self, bg=self.COLORS["bg"])
         container.pack(fill="both", expand=True, padx=15, pady=5)
-
-        self.canvas = tk.Canvas(container, bg=self.COLORS["bg"], highlightthickness=0)
-        self.scrollbar = ttk.Scrollbar(container, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = tk.Frame(self.canvas, bg=self.COLORS["bg"])
-
-        self.scrollable_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-        
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw", width=550)
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
+        self.results = VirtualResultList(container, self.COLORS, self.FONTS)
 
     def create_footer(self):
         footer = tk.Frame(self, bg="#DFE6E9", height=35)
@@ -250,8 +511,11 @@ class DjezzySearchApp(tk.Tk):
 
     def reset_app(self):
         self.search_var.set("")
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
+        self._cancel_typing()
+        if self.worker is not None:
+            self.worker.cancel()
+        self._pending = None
+        self.results.set_rows([])
         self.status_lbl.config(text="System Ready")
         self.entry.focus()
 
@@ -263,71 +527,188 @@ class DjezzySearchApp(tk.Tk):
         query = self.search_var.get()
         if not query.strip(): return
 
-        # Clear previous results
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
+        # Perform AI Search (off the Tk thread; a newer search makes this one stale)
+        self._cancel_typing()
+        self._submit(query, SEARCH_TOP_K)
+        self.status_lbl.config(text=f"Searching '{query}'...")
 
-        # Perform AI Search
-        results = self.engine.search(query, top_k=20)
-        
-        # Filter by relevance
-        # > 0.35 is the "Golden Threshold" we found in training
-        relevant = results[results['ai_score'] > 0.35]
-
-        if relevant.empty:
-            lbl = tk.Label(self.scrollable_frame, text=f"No hardware found for '{query}'", 
-                           bg=self.COLORS["bg"], fg="#b2bec3", font=("Segoe UI", 11), justify="center")
-            lbl.pack(pady=50)
+    def on_type(self, *_):
+        """Restarts the debounce timer on every edit; the results follow once typing pauses."""
+        if not self.model_loaded:
+            return
+        self._cancel_typing()
+        self._typing_timer = self.after(TYPE_DEBOUNCE_MS, self._search_as_typed)
+
+    def _search_as_typed(self):
+        self._typing_timer = None
+        query = self.search_var.get()
+        if len(query.strip()) >= MIN_TYPED_CHARS:
+            self._submit(query, SUGGEST_TOP_K, typing=True)
+
+    def _cancel_typing(self):
+        if self._typing_timer is not None:
+            self.after_cancel(self._typing_timer)
+            self._typing_timer = None
+
+    def _submit(self, query, top_k, typing=False):
+        waiting = self._pending is not None
+        self._pending = self.worker.submit(query, top_k, typing)
+        if not waiting:
+            self.after(POLL_MS, self._poll_results)
+
+    def _poll_results(self):
+        """Shows the newest finished search; keeps polling until the pending one is in."""
+        latest = None
+        while True:
+            try:
+                item = self.worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] == self._pending:
+                latest = item
+        if latest is not None:
+            self._pending = None
+            self.show_results(*latest[1:])
+        elif self._pending is not None:
+            self.after(POLL_MS, self._poll_results)
+
+    def show_results(self, query, relevant):
+        if isinstance(relevant, Exception):
+            self.results.set_rows([])
+            self.status_lbl.config(text=f"Search error: {relevant}")
+        elif not relevant:
+            self.results.set_rows([], message=f"No hardware found for '{query}'")
             self.status_lbl.config(text="0 results found.")
         else:
-            count = len(relevant)
-            self.status_lbl.config(text=f"Found {count} products.")
-            for _, row in relevant.iterrows():
-                self.draw_card(row)
-
-    def draw_card(self, row):
-        card = tk.Frame(self.scrollable_frame, bg="white", padx=15, pady=12)
-        card.pack(fill="x", pady=6)
-        
-        # 1. Header: Name + Price
-        header = tk.Frame(card, bg="white")
-        header.pack(fill="x")
-        
-        tk.Label(header, text=row['product_name'], font=self.FONTS["title"], 
-                 bg="white", fg=self.COLORS["dark"]).pack(side="left")
-        
-        tk.Label(header, text=f"{row['price']}", font=self.FONTS["price"], 
-                 bg="white", fg=self.COLORS["primary"]).pack(side="right")
-        
-        # 2. Category Tag
-        cat_text = row.get('category', 'Product')
-        tk.Label(card, text=f"[{cat_text}]", font=("Segoe UI", 8, "bold"), 
-                 bg="white", fg="#0984e3", anchor="w").pack(fill="x", pady=(2,0))
+            self.results.set_rows(relevant)
+            self.status_lbl.config(text=f"Found {len(relevant)} products.")
 
-        # 3. Description
-        desc = str(row['description'])
-        if len(desc) > 80: desc = desc[:80] + "..." 
-        tk.Label(card, text=desc, font=("Segoe UI", 9), bg="white", fg="#636E72", anchor="w").pack(fill="x", pady=(2, 8))
+# ==========================================
+# 3. UI RESPONSIVENESS BENCHMARK
+# ==========================================
+# python tkinter_interface5.py --bench     (needs a display)
+#
+# Stress case: a search returning BENCH_RESULTS rows (the query's real results,
+# repeated: the shipped catalog has ~140 products).
+#   show    time to get the rows on screen: one new card per result (the old
+#           draw_card) vs. the virtualized list
+#   scroll  frame time while scrolling through all of them
+#   input   longest stretch the Tk thread spends away from its event loop between
+#           Enter and the results appearing (a keystroke arriving then waits
+#           that long): search + cards on the Tk thread (old) vs. the worker
+BENCH_RESULTS = 1000
+BENCH_SCROLL_STEPS = 200
+
+
+class _StressEngine:
+    def __init__(self, engine, n_results):
+        self.engine, self.n_results = engine, n_results
+
+    def search(self, query, top_k=SEARCH_TOP_K):
+        rows = [r for r in self.engine.search(query, top_k=self.n_results) if r['ai_score'] > SCORE_THRESHOLD]
+        return [rows[i % len(rows)] for i in range(self.n_results)] if rows else []
+
+
+def _ms(values):
+    values = sorted(values)
+    return (f"p50 {values[len(values) // 2] * 1000:7.1f} ms   p95 {values[int(len(values) * 0.95)] * 1000:7.1f} ms"
+            f"   max {values[-1] * 1000:7.1f} ms")
+
+
+def _drive(app, done):
+    """Runs the event loop by hand until done(); returns how long each pass kept the Tk thread busy."""
+    busy = []
+    while not done():
+        start = time.perf_counter()
+        app.update()
+        busy.append(time.perf_counter() - start)
+    return busy
+
+
+def bench(app, query="tablette", n_results=BENCH_RESULTS, scroll_steps=BENCH_SCROLL_STEPS):
+    stress = _StressEngine(app.engine, n_results)
+    app.worker.engine = stress
+    rows = stress.search(query)
+    canvas = app.results.canvas
+    app.update()
+    print(f"[Bench] '{query}': {len(rows)} results, {CARD_HEIGHT}px cards, "
+          f"viewport {canvas.winfo_width()}x{canvas.winfo_height()}")
+
+    def one_card_per_result(rows):
+        cards = []
+        for i, row in enumerate(rows):
+            card = ResultCard(canvas, app.COLORS, app.FONTS)
+            card.show(row)
+            canvas.coords(card.window, 0, i * CARD_HEIGHT)
+            canvas.itemconfigure(card.window, state="normal")
+            cards.append(card)
+        canvas.configure(scrollregion=(0, 0, CARD_WIDTH, len(rows) * CARD_HEIGHT))
+        app.update_idletasks()
+        return cards
+
+    def discard(cards):
+        for card in cards:
+            canvas.delete(card.window)
+            card.frame.destroy()
+        app.update()
+
+    # --- show ---
+    start = time.perf_counter()
+    cards = one_card_per_result(rows)
+    old_show = time.perf_counter() - start
+    discard(cards)
+    start = time.perf_counter()
+    app.results.set_rows(rows)
+    app.update_idletasks()
+    new_show = time.perf_counter() - start
+    print(f"   show    one card per result {old_show * 1000:8.1f} ms ({len(rows) * 12} widgets)   "
+          f"virtualized {new_show * 1000:6.1f} ms ({len(app.results.pool)} cards in the pool)")
+
+    # --- scroll ---
+    frames = []
+    for step in range(1, scroll_steps + 1):
+        start = time.perf_counter()
+        app.results.yview("moveto", step / scroll_steps)
+        app.update_idletasks()
+        frames.append(time.perf_counter() - start)
+    print(f"   scroll  {scroll_steps} steps            {_ms(frames)}")
+
+    # --- input latency ---
+    app.results.set_rows([])
+    done = []
+
+    def search_on_tk_thread():
+        found = stress.search(query)
+        done.append(one_card_per_result(found))
+    app.after(0, search_on_tk_thread)
+    old_busy = _drive(app, lambda: done)
+    discard(done[0])
+
+    app.search_var.set(query)
+    app.run_search()
+    new_busy = _drive(app, lambda: app._pending is None)
+    print(f"   input   search on Tk thread  worst wait {max(old_busy) * 1000:8.1f} ms   "
+          f"worker: worst wait {max(new_busy) * 1000:6.1f} ms over {len(new_busy)} event-loop passes")
+    return {"results": len(rows), "show_old_s": old_show, "show_new_s": new_show, "scroll_frame_s": frames,
+            "input_wait_old_s": max(old_busy), "input_wait_new_s": max(new_busy)}
 
-        # 4. AI Confidence Bar
-        score = int(row['ai_score'] * 100)
-        bar_color = self.COLORS["accent"] if score > 75 else self.COLORS["medium"]
-        
-        bar_frame = tk.Frame(card, bg="white")
-        bar_frame.pack(fill="x")
-        
-        tk.Label(bar_frame, text="Match:", font=("Segoe UI", 7, "bold"), bg="white", fg="#B2BEC3").pack(side="left")
-        
-        progress_bg = tk.Frame(bar_frame, bg="#F0F2F5", height=5, width=150)
-        progress_bg.pack(side="left", padx=10)
-        progress_bg.pack_propagate(False)
-        
-        fill_width = int((score / 100) * 150)
-        progress_fill = tk.Frame(progress_bg, bg=bar_color, height=5, width=fill_width)
-        progress_fill.pack(side="left")
-        
-        tk.Label(bar_frame, text=f"{score}%", font=("Segoe UI", 8, "bold"), bg="white", fg=bar_color).pack(side="right")
 
 if __name__ == "__main__":
-    app = DjezzySearchApp()
-    app.mainloop()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="DJIBLY PoS")
+    parser.add_argument("--bench", action="store_true", help="Measure UI frame time and input latency, then exit")
+    parser.add_argument("--query", default="tablette")
+    parser.add_argument("--results", type=int, default=BENCH_RESULTS)
+    args = parser.parse_args()
+
+    try:
+        app = DjezzySearchApp()
+    except tk.TclError as e:
+        raise SystemExit(f"[ERROR] The PoS needs a display: {e}")
+    if args.bench:
+        if not app.model_loaded:
+            raise SystemExit("[ERROR] No brain loaded.")
+        bench(app, args.query, args.results)
+        app.destroy()
+    else:
+        app.mainloop()
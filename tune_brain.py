@@ -0,0 +1,366 @@
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import inspect
+import argparse
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import precision_recall_curve, average_precision_score
+from sklearn.pipeline import Pipeline
+from ai_test5 import DATASET_FILE, SYNONYMS, DjezzySearchAI, preprocess_query, build_features, build_product_db
+from compiled_scorer import CompiledScorer
+from result_cache import model_version
+from bench_serving import percentile
+
+# ==========================================
+# HYPERPARAMETER SEARCH FOR THE SEARCH BRAIN
+# ==========================================
+# Splits dataset_train5.csv by (preprocessed) query, then for every vectorizer
+# x classifier setting in the grids below measures:
+#
+#   ranking   MRR and recall@5 when each held-out query ranks the whole catalog
+#   pairs     average precision on held-out (query, product) rows, and the
+#             score threshold with the best F-beta on their PR curve
+#   cost      pickled pipeline size, non-zero weights, and per-query latency
+#             of the CompiledScorer that app.py would build from it
+#
+# Preprocessed texts and vectorized matrices are cached under --cache-dir,
+# keyed by the dataset content, the preprocessing code (preprocess_query and
+# SYNONYMS), the split and the vectorizer settings, so re-runs and new
+# classifier settings skip feature extraction. Vectorizing and fitting run on
+# a process pool; latency is measured afterwards, one config at a time.
+#
+#   python tune_brain.py --json tune.json
+#   python tune_brain.py --max-size-kib 500 --save djezzy_ai_brain5_small.pkl
+
+CACHE_DIR = ".tune_cache5"
+SERVING_THRESHOLD = 0.35  # app.SCORE_THRESHOLD default (tkinter_interface5 uses the same value)
+RANK_K = 5
+LATENCY_QUERIES = 200
+
+# The first entry of each grid is the current ai_test5 setting
+VECTORIZER_GRID = [
+    {"kind": "tfidf", "ngram_range": [1, 3], "min_df": 1},
+    {"kind": "tfidf", "ngram_range": [1, 2], "min_df": 1},
+    {"kind": "tfidf", "ngram_range": [1, 1], "min_df": 1},
+    {"kind": "tfidf", "ngram_range": [1, 3], "min_df": 2},
+    {"kind": "tfidf", "ngram_range": [1, 3], "min_df": 1, "max_features": 2000},
+    {"kind": "hash", "ngram_range": [1, 3], "n_features": 2 ** 18},
+    {"kind": "hash", "ngram_range": [1, 2], "n_features": 2 ** 14},
+]
+CLASSIFIER_GRID = [{"alpha": a, "penalty": p} for p in ("l2", "elasticnet") for a in (1e-4, 1e-5, 1e-3)]
+
+
+# ==========================================
+# 1. CONFIGS & CACHE KEYS
+# ==========================================
+def _digest(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def make_vectorizer(cfg):
+    ngram_range = tuple(cfg["ngram_range"])
+    if cfg["kind"] == "hash":
+        return HashingVectorizer(analyzer='word', ngram_range=ngram_range, n_features=cfg["n_features"],
+                                 alternate_sign=False, norm='l2')
+    return TfidfVectorizer(analyzer='word', ngram_range=ngram_range, min_df=cfg.get("min_df", 1),
+                           max_features=cfg.get("max_features"))
+
+
+def make_classifier(cfg, seed):
+    return SGDClassifier(loss='log_loss', penalty=cfg["penalty"], alpha=cfg["alpha"], random_state=seed)
+
+
+def make_pipeline(vec_cfg, clf_cfg, seed=42):
+    name = 'hash' if vec_cfg["kind"] == "hash" else 'tfidf'
+    return Pipeline([(name, make_vectorizer(vec_cfg)), ('clf', make_classifier(clf_cfg, seed))])
+
+
+def describe(vec_cfg, clf_cfg):
+    lo, hi = vec_cfg["ngram_range"]
+    if vec_cfg["kind"] == "hash":
+        vec = f"hash{lo}-{hi} 2^{int(np.log2(vec_cfg['n_features']))}"
+    else:
+        vec = f"tfidf{lo}-{hi}" + (f" df>={vec_cfg['min_df']}" if vec_cfg.get("min_df", 1) > 1 else "") + \
+              (f" max={vec_cfg['max_features']}" if vec_cfg.get("max_features") else "")
+    return f"{vec} {clf_cfg['penalty']} a={clf_cfg['alpha']:g}"
+
+
+def preprocessing_key(dataset_file, val_fraction, seed):
+    code = inspect.getsource(preprocess_query) + inspect.getsource(build_features)
+    return _digest(model_version(dataset_file), code, SYNONYMS, val_fraction, seed)
+
+
+# ==========================================
+# 2. FEATURE CACHE
+# ==========================================
+def prepare_texts(dataset_file, val_fraction, seed, cache_dir=CACHE_DIR):
+    """Train/validation texts split by query, plus the query x catalog texts used for ranking (cached)."""
+    key = preprocessing_key(dataset_file, val_fraction, seed)
+    path = os.path.join(cache_dir, f"texts-{key}.pkl")
+    if os.path.exists(path):
+        return key, path
+
+    df = pd.read_csv(dataset_file)
+    clean = df['user_query'].map(preprocess_query)
+    queries = np.array(sorted(clean.unique()))
+    np.random.RandomState(seed).shuffle(queries)
+    held_out = set(queries[:int(len(queries) * val_fraction)])
+    is_val = clean.isin(held_out).to_numpy()
+
+    products = build_product_db(df).reset_index(drop=True)
+    row_of = {pid: i for i, pid in enumerate(products['product_id'])}
+    val = df[is_val]
+    positives = val[val['relevance_label'] == 1].groupby(clean[is_val])['product_id'].agg(list)
+    rank_queries = positives.index.tolist()
+    search_texts = products['search_text'].tolist()
+
+    features = build_features(df)
+    data = {
+        "train_text": features[~is_val].tolist(), "train_y": df['relevance_label'][~is_val].to_numpy(),
+        "val_text": features[is_val].tolist(), "val_y": df['relevance_label'][is_val].to_numpy(),
+        "rank_queries": rank_queries,
+        "rank_positives": [[row_of[pid] for pid in positives[q]] for q in rank_queries],
+        "rank_text": [q + " | " + t for q in rank_queries for t in search_texts],
+        "products": products,
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(data, f)
+    os.replace(tmp, path)
+    return key, path
+
+
+def _matrix_paths(cache_dir, vkey):
+    return {part: os.path.join(cache_dir, f"X-{vkey}-{part}.npz") for part in ("train", "val", "rank")}
+
+
+def _vectorize(task):
+    """Fits one vectorizer on the training texts and caches the three matrices; returns seconds spent."""
+    cache_dir, texts_path, vkey, vec_cfg = task
+    paths = _matrix_paths(cache_dir, vkey)
+    vec_path = os.path.join(cache_dir, f"vec-{vkey}.pkl")
+    if os.path.exists(vec_path) and all(os.path.exists(p) for p in paths.values()):
+        return 0.0
+    start = time.perf_counter()
+    with open(texts_path, 'rb') as f:
+        data = pickle.load(f)
+    vec = make_vectorizer(vec_cfg)
+    matrices = {"train": vec.fit_transform(data["train_text"])}
+    matrices.update(val=vec.transform(data["val_text"]), rank=vec.transform(data["rank_text"]))
+    for part, matrix in matrices.items():
+        sparse.save_npz(paths[part], matrix.tocsr(), compressed=False)
+    with open(vec_path, 'wb') as f:  # Written last: its presence marks a complete entry
+        pickle.dump(vec, f)
+    return time.perf_counter() - start
+
+
+# ==========================================
+# 3. FIT & EVALUATE (pool workers)
+# ==========================================
+_labels = {}
+
+
+def _init_worker(texts_path):
+    with open(texts_path, 'rb') as f:
+        data = pickle.load(f)
+    _labels.update(train_y=data["train_y"], val_y=data["val_y"], rank_positives=data["rank_positives"],
+                   n_products=len(data["products"]))
+
+
+def pick_threshold(y, probs, beta=1.0):
+    """Threshold with the best F-beta on the PR curve, and the precision/recall there."""
+    precision, recall, thresholds = precision_recall_curve(y, probs)
+    precision, recall = precision[:-1], recall[:-1]  # The last point has no threshold
+    b2 = beta * beta
+    f = (1 + b2) * precision * recall / np.maximum(b2 * precision + recall, 1e-12)
+    best = int(np.argmax(f))
+    return float(thresholds[best]), float(precision[best]), float(recall[best])
+
+
+def precision_recall_at(y, probs, threshold):
+    chosen = probs > threshold  # Same comparison as the serving filter
+    tp = int((chosen & (y == 1)).sum())
+    return tp / max(int(chosen.sum()), 1), tp / max(int((y == 1).sum()), 1)
+
+
+def rank_metrics(probs, positives, k=RANK_K):
+    """MRR of the first relevant product and recall@k, over queries that have relevant products."""
+    order = np.argsort(-probs, axis=1, kind='stable')
+    rr, recall = [], []
+    for row, relevant in zip(order, positives):
+        hits = np.isin(row, relevant)
+        rr.append(1.0 / (int(np.argmax(hits)) + 1))
+        recall.append(hits[:k].sum() / min(k, len(relevant)))
+    return float(np.mean(rr)), float(np.mean(recall))
+
+
+def _evaluate(task):
+    cache_dir, vkey, vec_cfg, clf_cfg, seed, beta = task
+    paths = _matrix_paths(cache_dir, vkey)
+    start = time.perf_counter()
+    clf = make_classifier(clf_cfg, seed).fit(sparse.load_npz(paths["train"]), _labels["train_y"])
+    fit_s = time.perf_counter() - start
+
+    val_y = _labels["val_y"]
+    val_probs = clf.predict_proba(sparse.load_npz(paths["val"]))[:, 1]
+    threshold, precision, recall = pick_threshold(val_y, val_probs, beta)
+    serving_precision, serving_recall = precision_recall_at(val_y, val_probs, SERVING_THRESHOLD)
+    rank_probs = clf.predict_proba(sparse.load_npz(paths["rank"]))[:, 1].reshape(-1, _labels["n_products"])
+    mrr, recall_at_k = rank_metrics(rank_probs, _labels["rank_positives"])
+
+    with open(os.path.join(cache_dir, f"vec-{vkey}.pkl"), 'rb') as f:
+        vec = pickle.load(f)
+    pipeline = Pipeline([('vec', vec), ('clf', clf)])
+    return {
+        "config": describe(vec_cfg, clf_cfg), "vectorizer": vec_cfg, "classifier": clf_cfg,
+        "mrr": mrr, f"recall@{RANK_K}": recall_at_k, "average_precision": float(average_precision_score(val_y, val_probs)),
+        "threshold": threshold, "precision": precision, "recall": recall,
+        "serving_precision": serving_precision, "serving_recall": serving_recall,
+        "size_kib": len(pickle.dumps(pipeline, protocol=pickle.HIGHEST_PROTOCOL)) / 1024,
+        "nonzero_weights": int(np.count_nonzero(clf.coef_)), "fit_s": fit_s,
+        "clf": pickle.dumps(clf),  # Dropped once latency is measured
+    }
+
+
+# ==========================================
+# 4. LATENCY, PARETO FRONT & SELECTION
+# ==========================================
+def measure_latency(result, vec, products, queries):
+    """p50 / p95 ms of one query against the whole catalog, as app.py scores it."""
+    pipeline = Pipeline([('vec', vec), ('clf', pickle.loads(result["clf"]))])
+    try:
+        scorer = CompiledScorer.from_pipeline(pipeline, products['search_text'])
+        search = scorer.predict_proba
+    except ValueError:
+        texts = products['search_text']
+        search = lambda q: pipeline.predict_proba(q + " | " + texts)[:, 1]
+    search(queries[0])
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        search(q)
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+    return percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000
+
+
+def pareto_front(results, quality="mrr"):
+    """Indices of results no other result beats on quality, size and latency at once."""
+    front = []
+    for i, r in enumerate(results):
+        dominated = any(
+            o[quality] >= r[quality] and o["size_kib"] <= r["size_kib"] and o["p50_ms"] <= r["p50_ms"]
+            and (o[quality] > r[quality] or o["size_kib"] < r["size_kib"] or o["p50_ms"] < r["p50_ms"])
+            for o in results)
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def choose(results, quality="mrr", max_size_kib=None, max_latency_ms=None):
+    allowed = [r for r in results if (max_size_kib is None or r["size_kib"] <= max_size_kib)
+               and (max_latency_ms is None or r["p50_ms"] <= max_latency_ms)]
+    return max(allowed, key=lambda r: (r[quality], -r["size_kib"], -r["p50_ms"])) if allowed else None
+
+
+def tune(dataset_file=DATASET_FILE, vectorizers=VECTORIZER_GRID, classifiers=CLASSIFIER_GRID, workers=None,
+         val_fraction=0.2, seed=42, beta=1.0, cache_dir=CACHE_DIR):
+    workers = workers or os.cpu_count() or 1
+    texts_key, texts_path = prepare_texts(dataset_file, val_fraction, seed, cache_dir)
+    vkeys = [_digest(texts_key, cfg) for cfg in vectorizers]
+
+    start = time.perf_counter()
+    with Pool(workers, initializer=_init_worker, initargs=(texts_path,)) as pool:
+        spent = pool.map(_vectorize, [(cache_dir, texts_path, k, cfg) for k, cfg in zip(vkeys, vectorizers)])
+        results = pool.map(_evaluate, [(cache_dir, k, vcfg, ccfg, seed, beta)
+                                       for k, vcfg in zip(vkeys, vectorizers) for ccfg in classifiers])
+    search_s = time.perf_counter() - start
+
+    with open(texts_path, 'rb') as f:
+        data = pickle.load(f)
+    queries = data["rank_queries"][:LATENCY_QUERIES]
+    vec_by_cfg = {}
+    for k, cfg in zip(vkeys, vectorizers):
+        with open(os.path.join(cache_dir, f"vec-{k}.pkl"), 'rb') as f:
+            vec_by_cfg[json.dumps(cfg, sort_keys=True)] = pickle.load(f)
+    for r in results:
+        r["p50_ms"], r["p95_ms"] = measure_latency(r, vec_by_cfg[json.dumps(r["vectorizer"], sort_keys=True)],
+                                                   data["products"], queries)
+        del r["clf"]
+
+    stats = {"rows_train": len(data["train_y"]), "rows_val": len(data["val_y"]), "rank_queries": len(data["rank_queries"]),
+             "products": len(data["products"]), "workers": workers, "search_s": search_s,
+             "vectorize_s": sum(spent), "cached_vectorizers": sum(1 for s in spent if s == 0.0)}
+    return results, stats
+
+
+def save_brain(result, dataset_file, filename, seed=42):
+    """Trains the chosen setting on the whole dataset and saves it like `ai_test5.py` does."""
+    engine = DjezzySearchAI()
+    engine.pipeline = make_pipeline(result["vectorizer"], result["classifier"], seed)
+    engine.train(dataset_file)
+    engine.save_model(filename)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grid search over vectorizer/classifier settings for the search brain")
+    parser.add_argument("--dataset", default=DATASET_FILE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--val-fraction", type=float, default=0.2, help="Share of distinct queries held out")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--beta", type=float, default=1.0, help="F-beta used to pick the threshold (<1 favours precision)")
+    parser.add_argument("--quality", choices=["mrr", f"recall@{RANK_K}", "average_precision"], default="mrr")
+    parser.add_argument("--max-size-kib", type=float, help="Only choose brains up to this pickled size")
+    parser.add_argument("--max-latency-ms", type=float, help="Only choose brains up to this p50 latency")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--json", help="Write the full report to this file")
+    parser.add_argument("--save", metavar="BRAIN", help="Train the chosen setting on the whole dataset and save it here")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dataset):
+        print(f"[ERROR] Dataset '{args.dataset}' not found.")
+        sys.exit(1)
+
+    results, stats = tune(args.dataset, workers=args.workers, val_fraction=args.val_fraction,
+                          seed=args.seed, beta=args.beta, cache_dir=args.cache_dir)
+    print(f"[Tune] {len(results)} settings on {stats['rows_train']} train / {stats['rows_val']} held-out rows, "
+          f"{stats['rank_queries']} ranking queries x {stats['products']} products; {stats['workers']} workers, "
+          f"{stats['search_s']:.1f}s ({stats['cached_vectorizers']}/{len(VECTORIZER_GRID)} feature sets from cache)")
+
+    front = set(pareto_front(results, args.quality))
+    print(f"\n  {'setting':<34} {'MRR':>6} {'R@' + str(RANK_K):>6} {'AP':>6} {'thresh':>7} {'P':>5} {'R':>5}"
+          f" {'KiB':>8} {'weights':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    for i in sorted(range(len(results)), key=lambda i: -results[i][args.quality]):
+        r = results[i]
+        print(f"{'*' if i in front else ' '} {r['config']:<34} {r['mrr']:6.3f} {r[f'recall@{RANK_K}']:6.3f} "
+              f"{r['average_precision']:6.3f} {r['threshold']:7.3f} {r['precision']:5.2f} {r['recall']:5.2f} "
+              f"{r['size_kib']:8.0f} {r['nonzero_weights']:8d} {r['p50_ms']:7.2f} {r['p95_ms']:7.2f}")
+    print("  (* = Pareto front: no other setting is better on quality, size and latency at once)")
+
+    current = results[0]
+    print(f"\n[Current] {current['config']}: threshold {SERVING_THRESHOLD} gives precision "
+          f"{current['serving_precision']:.2f}, recall {current['serving_recall']:.2f}; "
+          f"PR curve suggests {current['threshold']:.3f} ({current['precision']:.2f} / {current['recall']:.2f})")
+    best = choose(results, args.quality, args.max_size_kib, args.max_latency_ms)
+    if best is None:
+        print("[ERROR] No setting fits the size/latency limits.")
+        sys.exit(1)
+    print(f"[Chosen]  {best['config']}: {args.quality} {best[args.quality]:.3f}, {best['size_kib']:.0f} KiB, "
+          f"p50 {best['p50_ms']:.2f} ms -> serve with DJIBLY_SCORE_THRESHOLD={best['threshold']:.3f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"stats": stats, "pareto_front": sorted(front), "chosen": best["config"], "results": results},
+                      f, indent=2)
+        print(f"[SUCCESS] Report written to '{args.json}'")
+    if args.save:
+        save_brain(best, args.dataset, args.save, args.seed)
@@ -0,0 +1,327 @@
+import re
+import json
+import threading
+from collections import OrderedDict
+from autocomplete import deletes
+
+# ==========================================
+# QUERY TYPO CORRECTION (before preprocess_query)
+# ==========================================
+# The model only knows the misspellings createdata5.mess_up_text happened to
+# produce in training; an unseen one ("tabltte", "wfii") shares few n-grams
+# with anything and scores poorly. Each query word that is not a dictionary
+# word is therefore replaced by the closest one first. The dictionary is every
+# word of the catalog's search_text plus the SYNONYMS keys and values
+# ("wfii" -> "wifi", which preprocess_query then expands to "wifi modem").
+#
+# Lookups use a symmetric-delete dictionary: every string made by deleting up
+# to MAX_DISTANCE letters of a dictionary word, mapped to the words it came
+# from. Two words within that many edits share such a deletion, so a query
+# word only needs its own deletions looked up (a few dict hits, whatever the
+# dictionary size); the candidates are then checked with the real (optimal
+# string alignment) distance. The closest wins, then one keeping the first
+# letter (rarely the mistyped one), then the most frequent. mess_up_text makes
+# a single delete, swap or duplicate, so one edit is all that is corrected:
+# two would turn real words nobody misspelled into catalog ones ("blanc" ->
+# "bank", "promo" -> "pro"). Words shorter than MIN_WORD_LEN are left alone,
+# and model numbers may drop, double or swap a character but never change
+# one: "ccdl003" -> "ccld003", yet "a45" does not become "a35".
+#
+# Never corrected either:
+# - a word the brain knows: the vectorizer's single words (typos seen in
+#   training included) are added to the known words at load time;
+# - a word joined by punctuation ("d-link", "type-c"): stripped, it becomes
+#   "dlink", unknown only because the hyphen went.
+#
+# Off unless DJIBLY_TYPO_CORRECTION=1 (app.py, tkinter_interface5.py): it
+# changes which products a query returns.
+#
+# Built at training time and shipped in the brain like the autocomplete index
+# ('typo_correction' in the pickle, typos.json in an mmap brain, an array of
+# the lite export); brains without it get one built at load time.
+#
+#   python typo_correction.py      (accuracy and added latency on createdata5-style typo queries)
+
+TYPO_FORMAT = 2
+MAX_DISTANCE = 1
+SHORT_WORD_LEN = 5      # Words shorter than this get at most one edit ("cher" is not "car")
+MIN_WORD_LEN = 3        # mess_up_text never touches shorter words either
+CACHE_SIZE = 8192
+WORD_RE = re.compile(r"[^\W_]+")  # Splits "Accessoire_Audio" into words
+JOINED_RE = re.compile(r"\w[^\w\s]+\w")  # "d-link", "usb-c", "2.0": punctuation inside the word
+
+
+def deletes_within(word, distance):
+    """word and every string made by deleting up to `distance` of its letters."""
+    found, frontier = {word}, {word}
+    for _ in range(distance):
+        frontier = {d for w in frontier for d in deletes(w)} - found
+        found |= frontier
+    return found
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (a swap of neighbours is one edit), or limit + 1 if above limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def correctable(word):
+    return len(word) >= MIN_WORD_LEN
+
+
+def _is_model_number(word):
+    return any(c.isdigit() for c in word)
+
+
+def vocabulary_words(vocabulary):
+    """The single words of a word n-gram vocabulary (none for a hashed one)."""
+    if vocabulary is None or getattr(vocabulary, "hashed", False):
+        return set()
+    return {term for term, _ in vocabulary.items() if " " not in term}
+
+
+def dictionary_words(product_db, synonyms):
+    """{word: products containing it} over the catalog's search_text, plus the synonyms."""
+    counts = {}
+    for text in product_db['search_text'].tolist():
+        for word in set(WORD_RE.findall(str(text).lower())):
+            counts[word] = counts.get(word, 0) + 1
+    for key, value in (synonyms or {}).items():
+        for word in WORD_RE.findall(f"{key} {value}".lower()):
+            counts[word] = max(counts.get(word, 0), 1)
+    return counts
+
+
+class TypoCorrector:
+    def __init__(self, words, counts, index, max_distance=MAX_DISTANCE, cache_size=CACHE_SIZE):
+        self.words = words
+        self.counts = counts
+        self.index = index              # deletion -> ids of the words it can come from
+        self.max_distance = max_distance
+        self.known = set(words)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, product_db, synonyms=None, max_distance=MAX_DISTANCE):
+        return cls.from_counts(dictionary_words(product_db, synonyms), max_distance)
+
+    @classmethod
+    def from_counts(cls, counts, max_distance=MAX_DISTANCE):
+        words = sorted(counts)
+        index = {}
+        for i, word in enumerate(words):
+            if correctable(word):
+                for d in deletes_within(word, max_distance):
+                    index.setdefault(d, []).append(i)
+        return cls(words, [counts[w] for w in words], index, max_distance)
+
+    def state(self):
+        """Plain lists and dicts (JSON-safe) for the brain artifact."""
+        return {"format": TYPO_FORMAT, "max_distance": self.max_distance, "words": self.words,
+                "counts": self.counts, "index": self.index}
+
+    @classmethod
+    def from_state(cls, state):
+        if state.get("format") != TYPO_FORMAT:
+            raise ValueError("Typo dictionary saved by an incompatible version.")
+        return cls(state["words"], state["counts"], state["index"], state["max_distance"])
+
+    def __len__(self):
+        return len(self.words)
+
+    def add_known(self, words):
+        """Words to leave as typed although they are not dictionary words (the brain's vocabulary)."""
+        with self._lock:
+            self.known.update(words)
+            self._cache.clear()
+
+    def correct_word(self, word):
+        """The closest dictionary word, or word itself when it is known, exempt or too far from everything."""
+        if word in self.known or not correctable(word):
+            return word
+        with self._lock:
+            cached = self._cache.get(word)
+            if cached is not None:
+                self._cache.move_to_end(word)
+                return cached
+        model_number = _is_model_number(word)
+        limit = 1 if model_number or len(word) < SHORT_WORD_LEN else self.max_distance
+        best, best_key = word, None
+        seen = set()
+        for d in deletes_within(word, limit):
+            for i in self.index.get(d, ()):
+                if i in seen:
+                    continue
+                seen.add(i)
+                candidate = self.words[i]
+                if model_number and len(candidate) == len(word) and sorted(candidate) != sorted(word):
+                    continue  # Same length, one edit and not a swap: a changed character
+                distance = edit_distance(word, candidate, limit)
+                key = (distance, candidate[0] != word[0], -self.counts[i], candidate)
+                if distance <= limit and (best_key is None or key < best_key):
+                    best, best_key = candidate, key
+        with self._lock:
+            self._cache[word] = best
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return best
+
+    def correct(self, query):
+        """The query with its misspelled words replaced (cleaned like preprocess_query does)."""
+        words = []
+        for token in str(query).lower().split():
+            word = re.sub(r'[^\w\s]', '', token)
+            if word:
+                words.append(word if JOINED_RE.search(token) else self.correct_word(word))
+        return " ".join(words)
+
+
+def load_typo_corrector(state, product_db, synonyms, vocabulary=None):
+    """The brain's precomputed dictionary, or one built from its catalog when it has none (older brains).
+
+    vocabulary is the brain's term -> column mapping; its single words are never corrected.
+    """
+    corrector = None
+    if state is not None:
+        try:
+            corrector = TypoCorrector.from_state(state)
+        except ValueError as e:
+            print(f"{e} Rebuilding it from the catalog.")
+    if corrector is None:
+        corrector = TypoCorrector.build(product_db, synonyms)
+    corrector.add_known(vocabulary_words(vocabulary))
+    return corrector
+
+
+# ==========================================
+# EVALUATION
+# ==========================================
+def typo_queries(n, seed=11):
+    """(clean keyword, query as typed) pairs drawn like createdata5's training queries, with another seed."""
+    import random
+    import createdata5
+    with open(createdata5.INPUT_FILE, 'r', encoding='utf-8') as f:
+        products = createdata5.load_products(json.load(f))
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(n):
+        base = rng.choice(sorted(createdata5.extract_core_keywords(rng.choice(products))))
+        pairs.append((base, createdata5.mess_up_text(base, rng)))
+    return pairs
+
+
+def evaluate(corrector, scorer, preprocess, pairs, vocabulary=None, k=5):
+    """Correction accuracy, effect on the top-k results, and added latency.
+
+    A typo query is "restored" when its correction equals the clean keyword,
+    and its results are compared with the clean keyword's top-k (overlap@k),
+    with and without correction. "unseen" queries have a word that is
+    neither a dictionary word nor in the brain's vocabulary.
+    """
+    import time
+    import numpy as np
+
+    def top(query):
+        return set(np.argsort(-scorer.predict_proba(preprocess(query)), kind='stable')[:k].tolist())
+
+    clean_norm = [" ".join(re.sub(r'[^\w\s]', '', c.lower()).split()) for c, _ in pairs]
+    stats = {"typo": [0, 0, 0, 0.0, 0.0], "unseen": [0, 0, 0, 0.0, 0.0], "clean": [0, 0, 0, 0.0, 0.0]}
+    for (clean, typed), target in zip(pairs, clean_norm):
+        typed_norm = " ".join(re.sub(r'[^\w\s]', '', typed.lower()).split())
+        corrected = corrector.correct(typed)
+        reference = top(clean)
+        before = len(top(typed) & reference) / k
+        after = len(top(corrected) & reference) / k
+        if typed_norm == target:
+            groups = ["clean"]
+        else:
+            groups = ["typo"]
+            if vocabulary is not None and any(w not in corrector.known and w not in vocabulary
+                                              for w in typed_norm.split()):
+                groups.append("unseen")
+        for g in groups:
+            s = stats[g]
+            s[0] += 1
+            s[1] += corrected == target          # Restored (clean: left as typed)
+            s[2] += corrected not in (target, typed_norm)  # Changed into something else
+            s[3] += before
+            s[4] += after
+
+    queries = [typed for _, typed in pairs]
+    corrector._cache.clear()
+    start = time.perf_counter()
+    for q in queries:
+        corrector.correct(q)
+    cold = (time.perf_counter() - start) / len(queries)
+    start = time.perf_counter()
+    for q in queries:
+        corrector.correct(q)
+    warm = (time.perf_counter() - start) / len(queries)
+    start = time.perf_counter()
+    for q in queries:
+        preprocess(q)
+    base = (time.perf_counter() - start) / len(queries)
+
+    report = {g: {"queries": s[0], "restored": s[1] / max(s[0], 1), "miscorrected": s[2] / max(s[0], 1),
+                  f"overlap@{k}_before": s[3] / max(s[0], 1), f"overlap@{k}_after": s[4] / max(s[0], 1)}
+              for g, s in stats.items()}
+    report["latency_us"] = {"correct_cold": cold * 1e6, "correct_cached": warm * 1e6, "preprocess": base * 1e6}
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import pickle
+    import argparse
+    from ai_test5 import MODEL_FILE, SYNONYMS, preprocess_query
+    from brain_delta import load_package
+    from compiled_scorer import CompiledScorer
+    parser = argparse.ArgumentParser(description="Evaluate query typo correction on createdata5-style queries")
+    parser.add_argument("--model", default=MODEL_FILE)
+    parser.add_argument("--queries", type=int, default=3000)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        package = load_package(args.model)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    product_db = package['database']
+    start = time.perf_counter()
+    corrector = TypoCorrector.build(product_db, SYNONYMS)
+    build_ms = (time.perf_counter() - start) * 1000
+    scorer = CompiledScorer.from_pipeline(package['pipeline'], product_db['search_text'])
+    vocabulary = getattr(package['pipeline'].steps[0][1], "vocabulary_", None)
+    corrector.add_known(vocabulary_words(vocabulary))  # As the app does
+    report = evaluate(corrector, scorer, preprocess_query, typo_queries(args.queries), vocabulary)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    print(f"[Typos] {len(corrector)} dictionary words, {len(corrector.index)} deletions, built in {build_ms:.0f} ms, "
+          f"{len(pickle.dumps(corrector.state())) / 1024:.0f} KB pickled")
+    for group, label in [("typo", "typo'd queries"), ("unseen", "  of which unseen by the brain"),
+                         ("clean", "queries typed correctly")]:
+        r = report[group]
+        print(f"   {label:32} {r['queries']:5}   restored {r['restored']:6.1%}   miscorrected {r['miscorrected']:6.1%}"
+              f"   overlap@5 with the clean query {r['overlap@5_before']:.3f} -> {r['overlap@5_after']:.3f}")
+    lat = report["latency_us"]
+    print(f"   added latency per query: {lat['correct_cold']:.1f} us uncached, {lat['correct_cached']:.1f} us cached "
+          f"(preprocess_query: {lat['preprocess']:.1f} us)")